@@ -77,6 +77,25 @@ def run_migrations_online():
 
         with context.begin_transaction():
             context.run_migrations()
+            create_audit_event_partitions(connection)
+
+
+def create_audit_event_partitions(connection):
+    """Make sure the coming months' audit_events partitions exist.
+
+    Postgres 10 has no default partition, so audited changes fail once the
+    pre-created partitions run out. Every deploy migrates, so this keeps them
+    ahead even if the maintain_audit_partitions job has stopped running.
+    """
+    if connection.execute(
+        "SELECT to_regprocedure('create_audit_events_partition(timestamptz)')"
+    ).scalar():
+        connection.execute(
+            "SELECT create_audit_events_partition("
+            "now() + make_interval(months => months_ahead)"
+            ") FROM generate_series(0, 3) AS months_ahead"
+        )
+
 
 if context.is_offline_mode():
     run_migrations_offline()
@@ -0,0 +1,132 @@
+"""partition audit events by month
+
+Revision ID: b6ff2bf4b1c3
+Revises: 4a3122ffe898
+Create Date: 2020-01-09 14:21:05.513308
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "b6ff2bf4b1c3"  # pragma: allowlist secret
+down_revision = "4a3122ffe898"  # pragma: allowlist secret
+branch_labels = None
+depends_on = None
+
+
+# Postgres 10 does not allow keys or indexes on a partitioned table, so each
+# partition gets its own primary key, foreign keys and indexes. Partition
+# bounds are UTC month boundaries.
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_audit_events_partition(month timestamptz)
+RETURNS text AS $$
+DECLARE
+    start_time timestamptz := date_trunc('month', month AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    end_time timestamptz := (date_trunc('month', month AT TIME ZONE 'UTC') + interval '1 month') AT TIME ZONE 'UTC';
+    partition_name text := 'audit_events_' || to_char(month AT TIME ZONE 'UTC', 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF audit_events FOR VALUES FROM (%L) TO (%L)',
+        partition_name, start_time, end_time
+    );
+    EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id)', partition_name);
+    EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (user_id) REFERENCES users (id)', partition_name);
+    EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (portfolio_id) REFERENCES portfolios (id)', partition_name);
+    EXECUTE format('ALTER TABLE %I ADD FOREIGN KEY (application_id) REFERENCES applications (id)', partition_name);
+    EXECUTE format('CREATE INDEX ON %I (time_created, id)', partition_name);
+    EXECUTE format('CREATE INDEX ON %I (portfolio_id, time_created, id)', partition_name);
+    EXECUTE format('CREATE INDEX ON %I (application_id, time_created, id)', partition_name);
+    EXECUTE format('CREATE INDEX ON %I (resource_id)', partition_name);
+    EXECUTE format('CREATE INDEX ON %I (user_id)', partition_name);
+
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+COLUMNS = "time_created, time_updated, id, user_id, portfolio_id, application_id, changed_state, event_details, resource_type, resource_id, display_name, action"
+
+
+def upgrade():
+    op.rename_table("audit_events", "audit_events_unpartitioned")
+    op.create_table("audit_events",
+    sa.Column("time_created", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+    sa.Column("time_updated", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+    sa.Column("id", postgresql.UUID(as_uuid=True), server_default=sa.text("uuid_generate_v4()"), nullable=False),
+    sa.Column("user_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("portfolio_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("application_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("changed_state", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column("event_details", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column("resource_type", sa.String(), nullable=False),
+    sa.Column("resource_id", postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column("display_name", sa.String(), nullable=True),
+    sa.Column("action", sa.String(), nullable=False),
+    postgresql_partition_by="RANGE (time_created)",
+    )
+    op.execute(CREATE_PARTITION_FUNCTION)
+
+    # one partition for every month that has events, through three months
+    # from now so that the partition maintenance job has plenty of slack
+    op.execute(
+        """
+        SELECT create_audit_events_partition(month)
+        FROM generate_series(
+            date_trunc('month', LEAST(
+                (SELECT min(time_created) FROM audit_events_unpartitioned), now()
+            ) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            now() + interval '3 months',
+            interval '1 month'
+        ) AS month
+        """
+    )
+    op.execute(
+        "INSERT INTO audit_events ({columns}) SELECT {columns} FROM audit_events_unpartitioned".format(
+            columns=COLUMNS
+        )
+    )
+    op.drop_table("audit_events_unpartitioned")
+
+
+def downgrade():
+    op.rename_table("audit_events", "audit_events_partitioned")
+    op.create_table("audit_events",
+    sa.Column("time_created", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+    sa.Column("time_updated", sa.TIMESTAMP(timezone=True), server_default=sa.text("now()"), nullable=False),
+    sa.Column("id", postgresql.UUID(as_uuid=True), server_default=sa.text("uuid_generate_v4()"), nullable=False),
+    sa.Column("user_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("portfolio_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("application_id", postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column("changed_state", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column("event_details", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column("resource_type", sa.String(), nullable=False),
+    sa.Column("resource_id", postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column("display_name", sa.String(), nullable=True),
+    sa.Column("action", sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(["application_id"], ["applications.id"], ),
+    sa.ForeignKeyConstraint(["portfolio_id"], ["portfolios.id"], ),
+    sa.ForeignKeyConstraint(["user_id"], ["users.id"], ),
+    sa.PrimaryKeyConstraint("id")
+    )
+    op.execute(
+        "INSERT INTO audit_events ({columns}) SELECT {columns} FROM audit_events_partitioned".format(
+            columns=COLUMNS
+        )
+    )
+    # dropping the partitioned table drops its partitions
+    op.drop_table("audit_events_partitioned")
+    op.execute("DROP FUNCTION create_audit_events_partition(timestamptz)")
+
+    op.create_index("ix_audit_events_application_id", "audit_events", ["application_id"], unique=False)
+    op.create_index("ix_audit_events_portfolio_id", "audit_events", ["portfolio_id"], unique=False)
+    op.create_index("ix_audit_events_resource_id", "audit_events", ["resource_id"], unique=False)
+    op.create_index("ix_audit_events_user_id", "audit_events", ["user_id"], unique=False)
+    op.create_index("ix_audit_events_time_created_id", "audit_events", ["time_created", "id"], unique=False)
+    op.create_index("ix_audit_events_portfolio_id_time_created_id", "audit_events", ["portfolio_id", "time_created", "id"], unique=False)
+    op.create_index("ix_audit_events_application_id_time_created_id", "audit_events", ["application_id", "time_created", "id"], unique=False)
@@ -0,0 +1,57 @@
+"""add environment provisioning stage
+
+Revision ID: c8a1f2d3e4b5
+Revises: b6ff2bf4b1c3
+Create Date: 2020-01-13 10:42:19.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "c8a1f2d3e4b5"  # pragma: allowlist secret
+down_revision = "b6ff2bf4b1c3"  # pragma: allowlist secret
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "environments",
+        sa.Column(
+            "provisioning_stage",
+            sa.Enum(
+                "CREATE_ENVIRONMENT",
+                "CREATE_ATAT_ADMIN_USER",
+                "COMPLETED",
+                name="provisioningstage",
+                native_enum=False,
+            ),
+            nullable=True,
+        ),
+    )
+    op.add_column(
+        "environments",
+        sa.Column(
+            "provisioning_checkpoints",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+        ),
+    )
+    # existing environments resume from the first stage they have not finished
+    op.execute(
+        """
+        UPDATE environments SET provisioning_stage = CASE
+            WHEN cloud_id IS NULL THEN 'CREATE_ENVIRONMENT'
+            WHEN root_user_info IS NULL THEN 'CREATE_ATAT_ADMIN_USER'
+            ELSE 'COMPLETED'
+        END
+        """
+    )
+    op.alter_column("environments", "provisioning_stage", nullable=False)
+
+
+def downgrade():
+    op.drop_column("environments", "provisioning_checkpoints")
+    op.drop_column("environments", "provisioning_stage")
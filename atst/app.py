@@ -1,3 +1,4 @@
+import atexit
 import os
 import re
 from configparser import ConfigParser
@@ -20,16 +21,18 @@ from atst.routes.dev import bp as dev_routes
 from atst.routes.users import bp as user_routes
 from atst.routes.errors import make_error_pages
 from atst.routes.ccpo import bp as ccpo_routes
-from atst.domain.authnid.crl import CRLCache, NoOpCRLCache
+from atst.domain.authnid.crl import CRLCache, IndexedCRLCache, NoOpCRLCache
 from atst.domain.auth import apply_authentication
 from atst.domain.authz import Authorization
 from atst.domain.csp import make_csp_provider
-from atst.domain.portfolios import Portfolios
+from atst.domain.portfolios.navigation import LazyPortfolioList, PortfolioNavigation
 from atst.models.permissions import Permissions
 from atst.queue import celery, update_celery
 from atst.utils import mailer
 from atst.utils.form_cache import FormCache
+from atst.utils.fragment_cache import FragmentCache, FragmentCacheExtension
 from atst.utils.json import CustomJSONEncoder, sqlalchemy_dumps
+from atst.utils.localization import translations_table
 from atst.utils.notification_sender import NotificationSender
 from atst.utils.session_limiter import SessionLimiter
 
@@ -37,6 +40,11 @@ from logging.config import dictConfig
 from atst.utils.logging import JsonFormatter, RequestContextFilter
 
 from atst.utils.context_processors import assign_resources
+from atst.utils.query_stats import QueryInstrumentation
+from atst.utils.audit_pipeline import AUDIT_MODE_SYNC, AuditPipeline
+from atst.utils.dispatcher import ProvisioningDispatcher
+from atst.utils.retry import CircuitBreaker
+from atst.utils.template_cache import make_template_cache
 
 
 ENV = os.getenv("FLASK_ENV", "dev")
@@ -63,12 +71,20 @@ def make_app(config):
     update_celery(celery, app)
 
     make_flask_callbacks(app)
+    make_query_instrumentation(app)
     register_filters(app)
     register_jinja_globals(app)
+    make_fragment_cache(app)
+    # load translations before uWSGI or Celery forks its workers
+    with app.app_context():
+        translations_table()
     make_csp_provider(app, config.get("CSP", "mock"))
     make_crl_validator(app)
     make_mailer(app)
     make_notification_sender(app)
+    make_audit_pipeline(app)
+    make_provisioning_dispatcher(app)
+    make_circuit_breaker(app)
 
     db.init_app(app)
     csrf.init_app(app)
@@ -88,9 +104,11 @@ def make_app(config):
         app.register_blueprint(dev_routes)
 
     app.form_cache = FormCache(app.redis)
+    app.portfolio_navigation = PortfolioNavigation(app.redis)
 
     apply_authentication(app)
     set_default_headers(app)
+    make_template_cache(app)
 
     @app.before_request
     def _set_resources():
@@ -103,6 +121,7 @@ def make_flask_callbacks(app):
     @app.before_request
     def _set_globals():
         g.current_user = None
+        g.permission_resolver = None
         g.dev = os.getenv("FLASK_ENV", "dev") == "dev"
         g.matchesPath = lambda href: re.search(href, request.full_path)
         g.modal = request.args.get("modal", None)
@@ -114,12 +133,14 @@ def make_flask_callbacks(app):
         if not g.current_user:
             return {}
 
-        portfolios = Portfolios.for_user(g.current_user)
+        user = g.current_user
+        portfolios = LazyPortfolioList(lambda: app.portfolio_navigation.for_user(user))
         return {"portfolios": portfolios}
 
     @app.after_request
     def _cleanup(response):
         g.current_user = None
+        g.permission_resolver = None
         g.portfolio = None
         g.application = None
         g.task_order = None
@@ -152,10 +173,51 @@ def set_default_headers(app):  # pragma: no cover
         return response
 
 
+CELERY_RESULT_MODES = ["all", "failures"]
+CELERY_RESULT_STORES = ["database", "redis"]
+
+
+def map_celery_result_config(config):
+    mode = config.get("default", "CELERY_RESULT_MODE")
+    if mode not in CELERY_RESULT_MODES:
+        raise ValueError("Unsupported CELERY_RESULT_MODE: {}".format(mode))
+
+    store = config.get("default", "CELERY_RESULT_STORE")
+    if store not in CELERY_RESULT_STORES:
+        raise ValueError("Unsupported CELERY_RESULT_STORE: {}".format(store))
+
+    retention_days = config.getint("default", "CELERY_RESULT_RETENTION_DAYS")
+
+    if store == "redis":
+        backend = config["default"]["REDIS_URI"]
+        # Redis expires the results itself
+        expires = retention_days * 24 * 60 * 60 or None
+    else:
+        # Store the celery task results in a database table (celery_taskmeta)
+        backend = "db+{}".format(config.get("default", "DATABASE_URI"))
+        # Celery's own daily cleanup would also delete the results that job
+        # failures refer to, so the prune_task_results job does it instead
+        expires = 0
+
+    return {
+        "CELERY_RESULT_BACKEND": backend,
+        "CELERY_RESULT_EXPIRES": expires,
+        "CELERY_RESULT_EXTENDED": mode == "all",
+        "CELERY_IGNORE_RESULT": mode == "failures",
+        "CELERY_STORE_ERRORS_EVEN_IF_IGNORED": True,
+        "CELERY_RESULT_RETENTION_DAYS": retention_days,
+        "CELERY_RESULT_STORE": store,
+    }
+
+
 def map_config(config):
     return {
         **config["default"],
         "USE_AUDIT_LOG": config["default"].getboolean("USE_AUDIT_LOG"),
+        "TEMPLATE_WARMUP": config.getboolean("default", "TEMPLATE_WARMUP"),
+        "AUDIT_BATCH_SIZE": config.getint("default", "AUDIT_BATCH_SIZE"),
+        "AUDIT_QUEUE_SIZE": config.getint("default", "AUDIT_QUEUE_SIZE"),
+        "AUDIT_RETENTION_MONTHS": config.getint("default", "AUDIT_RETENTION_MONTHS"),
         "ENV": config["default"]["ENVIRONMENT"],
         "BROKER_URL": config["default"]["REDIS_URI"],
         "DEBUG": config["default"].getboolean("DEBUG"),
@@ -171,21 +233,46 @@ def map_config(config):
             },
         },
         "WTF_CSRF_ENABLED": config.getboolean("default", "WTF_CSRF_ENABLED"),
+        "FRAGMENT_CACHE_TTL": config.getint("default", "FRAGMENT_CACHE_TTL"),
+        "MAIL_MAX_MESSAGES_PER_SESSION": config.getint(
+            "default", "MAIL_MAX_MESSAGES_PER_SESSION"
+        ),
+        "MAIL_POOL_SIZE": config.getint("default", "MAIL_POOL_SIZE"),
+        "NOTIFICATION_DIGEST_WINDOW": config.getint(
+            "default", "NOTIFICATION_DIGEST_WINDOW"
+        ),
         "PERMANENT_SESSION_LIFETIME": config.getint(
             "default", "PERMANENT_SESSION_LIFETIME"
         ),
+        "PROVISIONING_BATCH_SIZE": config.getint("default", "PROVISIONING_BATCH_SIZE"),
+        "PROVISIONING_BREAKER_FAILURE_THRESHOLD": config.getint(
+            "default", "PROVISIONING_BREAKER_FAILURE_THRESHOLD"
+        ),
+        "PROVISIONING_BREAKER_FAILURE_WINDOW": config.getint(
+            "default", "PROVISIONING_BREAKER_FAILURE_WINDOW"
+        ),
+        "PROVISIONING_BREAKER_RESET_TIMEOUT": config.getint(
+            "default", "PROVISIONING_BREAKER_RESET_TIMEOUT"
+        ),
+        "PROVISIONING_CHUNK_SIZE": config.getint("default", "PROVISIONING_CHUNK_SIZE"),
+        "PROVISIONING_CONCURRENCY": config.getint(
+            "default", "PROVISIONING_CONCURRENCY"
+        ),
+        "PROVISIONING_IN_FLIGHT_TIMEOUT": config.getint(
+            "default", "PROVISIONING_IN_FLIGHT_TIMEOUT"
+        ),
+        "PROVISIONING_RATE_LIMIT": config.getint("default", "PROVISIONING_RATE_LIMIT"),
         "DISABLE_CRL_CHECK": config.getboolean("default", "DISABLE_CRL_CHECK"),
         "CRL_FAIL_OPEN": config.getboolean("default", "CRL_FAIL_OPEN"),
+        "USE_CRL_INDEX": config.getboolean("default", "USE_CRL_INDEX"),
+        "CRL_RELOAD_INTERVAL": config.getint("default", "CRL_RELOAD_INTERVAL"),
         "LOG_JSON": config.getboolean("default", "LOG_JSON"),
+        "LOG_QUERY_STATS": config.getboolean("default", "LOG_QUERY_STATS"),
+        "SLOW_QUERY_THRESHOLD": config.getint("default", "SLOW_QUERY_THRESHOLD"),
         "LIMIT_CONCURRENT_SESSIONS": config.getboolean(
             "default", "LIMIT_CONCURRENT_SESSIONS"
         ),
-        # Store the celery task results in a database table (celery_taskmeta)
-        "CELERY_RESULT_BACKEND": "db+{}".format(config.get("default", "DATABASE_URI")),
-        # Do not automatically delete results (by default, Celery will do this
-        # with a Beat job once a day)
-        "CELERY_RESULT_EXPIRES": 0,
-        "CELERY_RESULT_EXTENDED": True,
+        **map_celery_result_config(config),
         "CONTRACT_START_DATE": datetime.strptime(
             config.get("default", "CONTRACT_START_DATE"), "%Y-%m-%d"
         ).date(),
@@ -272,6 +359,13 @@ def apply_config_from_environment(config, section="default"):
     return config
 
 
+def make_query_instrumentation(app):
+    if app.config.get("LOG_QUERY_STATS"):
+        QueryInstrumentation(
+            app.logger, slow_query_threshold=app.config.get("SLOW_QUERY_THRESHOLD")
+        ).init_app(app)
+
+
 def make_redis(app, config):
     r = redis.Redis.from_url(config["REDIS_URI"])
     app.redis = r
@@ -285,7 +379,49 @@ def make_crl_validator(app):
         if not os.path.isdir(crl_dir):
             os.makedirs(crl_dir, exist_ok=True)
 
-        app.crl_cache = CRLCache(app.config["CA_CHAIN"], crl_dir, logger=app.logger,)
+        crl_cache_class = (
+            IndexedCRLCache if app.config.get("USE_CRL_INDEX") else CRLCache
+        )
+        app.crl_cache = crl_cache_class(
+            app.config["CA_CHAIN"],
+            crl_dir,
+            logger=app.logger,
+            reload_interval=app.config.get("CRL_RELOAD_INTERVAL"),
+        )
+
+
+def make_audit_pipeline(app):
+    mode = app.config.get("AUDIT_LOG_MODE", AUDIT_MODE_SYNC)
+    if mode == AUDIT_MODE_SYNC:
+        app.audit_pipeline = None
+    else:
+        app.audit_pipeline = AuditPipeline(
+            app,
+            mode=mode,
+            max_queue_size=app.config.get("AUDIT_QUEUE_SIZE"),
+            batch_size=app.config.get("AUDIT_BATCH_SIZE"),
+        )
+        atexit.register(app.audit_pipeline.stop)
+
+
+def make_provisioning_dispatcher(app):
+    app.provisioning_dispatcher = ProvisioningDispatcher(
+        app.redis,
+        csp_name=app.config.get("CSP", "mock"),
+        chunk_size=app.config.get("PROVISIONING_CHUNK_SIZE"),
+        rate_limit=app.config.get("PROVISIONING_RATE_LIMIT"),
+        in_flight_seconds=app.config.get("PROVISIONING_IN_FLIGHT_TIMEOUT"),
+    )
+
+
+def make_circuit_breaker(app):
+    app.circuit_breaker = CircuitBreaker(
+        app.redis,
+        csp_name=app.config.get("CSP", "mock"),
+        failure_threshold=app.config.get("PROVISIONING_BREAKER_FAILURE_THRESHOLD"),
+        failure_window=app.config.get("PROVISIONING_BREAKER_FAILURE_WINDOW"),
+        reset_seconds=app.config.get("PROVISIONING_BREAKER_RESET_TIMEOUT"),
+    )
 
 
 def make_mailer(app):
@@ -298,13 +434,24 @@ def make_mailer(app):
             username=app.config.get("MAIL_SENDER"),
             password=app.config.get("MAIL_PASSWORD"),
             use_tls=app.config.get("MAIL_TLS"),
+            pool_size=app.config.get("MAIL_POOL_SIZE"),
+            max_messages_per_session=app.config.get("MAIL_MAX_MESSAGES_PER_SESSION"),
         )
+        atexit.register(mailer_connection.close)
     sender = app.config.get("MAIL_SENDER")
     app.mailer = mailer.Mailer(mailer_connection, sender)
 
 
 def make_notification_sender(app):
-    app.notification_sender = NotificationSender()
+    app.notification_sender = NotificationSender(
+        app.redis, digest_window=app.config.get("NOTIFICATION_DIGEST_WINDOW")
+    )
+
+
+def make_fragment_cache(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    ttl = app.config.get("FRAGMENT_CACHE_TTL")
+    app.fragment_cache = FragmentCache(app.redis, default_ttl=ttl) if ttl else None
 
 
 def make_session_limiter(app, session, config):
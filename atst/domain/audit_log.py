@@ -1,33 +1,128 @@
+import csv
+import gzip
+import io
+import json
+import os
+import re
+
+import pendulum
+from sqlalchemy import text
+
 from atst.database import db
 from atst.domain.common import Query
 from atst.models.audit_event import AuditEvent
 
 
+EXPORT_FORMATS = ["csv", "jsonl"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = [
+    "id",
+    "time_created",
+    "user_id",
+    "portfolio_id",
+    "application_id",
+    "resource_type",
+    "resource_id",
+    "display_name",
+    "action",
+    "changed_state",
+    "event_details",
+]
+
+
 class AuditEventQuery(Query):
     model = AuditEvent
 
+    # newest first; matches the composite indexes on audit_events
+    key_columns = (AuditEvent.time_created, AuditEvent.id)
+
     @classmethod
     def get_all(cls, pagination_opts):
-        query = db.session.query(cls.model).order_by(cls.model.time_created.desc())
-        return cls.paginate(query, pagination_opts)
+        query = db.session.query(cls.model)
+        return cls.paginate_by_keyset(query, cls.key_columns, pagination_opts)
 
     @classmethod
     def get_portfolio_events(cls, portfolio_id, pagination_opts):
-        query = (
-            db.session.query(cls.model)
-            .filter(cls.model.portfolio_id == portfolio_id)
-            .order_by(cls.model.time_created.desc())
+        query = db.session.query(cls.model).filter(
+            cls.model.portfolio_id == portfolio_id
         )
-        return cls.paginate(query, pagination_opts)
+        return cls.paginate_by_keyset(query, cls.key_columns, pagination_opts)
 
     @classmethod
     def get_application_events(cls, application_id, pagination_opts):
-        query = (
-            db.session.query(cls.model)
-            .filter(cls.model.application_id == application_id)
-            .order_by(cls.model.time_created.desc())
+        query = db.session.query(cls.model).filter(
+            cls.model.application_id == application_id
         )
-        return cls.paginate(query, pagination_opts)
+        return cls.paginate_by_keyset(query, cls.key_columns, pagination_opts)
+
+    @classmethod
+    def get_for_export(
+        cls,
+        portfolio_id=None,
+        application_id=None,
+        resource_type=None,
+        since=None,
+        until=None,
+    ):
+        query = db.session.query(cls.model)
+        if portfolio_id is not None:
+            query = query.filter(cls.model.portfolio_id == portfolio_id)
+        if application_id is not None:
+            query = query.filter(cls.model.application_id == application_id)
+        if resource_type is not None:
+            query = query.filter(cls.model.resource_type == resource_type)
+        if since is not None:
+            query = query.filter(cls.model.time_created >= since)
+        if until is not None:
+            query = query.filter(cls.model.time_created < until)
+
+        # yield_per streams rows from a server-side cursor in batches instead
+        # of fetching the whole result up front
+        return query.order_by(*cls.key_columns).yield_per(EXPORT_BATCH_SIZE)
+
+
+def _export_record(event):
+    record = dict(event.log)
+    record.update(
+        {
+            "id": str(event.id),
+            "time_created": event.time_created.isoformat(),
+            "user_id": str(event.user_id) if event.user_id else None,
+            "portfolio_id": str(event.portfolio_id) if event.portfolio_id else None,
+            "application_id": str(event.application_id)
+            if event.application_id
+            else None,
+        }
+    )
+    return record
+
+
+def _csv_lines(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _line(row):
+        writer.writerow(row)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield _line(EXPORT_FIELDS)
+    for record in records:
+        yield _line(
+            [
+                json.dumps(record[field])
+                if field in ["changed_state", "event_details"]
+                else record[field]
+                for field in EXPORT_FIELDS
+            ]
+        )
+
+
+def _jsonl_lines(records):
+    for record in records:
+        yield json.dumps({field: record[field] for field in EXPORT_FIELDS}) + "\n"
 
 
 class AuditLog(object):
@@ -48,6 +143,25 @@ class AuditLog(object):
     def get_application_events(cls, application, pagination_opts=None):
         return AuditEventQuery.get_application_events(application.id, pagination_opts)
 
+    @classmethod
+    def export_events(cls, export_format, **filters):
+        """
+        Returns a generator of CSV or JSON Lines text, one line per audit
+        event, oldest first. Events are read in batches so that memory use
+        does not depend on the size of the export. Keyword arguments are the
+        filters accepted by AuditEventQuery.get_for_export.
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError("Unsupported export format: {}".format(export_format))
+
+        records = (
+            _export_record(event) for event in AuditEventQuery.get_for_export(**filters)
+        )
+        if export_format == "csv":
+            return _csv_lines(records)
+        else:
+            return _jsonl_lines(records)
+
     @classmethod
     def get_by_resource(cls, resource_id):
         return (
@@ -76,3 +190,98 @@ class AuditLog(object):
             action=action,
         )
         return AuditEventQuery.add_and_commit(audit_event)
+
+
+class AuditEventPartitions(object):
+    """
+    Manages the monthly partitions of audit_events. Each partition is named
+    audit_events_YYYY_MM and holds one UTC calendar month of events.
+    Partitions are created ahead of time because Postgres 10 has no default
+    partition: an event with no partition to land in fails to insert. They
+    are created by a daily job and, in case that stops, by every migration
+    run (see alembic/env.py).
+    """
+
+    NAME_PATTERN = re.compile(r"^audit_events_(\d{4})_(\d{2})$")
+
+    @classmethod
+    def create(cls, month):
+        return db.session.execute(
+            text("SELECT create_audit_events_partition(:month)"), {"month": month}
+        ).scalar()
+
+    @classmethod
+    def create_upcoming(cls, now, months_ahead=3):
+        start = pendulum.instance(now).in_timezone("UTC").start_of("month")
+        return [cls.create(start.add(months=i)) for i in range(months_ahead + 1)]
+
+    @classmethod
+    def all(cls):
+        rows = db.session.execute(
+            """
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = 'audit_events'::regclass
+            ORDER BY child.relname
+            """
+        )
+        return [name for (name,) in rows if cls.NAME_PATTERN.match(name)]
+
+    @classmethod
+    def month_of(cls, partition):
+        year, month = cls.NAME_PATTERN.match(partition).groups()
+        return pendulum.datetime(int(year), int(month), 1, tz="UTC")
+
+    @classmethod
+    def expired(cls, now, retention_months):
+        """
+        Returns the partitions whose whole month is older than the retention
+        period, counting the current month as the first month retained.
+        """
+        cutoff = (
+            pendulum.instance(now)
+            .in_timezone("UTC")
+            .start_of("month")
+            .subtract(months=retention_months - 1)
+        )
+        return [
+            partition for partition in cls.all() if cls.month_of(partition) < cutoff
+        ]
+
+    @classmethod
+    def archive(cls, partition, directory):
+        """
+        Writes a partition to a gzipped CSV file in directory and returns its
+        path. The file only appears under its final name once it is complete.
+        """
+        path = os.path.join(directory, "{}.csv.gz".format(partition))
+        partial_path = path + ".partial"
+
+        with db.session.connection().connection.cursor() as cursor:
+            with open(partial_path, "wb") as archive:
+                with gzip.GzipFile(fileobj=archive, mode="wb") as compressed:
+                    cursor.copy_expert(
+                        'COPY "{}" TO STDOUT WITH CSV HEADER'.format(
+                            cls._checked_name(partition)
+                        ),
+                        compressed,
+                    )
+                archive.flush()
+                os.fsync(archive.fileno())
+
+        os.replace(partial_path, path)
+        return path
+
+    @classmethod
+    def drop(cls, partition):
+        name = cls._checked_name(partition)
+        db.session.execute(
+            'ALTER TABLE audit_events DETACH PARTITION "{}"'.format(name)
+        )
+        db.session.execute('DROP TABLE "{}"'.format(name))
+
+    @classmethod
+    def _checked_name(cls, partition):
+        if not cls.NAME_PATTERN.match(partition):
+            raise ValueError("Not an audit event partition: {}".format(partition))
+        return partition
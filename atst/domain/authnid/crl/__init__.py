@@ -2,12 +2,19 @@ import os
 import re
 import hashlib
 import logging
+import threading
 
 from OpenSSL import crypto, SSL
 from datetime import datetime
 from flask import current_app as app
 
-from .util import load_crl_locations_cache, serialize_crl_locations_cache, CRL_LIST
+from .index import CRLIndex, CRLIndexError, compile_crl_index, crl_index_path
+from .util import (
+    load_crl_locations_cache,
+    serialize_crl_locations_cache,
+    CRL_LIST,
+    JSON_CACHE,
+)
 
 # error codes from OpenSSL: https://github.com/openssl/openssl/blob/2c75f03b39de2fa7d006bc0f0d7c58235a54d9bb/include/openssl/x509_vfy.h#L111
 CRL_EXPIRED_ERROR_CODE = 12
@@ -29,6 +36,16 @@ class CRLInvalidException(Exception):
     pass
 
 
+def _changed_since(previous, current):
+    """
+    Returns the entries of `current` that were added or replaced after
+    `previous` was copied from it, i.e. by a request thread during a reload.
+    """
+    return {
+        key: value for key, value in current.items() if previous.get(key) is not value
+    }
+
+
 class CRLInterface:
     def __init__(self, *args, logger=None, **kwargs):
         self.logger = logger
@@ -76,17 +93,77 @@ class CRLCache(CRLInterface):
         store_class=crypto.X509Store,
         logger=None,
         crl_list=CRL_LIST,
+        reload_interval=None,
     ):
         self._crl_dir = crl_dir
         self.logger = logger
         self.store_class = store_class
         self.certificate_authorities = {}
         self.crl_list = crl_list
+        self._store_cache = {}
+        self._issuers = {}
+        self._store_lock = threading.Lock()
+        self.reload_count = 0
+        self.last_reload = None
+        self._reload_interval = reload_interval
+        self._watcher_pid = None
+        self._watched_signature = None
+        self._stop_watching = threading.Event()
         self._load_roots(root_location)
         self._build_crl_cache()
 
     def _get_store(self, cert):
-        return self._build_store(cert.get_issuer())
+        issuer = cert.get_issuer()
+        issuer_der = issuer.der()
+        crl_location = self.crl_cache.get(issuer_der)
+        signature = self._crl_file_signature(crl_location)
+
+        cached = self._cached_store(issuer_der, signature)
+        if cached:
+            return cached
+
+        with self._store_lock:
+            # another thread may have rebuilt the store while we were waiting
+            cached = self._cached_store(issuer_der, signature)
+            if cached:
+                return cached
+
+            store, next_update = self._build_store(issuer)
+            self._issuers[issuer_der] = issuer
+            self._store_cache[issuer_der] = (signature, next_update, store)
+            return store
+
+    def _cached_store(self, issuer_der, signature):
+        """
+        Returns the cached store for an issuer if the CRL file on disk has not
+        changed since the store was built and the CRL has not passed its
+        nextUpdate time.
+        """
+        cached = self._store_cache.get(issuer_der)
+        if not cached or not self._is_current(cached, signature):
+            return None
+
+        return cached[2]
+
+    def _is_current(self, cached, signature):
+        cached_signature, next_update, _store = cached
+        if signature is None or cached_signature != signature:
+            return False
+        if next_update and next_update <= datetime.utcnow():
+            return False
+
+        return True
+
+    def _crl_file_signature(self, crl_location):
+        if not crl_location:
+            return None
+
+        try:
+            stat = os.stat(crl_location)
+        except FileNotFoundError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
 
     def _load_roots(self, root_location):
         with open(root_location, "rb") as f:
@@ -98,12 +175,104 @@ class CRLCache(CRLInterface):
         return [match.group(0) for match in self._PEM_RE.finditer(root_str)]
 
     def _build_crl_cache(self):
+        self.crl_cache = self._load_crl_locations_cache()
+
+    def _load_crl_locations_cache(self):
         try:
-            self.crl_cache = load_crl_locations_cache(self._crl_dir)
+            return load_crl_locations_cache(self._crl_dir)
         except FileNotFoundError:
-            self.crl_cache = serialize_crl_locations_cache(
-                self._crl_dir, crl_list=self.crl_list
+            return serialize_crl_locations_cache(self._crl_dir, crl_list=self.crl_list)
+
+    def reload(self):
+        """
+        Rebuilds the CRL location map, and the state for every issuer that has
+        already been used, from what is currently on disk. The new state is
+        built from a copy of the current state without holding the lock, so
+        request threads keep using and building the previous state instead
+        of waiting on the rebuild. Anything they build in the meantime is
+        kept when the new state is swapped in.
+        """
+        self._swap_state(self._load_crl_locations_cache())
+        self.reload_count += 1
+        self.last_reload = datetime.utcnow()
+        self._log("Reloaded CRLs. Reload count: {}".format(self.reload_count))
+
+    def _swap_state(self, crl_cache):
+        with self._store_lock:
+            previous = dict(self._store_cache)
+
+        store_cache = {}
+        for issuer_der, cached in previous.items():
+            signature = self._crl_file_signature(crl_cache.get(issuer_der))
+            if signature is None:
+                continue
+
+            if self._is_current(cached, signature):
+                store_cache[issuer_der] = cached
+                continue
+
+            try:
+                store, next_update = self._build_store(
+                    self._issuers[issuer_der], crl_cache=crl_cache
+                )
+                store_cache[issuer_der] = (signature, next_update, store)
+            except Exception as err:
+                self._log(
+                    "Could not rebuild store during CRL reload: {}".format(err),
+                    level=logging.WARNING,
+                )
+
+        with self._store_lock:
+            store_cache.update(_changed_since(previous, self._store_cache))
+            self.crl_cache = crl_cache
+            self._store_cache = store_cache
+
+    @property
+    def reload_status(self):
+        return {"reload_count": self.reload_count, "last_reload": self.last_reload}
+
+    def _crl_dir_signature(self):
+        locations = [os.path.join(self._crl_dir, JSON_CACHE)] + sorted(
+            set(self.crl_cache.values())
+        )
+        return tuple(self._crl_file_signature(location) for location in locations)
+
+    def _ensure_watching(self):
+        """
+        Starts the reload thread for the current process. uWSGI forks workers
+        after the app is created, so the thread is started lazily from the
+        worker rather than from the constructor.
+        """
+        if not self._reload_interval or self._watcher_pid == os.getpid():
+            return
+
+        with self._store_lock:
+            if self._watcher_pid == os.getpid():
+                return
+
+            self._watcher_pid = os.getpid()
+            self._watched_signature = self._crl_dir_signature()
+            self._stop_watching.clear()
+            watcher = threading.Thread(
+                target=self._watch, name="crl-reloader", daemon=True
             )
+            watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        self._watcher_pid = None
+
+    def _watch(self):
+        while not self._stop_watching.wait(self._reload_interval):
+            if self._crl_dir_signature() == self._watched_signature:
+                continue
+
+            try:
+                self.reload()
+            except Exception as err:
+                self._log("Error reloading CRLs: {}".format(err), level=logging.ERROR)
+
+            self._watched_signature = self._crl_dir_signature()
 
     def _load_crl(self, crl_location):
         with open(crl_location, "rb") as crl_file:
@@ -115,11 +284,12 @@ class CRLCache(CRLInterface):
                     level=logging.WARNING,
                 )
 
-    def _build_store(self, issuer):
+    def _build_store(self, issuer, crl_cache=None):
+        crl_cache = self.crl_cache if crl_cache is None else crl_cache
         store = self.store_class()
         self._log("STORE ID: {}. Building store.".format(id(store)))
         store.set_flags(crypto.X509StoreFlags.CRL_CHECK)
-        crl_location = self.crl_cache.get(issuer.der())
+        crl_location = crl_cache.get(issuer.der())
         issuer_name = get_common_name(issuer)
 
         if not crl_location:
@@ -139,7 +309,7 @@ class CRLCache(CRLInterface):
         )
 
         store = self._add_certificate_chain_to_store(store, crl.get_issuer())
-        return store
+        return (store, crl.to_cryptography().next_update)
 
     # this _should_ happen just twice for the DoD PKI (intermediary, root) but
     # theoretically it can build a longer certificate chain
@@ -160,7 +330,20 @@ class CRLCache(CRLInterface):
         else:
             return self._add_certificate_chain_to_store(store, ca.get_issuer())
 
+    def _handle_expired_crl(self, parsed, message):
+        if app.config.get("CRL_FAIL_OPEN"):
+            self._log(
+                "Encountered expired CRL for certificate with CN {} and issuer CN {}, failing open.".format(
+                    parsed.get_subject().CN, parsed.get_issuer().CN
+                ),
+                level=logging.WARNING,
+            )
+            return True
+        else:
+            raise CRLInvalidException(message)
+
     def crl_check(self, cert):
+        self._ensure_watching()
         parsed = crypto.load_certificate(crypto.FILETYPE_PEM, cert)
         store = self._get_store(parsed)
         context = crypto.X509StoreContext(store, parsed)
@@ -170,18 +353,133 @@ class CRLCache(CRLInterface):
 
         except crypto.X509StoreContextError as err:
             if err.args[0][0] == CRL_EXPIRED_ERROR_CODE:
-                if app.config.get("CRL_FAIL_OPEN"):
-                    self._log(
-                        "Encountered expired CRL for certificate with CN {} and issuer CN {}, failing open.".format(
-                            parsed.get_subject().CN, parsed.get_issuer().CN
-                        ),
-                        level=logging.WARNING,
-                    )
-                    return True
-                else:
-                    raise CRLInvalidException("CRL expired. Args: {}".format(err.args))
+                return self._handle_expired_crl(
+                    parsed, "CRL expired. Args: {}".format(err.args)
+                )
             raise CRLRevocationException(
                 "Certificate revoked or errored. Error: {}. Args: {}".format(
                     type(err), err.args
                 )
             )
+
+
+class IndexedCRLCache(CRLCache):
+    """
+    Checks revocation against a compiled, memory-mapped index of each CRL's
+    revoked serials instead of loading the full CRL into an X509Store. The
+    X509Store is still used to verify the certificate chain, but it only
+    holds the CAs.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._indexes = {}
+        self._index_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def _build_store(self, issuer, crl_cache=None):
+        store = self.store_class()
+        self._log("STORE ID: {}. Building CA-only store.".format(id(store)))
+        store = self._add_certificate_chain_to_store(store, issuer)
+        return (store, None)
+
+    def _get_index(self, issuer):
+        issuer_der = issuer.der()
+        crl_location = self.crl_cache.get(issuer_der)
+        if not crl_location:
+            raise CRLInvalidException(
+                "Could not find matching CRL for issuer with Common Name {}".format(
+                    get_common_name(issuer)
+                )
+            )
+
+        index = self._indexes.get(issuer_der)
+        if index is not None and index.is_compiled_from(crl_location):
+            return index
+
+        with self._index_lock:
+            index = self._indexes.get(issuer_der)
+            if index is None or not index.is_compiled_from(crl_location):
+                index = self._load_index(issuer_der, crl_location)
+                self._indexes[issuer_der] = index
+
+            return index
+
+    def _load_index(self, issuer_der, crl_location):
+        index_location = crl_index_path(crl_location)
+        try:
+            index = CRLIndex(index_location)
+            if index.is_compiled_from(crl_location):
+                return index
+        except (FileNotFoundError, CRLIndexError):
+            pass
+
+        ca = self.certificate_authorities.get(issuer_der)
+        if ca is None:
+            raise CRLInvalidException(
+                "Could not find CA to verify CRL at location {}".format(crl_location)
+            )
+
+        self._log("Compiling CRL index for CRL at location {}".format(crl_location))
+        try:
+            compile_crl_index(
+                crl_location, ca.to_cryptography().public_key(), index_location
+            )
+        except CRLIndexError as err:
+            raise CRLInvalidException(str(err))
+
+        return CRLIndex(index_location)
+
+    def _swap_state(self, crl_cache):
+        with self._index_lock:
+            previous = dict(self._indexes)
+
+        indexes = {}
+        for issuer_der, index in previous.items():
+            crl_location = crl_cache.get(issuer_der)
+            if not crl_location or not os.path.isfile(crl_location):
+                continue
+
+            if index.is_compiled_from(crl_location):
+                indexes[issuer_der] = index
+                continue
+
+            try:
+                indexes[issuer_der] = self._load_index(issuer_der, crl_location)
+            except CRLInvalidException as err:
+                self._log(
+                    "Could not rebuild index during CRL reload: {}".format(err),
+                    level=logging.WARNING,
+                )
+
+        with self._index_lock:
+            indexes.update(_changed_since(previous, self._indexes))
+            self._indexes = indexes
+
+        super()._swap_state(crl_cache)
+
+    def crl_check(self, cert):
+        self._ensure_watching()
+        parsed = crypto.load_certificate(crypto.FILETYPE_PEM, cert)
+        index = self._get_index(parsed.get_issuer())
+        store = self._get_store(parsed)
+        context = crypto.X509StoreContext(store, parsed)
+        try:
+            context.verify_certificate()
+        except crypto.X509StoreContextError as err:
+            raise CRLRevocationException(
+                "Certificate revoked or errored. Error: {}. Args: {}".format(
+                    type(err), err.args
+                )
+            )
+
+        if index.is_expired():
+            return self._handle_expired_crl(
+                parsed, "CRL expired. nextUpdate: {}".format(index.next_update)
+            )
+
+        if index.is_revoked(parsed.get_serial_number()):
+            raise CRLRevocationException(
+                "Certificate revoked. Serial: {}".format(parsed.get_serial_number())
+            )
+
+        return True
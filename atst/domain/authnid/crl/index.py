@@ -0,0 +1,177 @@
+import calendar
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+
+INDEX_SUFFIX = ".idx"
+
+# Layout of a compiled index file:
+#   header (see _HEADER)
+#   issuer DER (issuer_length bytes)
+#   revoked serials, sorted, each serial_width bytes, big-endian
+_MAGIC = b"ATCRLIDX"
+_VERSION = 1
+_HEADER = struct.Struct(">8sHHIqqqqI")
+_NO_NEXT_UPDATE = -1
+
+
+class CRLIndexError(Exception):
+    pass
+
+
+def crl_index_path(crl_location):
+    return "{}{}".format(crl_location, INDEX_SUFFIX)
+
+
+def _timestamp(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
+def _source_signature(crl_location):
+    stat = os.stat(crl_location)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compile_crl_index(crl_location, issuer_public_key, index_location=None):
+    """
+    Parses the DER-encoded CRL at crl_location, verifies its signature with
+    the issuer's public key, and writes a sorted binary index of its revoked
+    serials. The index is written to a temporary file and swapped into place
+    so that readers never see a partial file.
+    """
+    index_location = index_location or crl_index_path(crl_location)
+    mtime_ns, size = _source_signature(crl_location)
+
+    with open(crl_location, "rb") as crl_file:
+        try:
+            crl = x509.load_der_x509_crl(crl_file.read(), default_backend())
+        except ValueError:
+            raise CRLIndexError(
+                "Could not load CRL at location {}".format(crl_location)
+            )
+
+    if not crl.is_signature_valid(issuer_public_key):
+        raise CRLIndexError(
+            "Invalid signature for CRL at location {}".format(crl_location)
+        )
+
+    serials = sorted({revoked.serial_number for revoked in crl})
+    serial_width = max([(serial.bit_length() + 7) // 8 for serial in serials] + [1])
+    issuer = crl.issuer.public_bytes(default_backend())
+    next_update = _timestamp(crl.next_update) if crl.next_update else _NO_NEXT_UPDATE
+
+    header = _HEADER.pack(
+        _MAGIC,
+        _VERSION,
+        serial_width,
+        len(serials),
+        _timestamp(crl.last_update),
+        next_update,
+        mtime_ns,
+        size,
+        len(issuer),
+    )
+
+    index_dir = os.path.dirname(os.path.abspath(index_location))
+    with tempfile.NamedTemporaryFile(dir=index_dir, delete=False) as tmp:
+        try:
+            tmp.write(header)
+            tmp.write(issuer)
+            for serial in serials:
+                tmp.write(serial.to_bytes(serial_width, "big"))
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except Exception:
+            os.remove(tmp.name)
+            raise
+
+    os.replace(tmp.name, index_location)
+    return index_location
+
+
+class CRLIndex:
+    """
+    A read-only, memory-mapped view of a compiled CRL index. Pages are shared
+    between every process that maps the same file.
+    """
+
+    def __init__(self, index_location):
+        self.location = index_location
+        with open(index_location, "rb") as index_file:
+            try:
+                self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CRLIndexError("Empty CRL index at {}".format(index_location))
+
+        if len(self._map) < _HEADER.size:
+            raise CRLIndexError("Truncated CRL index at {}".format(index_location))
+
+        (
+            magic,
+            version,
+            self._serial_width,
+            self._count,
+            this_update,
+            next_update,
+            self._source_mtime_ns,
+            self._source_size,
+            issuer_length,
+        ) = _HEADER.unpack_from(self._map, 0)
+
+        if magic != _MAGIC or version != _VERSION:
+            raise CRLIndexError("Unrecognized CRL index at {}".format(index_location))
+
+        self._offset = _HEADER.size + issuer_length
+        if len(self._map) != self._offset + self._count * self._serial_width:
+            raise CRLIndexError("Truncated CRL index at {}".format(index_location))
+
+        self.issuer = self._map[_HEADER.size : self._offset]
+        self.this_update = datetime.utcfromtimestamp(this_update)
+        self.next_update = (
+            datetime.utcfromtimestamp(next_update)
+            if next_update != _NO_NEXT_UPDATE
+            else None
+        )
+
+    @property
+    def revoked_count(self):
+        return self._count
+
+    def _serial_at(self, position):
+        start = self._offset + position * self._serial_width
+        return self._map[start : start + self._serial_width]
+
+    def is_revoked(self, serial):
+        if serial < 0 or serial.bit_length() > self._serial_width * 8:
+            return False
+
+        # fixed-width big-endian encoding sorts the same as the integers do
+        target = serial.to_bytes(self._serial_width, "big")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._serial_at(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low < self._count and self._serial_at(low) == target
+
+    def is_expired(self, now=None):
+        now = now or datetime.utcnow()
+        return self.next_update is not None and self.next_update <= now
+
+    def is_compiled_from(self, crl_location):
+        try:
+            return _source_signature(crl_location) == (
+                self._source_mtime_ns,
+                self._source_size,
+            )
+        except FileNotFoundError:
+            return False
@@ -1,6 +1,12 @@
 import json
+import logging
 import os
 import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
 
 import pendulum
 import requests
@@ -238,12 +244,54 @@ CRL_LIST = [
 
 
 JSON_CACHE = "crl_locations.json"
+SYNC_STATE = "crl_sync_state.json"
+
+CHUNK_SIZE = 256 * 1024
+MAX_WORKERS = 8
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (10, 60)
+
+SYNC_UPDATED = "updated"
+SYNC_NOT_MODIFIED = "not_modified"
+SYNC_FAILED = "failed"
+
+
+@dataclass
+class CRLSyncResult:
+    uri: str
+    issuer: str
+    path: str
+    status: str
+    bytes_written: int = 0
+    elapsed: float = 0.0
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
 
 
 def _deserialize_cache_items(cache):
     return {bytes.fromhex(der): data for (der, data) in cache.items()}
 
 
+def write_json_atomically(location, data):
+    """
+    Writes JSON to a temporary file in the same directory and renames it into
+    place, so that readers only ever see the old or the new contents.
+    """
+    directory = os.path.dirname(os.path.abspath(location))
+    with tempfile.NamedTemporaryFile(
+        "w", dir=directory, prefix=".", suffix=".tmp", delete=False
+    ) as tmp:
+        try:
+            json.dump(data, tmp)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        except Exception:
+            os.remove(tmp.name)
+            raise
+
+    os.replace(tmp.name, location)
+
+
 def load_crl_locations_cache(crl_dir):
     json_location = "{}/{}".format(crl_dir, JSON_CACHE)
     with open(json_location, "r") as json_file:
@@ -259,8 +307,7 @@ def serialize_crl_locations_cache(crl_dir, crl_list=CRL_LIST):
             crl_cache[crl_issuer] = crl_path
 
     json_location = "{}/{}".format(crl_dir, JSON_CACHE)
-    with open(json_location, "w") as json_file:
-        json.dump(crl_cache, json_file)
+    write_json_atomically(json_location, crl_cache)
 
     return {bytes.fromhex(k): v for k, v in crl_cache.items()}
 
@@ -283,74 +330,204 @@ def existing_crl_modification_time(crl):
         return False
 
 
-def write_crl(out_dir, target_dir, crl_location):
-    crl = crl_local_path(out_dir, crl_location)
-    existing = crl_local_path(target_dir, crl_location)
-    options = {"stream": True}
-    mod_time = existing_crl_modification_time(existing)
+def load_sync_state(crl_dir):
+    try:
+        with open(os.path.join(crl_dir, SYNC_STATE), "r") as state_file:
+            return json.load(state_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def conditional_headers(crl_path, validators):
+    """
+    Builds the conditional request headers for a CRL. The ETag and
+    Last-Modified values from the previous sync are preferred; the local
+    file's modification time is the fallback for files synced before we
+    recorded validators.
+    """
+    if not os.path.isfile(crl_path):
+        return {}
+
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+
+    mod_time = validators.get("last_modified") or existing_crl_modification_time(
+        crl_path
+    )
     if mod_time:
-        options["headers"] = {"If-Modified-Since": mod_time}
-
-    with requests.get(crl_location, **options) as response:
-        if response.status_code > 399:
-            raise CRLNotFoundError()
+        headers["If-Modified-Since"] = mod_time
 
-        if response.status_code == 304:
-            return (False, existing)
+    return headers
 
-        with open(crl, "wb") as crl_file:
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    crl_file.write(chunk)
 
-    return (True, existing)
+def make_session(max_workers=MAX_WORKERS):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=max_workers, pool_maxsize=max_workers
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def write_crl(session, crl_dir, crl_uri, crl_issuer, validators=None):
+    """
+    Downloads a CRL into a temporary file next to its final location and
+    renames it into place once the download has completed.
+    """
+    validators = validators or {}
+    crl_path = crl_local_path(crl_dir, crl_uri)
+    start = time.monotonic()
+    headers = conditional_headers(crl_path, validators)
+
+    with session.get(
+        crl_uri, headers=headers, stream=True, timeout=REQUEST_TIMEOUT
+    ) as response:
+        if response.status_code == 304:
+            return CRLSyncResult(
+                uri=crl_uri,
+                issuer=crl_issuer,
+                path=crl_path,
+                status=SYNC_NOT_MODIFIED,
+                elapsed=time.monotonic() - start,
+                etag=validators.get("etag"),
+                last_modified=validators.get("last_modified"),
+            )
 
+        if response.status_code > 399:
+            raise CRLNotFoundError(
+                "{} returned status {}".format(crl_uri, response.status_code)
+            )
 
-def remove_bad_crl(out_dir, crl_location):
-    crl = crl_local_path(out_dir, crl_location)
-    os.remove(crl)
+        bytes_written = 0
+        with tempfile.NamedTemporaryFile(
+            dir=crl_dir,
+            prefix=".{}.".format(os.path.basename(crl_path)),
+            suffix=".tmp",
+            delete=False,
+        ) as tmp:
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    if chunk:
+                        tmp.write(chunk)
+                        bytes_written += len(chunk)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            except Exception:
+                os.remove(tmp.name)
+                raise
+
+        os.replace(tmp.name, crl_path)
+
+        return CRLSyncResult(
+            uri=crl_uri,
+            issuer=crl_issuer,
+            path=crl_path,
+            status=SYNC_UPDATED,
+            bytes_written=bytes_written,
+            elapsed=time.monotonic() - start,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
 
 
-def log_error(logger, crl_location):
+def log_error(logger, crl_location, err=None):
     if logger:
         logger.error(
-            "Error downloading {}, removing file and continuing anyway".format(
-                crl_location
+            "Error downloading {}, keeping existing file and continuing anyway. {}".format(
+                crl_location, err or ""
             )
         )
 
 
-def refresh_crl(out_dir, target_dir, crl_uri, logger):
+def refresh_crl(session, crl_dir, crl_uri, crl_issuer, validators, logger):
     logger.info("updating CRL from {}".format(crl_uri))
+    start = time.monotonic()
     try:
-        was_updated, crl_path = write_crl(out_dir, target_dir, crl_uri)
-        if was_updated:
-            logger.info("successfully synced CRL from {}".format(crl_uri))
+        result = write_crl(session, crl_dir, crl_uri, crl_issuer, validators)
+        if result.status == SYNC_UPDATED:
+            logger.info(
+                "successfully synced CRL from {} ({} bytes in {:.2f}s)".format(
+                    crl_uri, result.bytes_written, result.elapsed
+                )
+            )
         else:
-            logger.info("no updates for CRL from {}".format(crl_uri))
+            logger.info(
+                "no updates for CRL from {} ({:.2f}s)".format(crl_uri, result.elapsed)
+            )
+
+        return result
+    except (requests.exceptions.RequestException, CRLNotFoundError, OSError) as err:
+        log_error(logger, crl_uri, err)
+        return CRLSyncResult(
+            uri=crl_uri,
+            issuer=crl_issuer,
+            path=crl_local_path(crl_dir, crl_uri),
+            status=SYNC_FAILED,
+            elapsed=time.monotonic() - start,
+            etag=validators.get("etag"),
+            last_modified=validators.get("last_modified"),
+        )
 
-        return crl_path
-    except requests.exceptions.ChunkedEncodingError:
-        log_error(logger, crl_uri)
-        remove_bad_crl(out_dir, crl_uri)
-    except CRLNotFoundError:
-        log_error(logger, crl_uri)
 
+def sync_crls(
+    crl_dir, crl_list=CRL_LIST, max_workers=MAX_WORKERS, session=None, logger=None
+):
+    """
+    Refreshes every CRL in crl_list concurrently, then atomically rewrites
+    the locations cache and the recorded ETag/Last-Modified validators.
+    A failed download leaves the previously synced file in place.
+    """
+    logger = logger or logging.getLogger(__name__)
+    session = session or make_session(max_workers)
+    state = load_sync_state(crl_dir)
+    start = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                refresh_crl,
+                session,
+                crl_dir,
+                crl_uri,
+                crl_issuer,
+                state.get(crl_uri, {}),
+                logger,
+            )
+            for crl_uri, crl_issuer in crl_list
+        ]
+        results = [future.result() for future in futures]
 
-def sync_crls(tmp_location, final_location):
     crl_cache = {}
-    for crl_uri, crl_issuer in CRL_LIST:
-        crl_path = refresh_crl(tmp_location, final_location, crl_uri, logger)
-        crl_cache[crl_issuer] = crl_path
+    new_state = {}
+    for result in results:
+        if os.path.isfile(result.path):
+            crl_cache[result.issuer] = result.path
+            new_state[result.uri] = {
+                "etag": result.etag,
+                "last_modified": result.last_modified,
+            }
+
+    write_json_atomically(os.path.join(crl_dir, SYNC_STATE), new_state)
+    write_json_atomically(os.path.join(crl_dir, JSON_CACHE), crl_cache)
+
+    logger.info(
+        "synced {} CRLs in {:.2f}s: {} updated ({} bytes), {} not modified, {} failed".format(
+            len(results),
+            time.monotonic() - start,
+            len([r for r in results if r.status == SYNC_UPDATED]),
+            sum(r.bytes_written for r in results),
+            len([r for r in results if r.status == SYNC_NOT_MODIFIED]),
+            len([r for r in results if r.status == SYNC_FAILED]),
+        )
+    )
 
-    json_location = "{}/{}".format(final_location, JSON_CACHE)
-    with open(json_location, "w") as json_file:
-        json.dump(crl_cache, json_file)
+    return results
 
 
 if __name__ == "__main__":
     import sys
-    import logging
 
     logging.basicConfig(
         level=logging.INFO, format="[%(asctime)s]:%(levelname)s: %(message)s"
@@ -358,9 +535,8 @@ if __name__ == "__main__":
     logger = logging.getLogger()
     logger.info("Updating CRLs")
     try:
-        tmp_location = sys.argv[1]
-        final_location = sys.argv[2]
-        sync_crls(tmp_location, final_location)
+        crl_dir = sys.argv[1]
+        sync_crls(crl_dir, logger=logger)
     except Exception as err:
         logger.exception("Fatal error encountered, stopping")
         sys.exit(1)
@@ -1,17 +1,169 @@
+from collections import defaultdict
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+from atst.database import db
 from atst.utils import first_or_none
-from atst.models.permissions import Permissions
+from atst.models.permissions import Permissions, permission_bit, permissions_mask
 from atst.domain.exceptions import UnauthorizedError
-from atst.models.portfolio_role import Status as PortfolioRoleStatus
-from atst.models.application_role import Status as ApplicationRoleStatus
+from atst.models.application import Application
+from atst.models.permission_set import PermissionSet
+from atst.models.portfolio_role import PortfolioRole, Status as PortfolioRoleStatus
+from atst.models.application_role import (
+    ApplicationRole,
+    Status as ApplicationRoleStatus,
+)
+from atst.models.user import User
+
+
+class PermissionResolver(object):
+    """
+    Resolves all of a user's permissions once, into permission bitmasks keyed
+    by portfolio and application ID, so that repeated checks during a request
+    are a dictionary lookup and a bitwise AND instead of scans over the
+    user's roles.
+    """
+
+    def __init__(self, user, atat_mask, portfolio_masks, application_masks):
+        self.user = user
+        self.atat_mask = atat_mask
+        self.portfolio_masks = portfolio_masks
+        self.application_masks = application_masks
+
+    @classmethod
+    def from_roles(cls, user):
+        """
+        Resolves every permission the user has from their role collections.
+        """
+        portfolio_masks = {
+            role.portfolio_id: role.permissions_mask
+            for role in user.portfolio_roles
+            if role.status is not PortfolioRoleStatus.DISABLED
+        }
+        application_masks = {
+            role.application_id: role.permissions_mask
+            for role in user.application_roles
+            if role.status is not ApplicationRoleStatus.DISABLED
+        }
+        return cls(user, user.permissions_mask, portfolio_masks, application_masks)
+
+    @classmethod
+    def for_resources(cls, user, portfolio_ids, application_ids):
+        """
+        Resolves the user's permissions for only the given portfolios and
+        applications, with one query for each kind of role, instead of
+        loading the user's role collections and their permission sets.
+        """
+        portfolio_masks = defaultdict(int)
+        if portfolio_ids:
+            rows = (
+                db.session.query(PortfolioRole.portfolio_id, PermissionSet.permissions)
+                .join(PortfolioRole.permission_sets)
+                .filter(PortfolioRole.user_id == user.id)
+                .filter(PortfolioRole.portfolio_id.in_(portfolio_ids))
+                .filter(PortfolioRole.status != PortfolioRoleStatus.DISABLED)
+            )
+            for portfolio_id, permissions in rows:
+                portfolio_masks[portfolio_id] |= permissions_mask(permissions)
+
+        application_masks = defaultdict(int)
+        if application_ids:
+            rows = (
+                db.session.query(
+                    ApplicationRole.application_id, PermissionSet.permissions
+                )
+                .join(ApplicationRole.permission_sets)
+                .filter(ApplicationRole.user_id == user.id)
+                .filter(ApplicationRole.application_id.in_(application_ids))
+                .filter(ApplicationRole.deleted == False)
+                .filter(ApplicationRole.status != ApplicationRoleStatus.DISABLED)
+            )
+            for application_id, permissions in rows:
+                application_masks[application_id] |= permissions_mask(permissions)
+
+        return cls(
+            user, user.permissions_mask, dict(portfolio_masks), dict(application_masks)
+        )
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Returns the resolver for the current request's user, building it on
+        first use. Returns None outside of a request or for any other user.
+        """
+        if (
+            user is None
+            or not has_request_context()
+            or user is not g.get("current_user")
+        ):
+            return None
+
+        resolver = g.get("permission_resolver")
+        if resolver is None or resolver.user is not user:
+            resolver = cls.from_roles(user)
+            g.permission_resolver = resolver
+
+        return resolver
+
+    def has_atat_permission(self, permission):
+        return bool(self.atat_mask & permission_bit(permission))
+
+    def has_portfolio_permission(self, portfolio_id, permission):
+        mask = self.atat_mask | self.portfolio_masks.get(portfolio_id, 0)
+        return bool(mask & permission_bit(permission))
+
+    def has_application_permission(self, portfolio_id, application_id, permission):
+        mask = (
+            self.atat_mask
+            | self.portfolio_masks.get(portfolio_id, 0)
+            | self.application_masks.get(application_id, 0)
+        )
+        return bool(mask & permission_bit(permission))
+
+    def has_resource_permission(self, resource, permission):
+        if isinstance(resource, Application):
+            return self.has_application_permission(
+                resource.portfolio_id, resource.id, permission
+            )
+        else:
+            return self.has_portfolio_permission(resource.id, permission)
+
+
+def invalidate_permission_cache():
+    """
+    Drops the current request's resolved permissions. Call this after
+    changing the current user's roles if the same request goes on to check
+    permissions.
+    """
+    if has_request_context():
+        g.pop("permission_resolver", None)
+
+
+def _invalidate_permission_cache(mapper, connection, target):
+    invalidate_permission_cache()
+
+
+for _model in [User, PortfolioRole, ApplicationRole]:
+    for _event in ["after_insert", "after_update", "after_delete"]:
+        event.listen(_model, _event, _invalidate_permission_cache)
 
 
 class Authorization(object):
     @classmethod
     def has_atat_permission(cls, user, permission):
-        return permission in user.permissions
+        resolver = PermissionResolver.for_user(user)
+        if resolver is not None:
+            return resolver.has_atat_permission(permission)
+
+        return user.has_permission(permission)
 
     @classmethod
     def has_portfolio_permission(cls, user, portfolio, permission):
+        resolver = PermissionResolver.for_user(user)
+        if resolver is not None:
+            return resolver.has_portfolio_permission(portfolio.id, permission)
+
         if Authorization.has_atat_permission(user, permission):
             return True
 
@@ -19,12 +171,18 @@ class Authorization(object):
             lambda pr: pr.portfolio == portfolio, user.portfolio_roles
         )
         if port_role and port_role.status is not PortfolioRoleStatus.DISABLED:
-            return permission in port_role.permissions
+            return port_role.has_permission(permission)
         else:
             return False
 
     @classmethod
     def has_application_permission(cls, user, application, permission):
+        resolver = PermissionResolver.for_user(user)
+        if resolver is not None:
+            return resolver.has_application_permission(
+                application.portfolio_id, application.id, permission
+            )
+
         if Authorization.has_portfolio_permission(
             user, application.portfolio, permission
         ):
@@ -34,10 +192,45 @@ class Authorization(object):
             lambda app_role: app_role.application == application, user.application_roles
         )
         if app_role and app_role.status is not ApplicationRoleStatus.DISABLED:
-            return permission in app_role.permissions
+            return app_role.has_permission(permission)
         else:
             return False
 
+    @classmethod
+    def permission_map(cls, user, permission, resources):
+        """
+        Checks one permission against many portfolios and/or applications at
+        once and returns a dictionary of resource ID to whether the user has
+        the permission. Use this for list and table views instead of checking
+        each row, which can lazy load every row's portfolio and the user's
+        roles.
+        """
+        resources = [_unscoped(resource) for resource in resources]
+        resolver = PermissionResolver.for_user(user)
+        if resolver is None:
+            portfolio_ids = {_portfolio_id(resource) for resource in resources}
+            application_ids = {
+                resource.id
+                for resource in resources
+                if isinstance(resource, Application)
+            }
+            resolver = PermissionResolver.for_resources(
+                user, portfolio_ids, application_ids
+            )
+
+        return {
+            resource.id: resolver.has_resource_permission(resource, permission)
+            for resource in resources
+        }
+
+    @classmethod
+    def filter_permitted(cls, user, permission, resources):
+        """
+        Returns the resources the user has the permission for, in order.
+        """
+        permitted = Authorization.permission_map(user, permission, resources)
+        return [resource for resource in resources if permitted[resource.id]]
+
     @classmethod
     def check_atat_permission(cls, user, permission, message):
         if not Authorization.has_atat_permission(user, permission):
@@ -60,6 +253,19 @@ class Authorization(object):
         return True
 
 
+def _unscoped(resource):
+    # ScopedResource proxies attribute access but is not an instance of the
+    # model it wraps
+    return getattr(resource, "resource", resource)
+
+
+def _portfolio_id(resource):
+    if isinstance(resource, Application):
+        return resource.portfolio_id
+    else:
+        return resource.id
+
+
 def user_can_access(user, permission, portfolio=None, application=None, message=None):
     if application:
         Authorization.check_application_permission(
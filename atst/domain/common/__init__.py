@@ -1,2 +1,2 @@
 from .query import Query
-from .query import Paginator
+from .query import KeysetPaginator
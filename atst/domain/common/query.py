@@ -1,42 +1,144 @@
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, literal, tuple_
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.exc import DataError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.sql.expression import ClauseElement, Executable
 
 from atst.domain.exceptions import NotFoundError
 from atst.database import db
 
 
-class Paginator(object):
+class KeysetPaginator(object):
     """
-    Uses the Flask-SQLAlchemy extension's pagination method to paginate
-    a query set.
+    Paginates a query by seeking past the sort key of the last row on the
+    current page instead of using OFFSET, so every page costs the same to
+    fetch no matter how deep it is and rows inserted while a user is paging
+    do not shift the pages they have not seen yet.
+
+    Rows are returned newest first by the given key columns, which must end
+    in a unique column so that the order is total. Cursors are opaque to
+    clients: they encode the key of the row to seek from and the direction.
 
-    Also acts as a proxy object so that the results of the query set can be iterated
-    over without needing to call `.items`.
+    It can be iterated over directly.
     """
 
-    def __init__(self, query_set):
-        self.query_set = query_set
+    NEXT = "next"
+    PREV = "prev"
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
 
     @classmethod
-    def get_pagination_opts(cls, request, default_page=1, default_per_page=100):
+    def get_pagination_opts(cls, request, default_per_page=100, count=False):
+        """
+        When count is set the paginator also reports the planner's estimate
+        of the total number of rows, which is cheap but approximate.
+        """
         return {
-            "page": int(request.args.get("page", default_page)),
+            "cursor": request.args.get("cursor"),
             "per_page": int(request.args.get("perPage", default_per_page)),
+            "count": count,
         }
 
     @classmethod
-    def paginate(cls, query, pagination_opts=None):
-        if pagination_opts is not None:
-            return cls(
-                query.paginate(
-                    page=pagination_opts["page"], per_page=pagination_opts["per_page"]
-                )
+    def paginate(cls, query, key_columns, pagination_opts=None):
+        if pagination_opts is None:
+            return query.order_by(*[column.desc() for column in key_columns]).all()
+
+        per_page = pagination_opts["per_page"]
+        direction, key = cls.decode_cursor(pagination_opts.get("cursor"), key_columns)
+        total = approximate_count(query) if pagination_opts.get("count") else None
+
+        page_query = query
+        if key is not None:
+            cursor_key = tuple_(
+                *[
+                    literal(value, column.type)
+                    for value, column in zip(key, key_columns)
+                ]
             )
+            # the redundant bound on the leading column lets the planner
+            # exclude partitions, which it cannot do from a row comparison
+            leading_column = key_columns[0]
+            leading_value = literal(key[0], leading_column.type)
+            if direction == cls.PREV:
+                page_query = page_query.filter(
+                    tuple_(*key_columns) > cursor_key, leading_column >= leading_value
+                )
+            else:
+                page_query = page_query.filter(
+                    tuple_(*key_columns) < cursor_key, leading_column <= leading_value
+                )
+
+        if direction == cls.PREV:
+            page_query = page_query.order_by(*[column.asc() for column in key_columns])
+        else:
+            page_query = page_query.order_by(*[column.desc() for column in key_columns])
+
+        items = page_query.limit(per_page + 1).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+
+        if direction == cls.PREV:
+            items.reverse()
+            has_next, has_prev = key is not None, has_more
         else:
-            return query.all()
+            has_next, has_prev = has_more, key is not None
+
+        next_cursor = prev_cursor = None
+        if items and has_next:
+            next_cursor = cls.encode_cursor(cls.NEXT, items[-1], key_columns)
+        if items and has_prev:
+            prev_cursor = cls.encode_cursor(cls.PREV, items[0], key_columns)
 
-    def __getattr__(self, name):
-        return getattr(self.query_set, name)
+        return cls(items, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+    @classmethod
+    def encode_cursor(cls, direction, item, key_columns):
+        key = [str(getattr(item, column.key)) for column in key_columns]
+        payload = json.dumps([direction] + key, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor, key_columns):
+        """
+        Returns the direction and key that a cursor encodes. A missing or
+        malformed cursor starts from the first page.
+        """
+        if not cursor:
+            return (cls.NEXT, None)
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            direction, *values = payload
+            if direction not in [cls.NEXT, cls.PREV] or len(values) != len(key_columns):
+                return (cls.NEXT, None)
+
+            key = [
+                _parse_key_value(value, column)
+                for value, column in zip(values, key_columns)
+            ]
+        except (ValueError, TypeError, AttributeError):
+            return (cls.NEXT, None)
+
+        return (direction, key)
 
     def __iter__(self):
         return self.items.__iter__()
@@ -45,6 +147,36 @@ class Paginator(object):
         return self.items.__len__()
 
 
+def _parse_key_value(value, column):
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    elif isinstance(column.type, PG_UUID):
+        return UUID(value)
+    else:
+        return str(value)
+
+
+class _Explain(Executable, ClauseElement):
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def approximate_count(query):
+    """
+    Returns the planner's estimate of the number of rows a query returns,
+    which comes from table statistics rather than a scan. It is only as
+    accurate as the last ANALYZE.
+    """
+    statement = query.order_by(None).statement
+    plan = db.session.execute(_Explain(statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 class Query(object):
 
     model = None
@@ -77,5 +209,5 @@ class Query(object):
         return resource
 
     @classmethod
-    def paginate(cls, query, pagination_opts):
-        return Paginator.paginate(query, pagination_opts)
+    def paginate_by_keyset(cls, query, key_columns, pagination_opts):
+        return KeysetPaginator.paginate(query, key_columns, pagination_opts)
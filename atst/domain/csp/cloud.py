@@ -142,6 +142,21 @@ class BaselineProvisionException(GeneralCSPException):
         )
 
 
+class CircuitOpenException(GeneralCSPException):
+    """Calls to this CSP endpoint are paused because it has been failing
+    """
+
+    def __init__(self, endpoint, retry_after):
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+    @property
+    def message(self):
+        return "Calls to {} are paused for {} seconds".format(
+            self.endpoint, self.retry_after
+        )
+
+
 class CloudProviderInterface:
     def root_creds(self) -> Dict:
         raise NotImplementedError()
@@ -1,3 +1,4 @@
+from sqlalchemy import func, or_
 from sqlalchemy.orm.exc import NoResultFound
 from flask import current_app as app
 
@@ -90,16 +91,32 @@ class EnvironmentRoles(object):
         )
 
     @classmethod
-    def get_environment_roles_pending_creation(cls) -> List[UUID]:
-        results = (
+    def pending_creation_query(cls):
+        return (
             db.session.query(EnvironmentRole.id)
             .join(Environment)
             .join(ApplicationRole)
             .filter(Environment.deleted == False)
+            .filter(
+                Environment.provisioning_stage
+                == Environment.ProvisioningStage.COMPLETED
+            )
             .filter(EnvironmentRole.status == EnvironmentRole.Status.PENDING)
             .filter(ApplicationRole.status == ApplicationRoleStatus.ACTIVE)
-            .all()
+            .filter(
+                or_(
+                    EnvironmentRole.claimed_until == None,
+                    EnvironmentRole.claimed_until <= func.now(),
+                )
+            )
         )
+
+    @classmethod
+    def get_environment_roles_pending_creation(cls, environment_id=None) -> List[UUID]:
+        query = cls.pending_creation_query()
+        if environment_id is not None:
+            query = query.filter(EnvironmentRole.environment_id == environment_id)
+        results = query.all()
         return [id_ for id_, in results]
 
     @classmethod
@@ -19,20 +19,19 @@ from .exceptions import NotFoundError, DisabledError
 
 class Environments(object):
     @classmethod
-    def create(cls, user, application, name):
+    def create(cls, user, application, name, commit=True):
         environment = Environment(application=application, name=name, creator=user)
         db.session.add(environment)
-        commit_or_raise_already_exists_error(message="environment")
+        if commit:
+            commit_or_raise_already_exists_error(message="environment")
         return environment
 
     @classmethod
     def create_many(cls, user, application, names):
-        environments = []
-        for name in names:
-            environment = Environments.create(user, application, name)
-            environments.append(environment)
-
-        db.session.add_all(environments)
+        environments = [
+            Environments.create(user, application, name, commit=False) for name in names
+        ]
+        commit_or_raise_already_exists_error(message="environment")
         return environments
 
     @classmethod
@@ -119,23 +118,33 @@ class Environments(object):
         )
 
     @classmethod
-    def get_environments_pending_creation(cls, now) -> List[UUID]:
+    def pending_creation_query(cls, now):
         """
-        Any environment with an active CLIN that doesn't yet have a `cloud_id`.
+        Any environment with an active CLIN that has not finished the
+        CREATE_ENVIRONMENT provisioning stage.
         """
-        results = (
-            cls.base_provision_query(now).filter(Environment.cloud_id == None).all()
+        return cls.base_provision_query(now).filter(
+            Environment.provisioning_stage
+            == Environment.ProvisioningStage.CREATE_ENVIRONMENT
         )
-        return [id_ for id_, in results]
 
     @classmethod
-    def get_environments_pending_atat_user_creation(cls, now) -> List[UUID]:
+    def pending_atat_user_creation_query(cls, now):
         """
-        Any environment with an active CLIN that has a cloud_id but no `root_user_info`.
+        Any environment with an active CLIN that is at the
+        CREATE_ATAT_ADMIN_USER provisioning stage.
         """
-        results = (
-            cls.base_provision_query(now)
-            .filter(Environment.cloud_id != None)
-            .filter(Environment.root_user_info == None)
-        ).all()
+        return cls.base_provision_query(now).filter(
+            Environment.provisioning_stage
+            == Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+        )
+
+    @classmethod
+    def get_environments_pending_creation(cls, now) -> List[UUID]:
+        results = cls.pending_creation_query(now).all()
+        return [id_ for id_, in results]
+
+    @classmethod
+    def get_environments_pending_atat_user_creation(cls, now) -> List[UUID]:
+        results = cls.pending_atat_user_creation_query(now).all()
         return [id_ for id_, in results]
@@ -0,0 +1,149 @@
+import json
+from collections import namedtuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from atst.models.application_role import ApplicationRole
+from atst.models.portfolio import Portfolio
+from atst.models.portfolio_role import PortfolioRole
+from atst.models.user import User
+
+from .portfolios import Portfolios
+
+
+NavigationPortfolio = namedtuple("NavigationPortfolio", ["id", "name"])
+
+DEFAULT_KEY_PREFIX = "portfolionav"
+
+# marker for changes that affect every user's navigation, such as a
+# portfolio being renamed or deleted
+ALL_USERS = "*"
+
+
+class PortfolioNavigation(object):
+    """
+    Caches each user's sidebar portfolio list in Redis as (id, name) pairs.
+
+    Entries are dropped when the user's roles change. Changes to portfolios
+    themselves bump a shared version number that is part of every key, which
+    expires all of the entries at once.
+    """
+
+    def __init__(self, redis, expiry_seconds=3600, key_prefix=DEFAULT_KEY_PREFIX):
+        self.redis = redis
+        self.expiry_seconds = expiry_seconds
+        self.key_prefix = key_prefix
+
+    def for_user(self, user):
+        key = self._key(user.id)
+        cached = self.redis.get(key)
+        if cached is not None:
+            return [NavigationPortfolio(*row) for row in json.loads(cached)]
+
+        portfolios = [
+            NavigationPortfolio(str(id_), name)
+            for (id_, name) in Portfolios.navigation_for_user(user)
+        ]
+        self.redis.setex(
+            name=key, value=json.dumps(portfolios), time=self.expiry_seconds
+        )
+        return portfolios
+
+    def invalidate(self, user_ids):
+        if ALL_USERS in user_ids:
+            self.redis.incr(self._version_key)
+        elif user_ids:
+            self.redis.delete(*[self._key(user_id) for user_id in user_ids])
+
+    @property
+    def _version_key(self):
+        return "{}:version".format(self.key_prefix)
+
+    def _key(self, user_id):
+        version = self.redis.get(self._version_key) or b"0"
+        return "{}:{}:{}".format(self.key_prefix, version.decode(), user_id)
+
+
+class LazyPortfolioList(object):
+    """
+    Defers loading the portfolio list until a template iterates or tests it,
+    so pages that do not draw the sidebar do not pay for it.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._portfolios = None
+
+    def _load(self):
+        if self._portfolios is None:
+            self._portfolios = self._loader()
+        return self._portfolios
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+
+# Changes are collected on the session while it flushes and applied once the
+# transaction commits, so that a concurrent request cannot re-cache the old
+# list between the invalidation and the commit.
+_SESSION_KEY = "portfolio_navigation_invalidations"
+
+
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return set()
+    return session.info.setdefault(_SESSION_KEY, set())
+
+
+def _role_changed(mapper, connection, target):
+    if target.user_id is not None:
+        _pending(target).add(target.user_id)
+
+
+def _user_changed(mapper, connection, target):
+    _pending(target).add(target.id)
+
+
+def _portfolio_changed(mapper, connection, target):
+    state = inspect(target)
+    if (
+        state.attrs.name.history.has_changes()
+        or state.attrs.deleted.history.has_changes()
+    ):
+        _pending(target).add(ALL_USERS)
+
+
+def _portfolio_created(mapper, connection, target):
+    _pending(target).add(ALL_USERS)
+
+
+for _model in [PortfolioRole, ApplicationRole]:
+    for _event in ["after_insert", "after_update", "after_delete"]:
+        event.listen(_model, _event, _role_changed)
+
+event.listen(User, "after_update", _user_changed)
+event.listen(Portfolio, "after_insert", _portfolio_created)
+event.listen(Portfolio, "after_update", _portfolio_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    user_ids = session.info.pop(_SESSION_KEY, None)
+    if user_ids and has_app_context():
+        navigation = getattr(current_app, "portfolio_navigation", None)
+        if navigation is not None:
+            navigation.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
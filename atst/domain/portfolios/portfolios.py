@@ -65,6 +65,16 @@ class Portfolios(object):
             portfolios = PortfoliosQuery.get_for_user(user)
         return portfolios
 
+    @classmethod
+    def navigation_for_user(cls, user):
+        """
+        Returns (id, name) rows for the portfolios the user can navigate to.
+        """
+        if Authorization.has_atat_permission(user, Permissions.VIEW_PORTFOLIO):
+            return PortfoliosQuery.get_navigation_all()
+        else:
+            return PortfoliosQuery.get_navigation_for_user(user)
+
     @classmethod
     def add_member(cls, portfolio, member, permission_sets=None):
         portfolio_role = PortfolioRoles.add(member, portfolio.id, permission_sets)
@@ -1,4 +1,4 @@
-from sqlalchemy import or_
+from sqlalchemy import and_, or_
 from atst.database import db
 from atst.domain.common import Query
 from atst.models.portfolio import Portfolio
@@ -54,6 +54,48 @@ class PortfoliosQuery(Query):
             .all()
         )
 
+    @classmethod
+    def get_navigation_for_user(cls, user):
+        """
+        Returns (id, name) rows for the portfolios that get_for_user returns,
+        in a single flat query that does not load any ORM objects.
+        """
+        return (
+            db.session.query(Portfolio.id, Portfolio.name)
+            .outerjoin(
+                PortfolioRole,
+                and_(
+                    PortfolioRole.portfolio_id == Portfolio.id,
+                    PortfolioRole.user_id == user.id,
+                    PortfolioRole.status == PortfolioRoleStatus.ACTIVE,
+                ),
+            )
+            .outerjoin(Application, Application.portfolio_id == Portfolio.id)
+            .outerjoin(
+                ApplicationRole,
+                and_(
+                    ApplicationRole.application_id == Application.id,
+                    ApplicationRole.user_id == user.id,
+                    ApplicationRole.status == ApplicationRoleStatus.ACTIVE,
+                    ApplicationRole.deleted == False,
+                ),
+            )
+            .filter(or_(PortfolioRole.id != None, ApplicationRole.id != None))
+            .filter(Portfolio.deleted == False)
+            .distinct()
+            .order_by(Portfolio.name.asc())
+            .all()
+        )
+
+    @classmethod
+    def get_navigation_all(cls):
+        return (
+            db.session.query(Portfolio.id, Portfolio.name)
+            .filter(Portfolio.deleted == False)
+            .order_by(Portfolio.name.asc())
+            .all()
+        )
+
     @classmethod
     def create_portfolio_role(cls, user, portfolio, **kwargs):
         return PortfolioRole(user=user, portfolio=portfolio, **kwargs)
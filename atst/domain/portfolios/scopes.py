@@ -1,6 +1,6 @@
 from atst.domain.authz import Authorization
+from atst.models.application_role import Status as ApplicationRoleStatus
 from atst.models.permissions import Permissions
-from atst.domain.applications import Applications
 
 
 class ScopedResource(object):
@@ -36,4 +36,14 @@ class ScopedPortfolio(ScopedResource):
         if can_view_all_applications:
             return self.resource.applications
         else:
-            return Applications.for_user(self.user, self.resource)
+            # applications the user has only been invited to are left out
+            active_application_ids = {
+                role.application_id
+                for role in self.user.application_roles
+                if role.status == ApplicationRoleStatus.ACTIVE
+            }
+            return [
+                application
+                for application in self.resource.applications
+                if application.id in active_application_ids
+            ]
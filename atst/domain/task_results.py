@@ -0,0 +1,31 @@
+from celery.backends.database.models import Task as TaskResult
+from sqlalchemy import and_, exists, not_
+
+from atst.database import db
+from atst.models import EnvironmentJobFailure, EnvironmentRoleJobFailure
+
+
+class TaskResults(object):
+    @classmethod
+    def prune(cls, before):
+        """
+        Deletes Celery task results that finished before `before`, a naive
+        UTC datetime, except for the ones that job failures refer to.
+        Returns the number of results deleted.
+        """
+        # Celery creates its table the first time it stores a result
+        if not db.engine.dialect.has_table(
+            db.session.connection(), TaskResult.__tablename__
+        ):
+            return 0
+
+        referenced = [
+            exists().where(Failure.task_id == TaskResult.task_id)
+            for Failure in [EnvironmentJobFailure, EnvironmentRoleJobFailure]
+        ]
+        result = db.session.execute(
+            TaskResult.__table__.delete().where(
+                and_(TaskResult.date_done < before, *map(not_, referenced))
+            )
+        )
+        return result.rowcount
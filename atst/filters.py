@@ -58,16 +58,6 @@ def dateFromString(value, formatter="%m/%Y"):
     return datetime.datetime.strptime(value, formatter)
 
 
-def pageWindow(pagination, size=2):
-    page = pagination.page
-    num_pages = pagination.pages
-
-    over = max(0, page + size - num_pages)
-    under = min(0, page - size - 1)
-
-    return (max(1, (page - size) - over), min(num_pages, (page + size) - under))
-
-
 def renderAuditEvent(event):
     template_name = "audit_log/events/{}.html".format(event.resource_type)
     try:
@@ -82,7 +72,6 @@ def register_filters(app):
     app.jinja_env.filters["usPhone"] = usPhone
     app.jinja_env.filters["formattedDate"] = formattedDate
     app.jinja_env.filters["dateFromString"] = dateFromString
-    app.jinja_env.filters["pageWindow"] = pageWindow
     app.jinja_env.filters["renderAuditEvent"] = renderAuditEvent
     app.jinja_env.filters["withExtraParams"] = with_extra_params
     app.jinja_env.filters["obligatedFundingGraphWidth"] = obligatedFundingGraphWidth
@@ -4,15 +4,55 @@ import pendulum
 from atst.database import db
 from atst.queue import celery
 from atst.models import (
+    Environment,
     EnvironmentJobFailure,
     EnvironmentRoleJobFailure,
     EnvironmentRole,
 )
-from atst.domain.csp.cloud import CloudProviderInterface, GeneralCSPException
+from atst.domain.audit_log import AuditEventPartitions
+from atst.domain.csp.cloud import (
+    AuthenticationException,
+    AuthorizationException,
+    CircuitOpenException,
+    CloudProviderInterface,
+    ConnectionException,
+    GeneralCSPException,
+    OperationInProgressException,
+    UnknownServerException,
+)
 from atst.domain.environments import Environments
 from atst.domain.environment_roles import EnvironmentRoles
-from atst.models.utils import claim_for_update
+from atst.domain.task_results import TaskResults
+from atst.models.utils import claim_for_update, claim_many
 from atst.utils.localization import translate
+from atst.utils.retry import RetryPolicy, policy_for
+
+
+ENVIRONMENT_READY_EMAIL = "environment_ready_email"
+
+RETRY_POLICIES = {
+    # the CSP is busy with the resource and will finish in its own time
+    OperationInProgressException: RetryPolicy(
+        max_retries=10, base_delay=30, max_delay=600
+    ),
+    ConnectionException: RetryPolicy(
+        max_retries=6, base_delay=10, max_delay=300, trips_breaker=True
+    ),
+    UnknownServerException: RetryPolicy(
+        max_retries=5, base_delay=30, max_delay=900, trips_breaker=True
+    ),
+    # retrying will not fix bad or insufficient credentials
+    AuthenticationException: RetryPolicy(max_retries=0),
+    AuthorizationException: RetryPolicy(max_retries=0),
+    # on top of the time left until the circuit closes
+    CircuitOpenException: RetryPolicy(max_retries=10, base_delay=15, max_delay=120),
+    GeneralCSPException: RetryPolicy(max_retries=3, base_delay=60, max_delay=600),
+}
+
+
+# how many seconds drains hold back a resource that has used up its retries,
+# the longest a claim is held
+RETRIES_EXHAUSTED_HOLD = 30 * 60
 
 
 class RecordEnvironmentFailure(celery.Task):
@@ -40,6 +80,11 @@ def send_mail(recipients, subject, body):
     app.mailer.send(recipients, subject, body)
 
 
+@celery.task(ignore_result=True)
+def send_mails(emails):
+    app.mailer.send_many(emails)
+
+
 @celery.task(ignore_result=True)
 def send_notification_mail(recipients, subject, body):
     app.logger.info(
@@ -50,21 +95,33 @@ def send_notification_mail(recipients, subject, body):
     app.mailer.send(recipients, subject, body)
 
 
+@celery.task(bind=True, ignore_result=True, max_retries=5)
+def send_notification_digest(self):
+    sender = app.notification_sender
+    try:
+        sender.send_digest()
+    except Exception as exc:
+        # the events stay buffered until a digest is sent
+        raise self.retry(exc=exc, countdown=sender.digest_window)
+
+
 def do_create_environment(csp: CloudProviderInterface, environment_id=None):
     environment = Environments.get(environment_id)
 
     with claim_for_update(environment) as environment:
+        create_environment_in_csp(csp, environment)
 
-        if environment.cloud_id is not None:
-            # TODO: Return value for this?
-            return
-
-        user = environment.creator
 
-        # we'll need to do some checking in this job for cases where it's retrying
-        # when a failure occured after some successful steps
-        # (e.g. if environment.cloud_id is not None, then we can skip first step)
+def create_environment_in_csp(csp: CloudProviderInterface, environment):
+    if (
+        environment.provisioning_stage
+        != Environment.ProvisioningStage.CREATE_ENVIRONMENT
+    ):
+        return
 
+    # cloud_id and the email checkpoint let a retry pick up after the steps
+    # that already succeeded
+    if environment.cloud_id is None:
         # credentials either from a given user or pulled from config?
         # if using global creds, do we need to log what user authorized action?
         atat_root_creds = csp.root_creds()
@@ -72,31 +129,54 @@ def do_create_environment(csp: CloudProviderInterface, environment_id=None):
         # user is needed because baseline root account in the environment will
         # be assigned to the requesting user, open question how to handle duplicate
         # email addresses across new environments
-        csp_environment_id = csp.create_environment(atat_root_creds, user, environment)
+        csp_environment_id = csp.create_environment(
+            atat_root_creds, environment.creator, environment
+        )
         environment.cloud_id = csp_environment_id
         db.session.add(environment)
         db.session.commit()
 
+    if not environment.has_checkpoint(ENVIRONMENT_READY_EMAIL):
         body = render_email(
             "emails/application/environment_ready.txt", {"environment": environment}
         )
         app.mailer.send(
             [environment.creator.email], translate("email.environment_ready"), body
         )
+        environment.checkpoint(ENVIRONMENT_READY_EMAIL)
+
+    environment.advance_provisioning_stage(
+        Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+    )
+    db.session.add(environment)
+    db.session.commit()
 
 
 def do_create_atat_admin_user(csp: CloudProviderInterface, environment_id=None):
     environment = Environments.get(environment_id)
 
     with claim_for_update(environment) as environment:
+        create_atat_admin_user_in_csp(csp, environment)
+
+
+def create_atat_admin_user_in_csp(csp: CloudProviderInterface, environment):
+    if (
+        environment.provisioning_stage
+        != Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+    ):
+        return
+
+    if environment.root_user_info is None:
         atat_root_creds = csp.root_creds()
 
         atat_remote_root_user = csp.create_atat_admin_user(
             atat_root_creds, environment.cloud_id
         )
         environment.root_user_info = atat_remote_root_user
-        db.session.add(environment)
-        db.session.commit()
+
+    environment.advance_provisioning_stage(Environment.ProvisioningStage.COMPLETED)
+    db.session.add(environment)
+    db.session.commit()
 
 
 def render_email(template_path, context):
@@ -107,27 +187,213 @@ def do_provision_user(csp: CloudProviderInterface, environment_role_id=None):
     environment_role = EnvironmentRoles.get_by_id(environment_role_id)
 
     with claim_for_update(environment_role) as environment_role:
-        credentials = environment_role.environment.csp_credentials
+        provision_user_in_csp(csp, environment_role)
+
+
+def provision_user_in_csp(csp: CloudProviderInterface, environment_role):
+    credentials = environment_role.environment.csp_credentials
+
+    csp_user_id = csp.create_or_update_user(
+        credentials, environment_role, environment_role.role
+    )
+    environment_role.csp_user_id = csp_user_id
+    environment_role.status = EnvironmentRole.Status.COMPLETED
+    db.session.add(environment_role)
+    db.session.commit()
+
+
+def do_work_batch(fn, csp, Model, id_query, limit, record_failure):
+    """
+    Claims up to `limit` resources from `id_query` and runs `fn` on each of
+    them. A CSP error on one resource is recorded with
+    `record_failure(resource, error)` and does not stop the rest of the
+    batch. If `record_failure` returns a number of seconds, the resource
+    stays claimed for that long before a later batch can pick it up again.
+    Returns the number of resources claimed.
+    """
+    holds = {}
+    with claim_many(Model, id_query, limit, holds=holds) as resources:
+        for resource in resources:
+            try:
+                fn(csp, resource)
+            except GeneralCSPException as e:
+                db.session.rollback()
+                app.logger.warning(
+                    "Provisioning {} {} failed: {}".format(
+                        Model.__name__, resource.id, e
+                    )
+                )
+                hold = record_failure(resource, e)
+                db.session.commit()
+                if hold:
+                    holds[resource.id] = hold
+
+        return len(resources)
+
+
+def drain(
+    task, fn, Model, id_query_for, failure_for, endpoint, slot=None, next_drain=None,
+):
+    """
+    Works through the backlog `id_query_for()` describes in batches of
+    PROVISIONING_BATCH_SIZE until it is empty, the CSP's rate limit for the
+    current minute is used up, or the circuit for `endpoint` opens. A
+    resource that fails is held back for as long as RETRY_POLICIES says its
+    task would wait before retrying, counting its earlier failures as the
+    attempts, and for RETRIES_EXHAUSTED_HOLD once those are used up. If it
+    did any work, it then starts `next_drain` for the resources that moved
+    on to the next stage.
+    """
+    batch_size = app.config.get("PROVISIONING_BATCH_SIZE")
+    dispatcher = app.provisioning_dispatcher
+    breaker = app.circuit_breaker
+
+    # resources that failed are not claimed again by the same drain
+    failed_ids = set()
+
+    def _record_failure(resource, error):
+        policy = policy_for(RETRY_POLICIES, error)
+        if policy.trips_breaker:
+            breaker.record_failure(endpoint)
+        attempt = len(resource.job_failures)
+        db.session.add(failure_for(resource, task.request.id))
+        failed_ids.add(resource.id)
+
+        if attempt >= policy.max_retries:
+            return RETRIES_EXHAUSTED_HOLD
+        return policy.countdown(attempt)
+
+    def _id_query():
+        query = id_query_for()
+        if failed_ids:
+            query = query.filter(Model.id.notin_(failed_ids))
+        return query
+
+    total_claimed = 0
+    try:
+        while not breaker.is_open(endpoint):
+            granted, rate_key = dispatcher.take_budget(batch_size)
+            if not granted:
+                break
 
-        csp_user_id = csp.create_or_update_user(
-            credentials, environment_role, environment_role.role
+            claimed = do_work_batch(
+                fn, app.csp.cloud, Model, _id_query(), granted, _record_failure
+            )
+            total_claimed += claimed
+            dispatcher.return_budget(rate_key, granted - claimed)
+            if claimed < batch_size:
+                break
+    finally:
+        if slot is not None:
+            dispatcher.release(task.name, slot)
+
+    if total_claimed and next_drain is not None:
+        dispatch_drains(next_drain)
+
+
+def hand_off(environment_id):
+    """
+    Enqueues the work for an environment's current provisioning stage, so
+    that each stage starts as soon as the one before it finishes instead of
+    on the next dispatch round. Once the environment is provisioned, that is
+    provisioning its users. Anything the CSP's rate limit holds back is left
+    for the dispatch tasks.
+    """
+    environment = Environments.get(environment_id)
+    dispatcher = app.provisioning_dispatcher
+    stage = environment.provisioning_stage
+
+    if stage == Environment.ProvisioningStage.CREATE_ENVIRONMENT:
+        dispatcher.dispatch(create_environment, "environment_id", [environment.id])
+    elif stage == Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER:
+        dispatcher.dispatch(create_atat_admin_user, "environment_id", [environment.id])
+    elif stage == Environment.ProvisioningStage.COMPLETED:
+        dispatcher.dispatch(
+            provision_user,
+            "environment_role_id",
+            EnvironmentRoles.get_environment_roles_pending_creation(environment.id),
         )
-        environment_role.csp_user_id = csp_user_id
-        environment_role.status = EnvironmentRole.Status.COMPLETED
-        db.session.add(environment_role)
+
+
+def do_maintain_audit_partitions(now):
+    created = AuditEventPartitions.create_upcoming(now)
+    db.session.commit()
+    app.logger.info("Audit event partitions through {}".format(created[-1]))
+
+    retention_months = app.config.get("AUDIT_RETENTION_MONTHS")
+    if not retention_months:
+        return
+
+    archive_dir = app.config.get("AUDIT_ARCHIVE_DIR")
+    if not archive_dir:
+        app.logger.warning(
+            "AUDIT_RETENTION_MONTHS is set but AUDIT_ARCHIVE_DIR is not; "
+            "expired audit event partitions will be kept"
+        )
+        return
+
+    for partition in AuditEventPartitions.expired(now, retention_months):
+        path = AuditEventPartitions.archive(partition, archive_dir)
+        AuditEventPartitions.drop(partition)
         db.session.commit()
+        app.logger.info(
+            "Archived audit event partition {} to {}".format(partition, path)
+        )
+
+
+def do_prune_task_results(now):
+    retention_days = app.config.get("CELERY_RESULT_RETENTION_DAYS")
+    # Redis expires its results without help
+    if not retention_days or app.config.get("CELERY_RESULT_STORE") != "database":
+        return
+
+    # Celery records when results were stored as naive UTC datetimes
+    before = now.in_timezone("UTC").subtract(days=retention_days).naive()
+    deleted = TaskResults.prune(before)
+    db.session.commit()
+    app.logger.info("Pruned {} task results from before {}".format(deleted, before))
 
 
 def do_work(fn, task, csp, **kwargs):
+    """
+    Runs `fn` for a provisioning task. CSP errors are retried according to
+    RETRY_POLICIES, and errors that say the CSP is unhealthy count towards
+    opening the circuit for the task. While the circuit is open the task
+    waits it out rather than calling the CSP. Once a task has used up its
+    retries the error is raised, so that its failure is recorded.
+    """
+    breaker = app.circuit_breaker
+    final_attempt = True
     try:
+        retry_after = breaker.retry_after(task.name)
+        if retry_after:
+            raise CircuitOpenException(task.name, retry_after)
+
         fn(csp, **kwargs)
+        breaker.record_success(task.name)
     except GeneralCSPException as e:
-        raise task.retry(exc=e)
+        policy = policy_for(RETRY_POLICIES, e)
+        if policy.trips_breaker:
+            breaker.record_failure(task.name)
+
+        attempt = task.request.retries
+        if attempt >= policy.max_retries:
+            raise
+
+        final_attempt = False
+        countdown = policy.countdown(attempt) + getattr(e, "retry_after", 0)
+        raise task.retry(exc=e, countdown=countdown, max_retries=policy.max_retries)
+    finally:
+        # let the next dispatch round pick the resource up again
+        if final_attempt:
+            (resource_id,) = kwargs.values()
+            app.provisioning_dispatcher.release(task.name, resource_id)
 
 
 @celery.task(bind=True, base=RecordEnvironmentFailure)
 def create_environment(self, environment_id=None):
     do_work(do_create_environment, self, app.csp.cloud, environment_id=environment_id)
+    hand_off(environment_id)
 
 
 @celery.task(bind=True, base=RecordEnvironmentFailure)
@@ -135,34 +401,131 @@ def create_atat_admin_user(self, environment_id=None):
     do_work(
         do_create_atat_admin_user, self, app.csp.cloud, environment_id=environment_id
     )
+    hand_off(environment_id)
 
 
-@celery.task(bind=True)
+@celery.task(bind=True, base=RecordEnvironmentRoleFailure)
 def provision_user(self, environment_role_id=None):
     do_work(
         do_provision_user, self, app.csp.cloud, environment_role_id=environment_role_id
     )
 
 
+@celery.task(ignore_result=True)
+def maintain_audit_partitions():
+    do_maintain_audit_partitions(pendulum.now("UTC"))
+
+
+@celery.task(ignore_result=True)
+def prune_task_results():
+    do_prune_task_results(pendulum.now("UTC"))
+
+
+@celery.task(bind=True)
+def drain_create_environment(self, slot=None):
+    drain(
+        self,
+        create_environment_in_csp,
+        Environment,
+        lambda: Environments.pending_creation_query(pendulum.now()),
+        lambda environment, task_id: EnvironmentJobFailure(
+            environment_id=environment.id, task_id=task_id
+        ),
+        endpoint=create_environment.name,
+        slot=slot,
+        next_drain=drain_create_atat_admin_user,
+    )
+
+
+@celery.task(bind=True)
+def drain_create_atat_admin_user(self, slot=None):
+    drain(
+        self,
+        create_atat_admin_user_in_csp,
+        Environment,
+        lambda: Environments.pending_atat_user_creation_query(pendulum.now()),
+        lambda environment, task_id: EnvironmentJobFailure(
+            environment_id=environment.id, task_id=task_id
+        ),
+        endpoint=create_atat_admin_user.name,
+        slot=slot,
+        next_drain=drain_provision_user,
+    )
+
+
+@celery.task(bind=True)
+def drain_provision_user(self, slot=None):
+    drain(
+        self,
+        provision_user_in_csp,
+        EnvironmentRole,
+        EnvironmentRoles.pending_creation_query,
+        lambda environment_role, task_id: EnvironmentRoleJobFailure(
+            environment_role_id=environment_role.id, task_id=task_id
+        ),
+        endpoint=provision_user.name,
+        slot=slot,
+    )
+
+
+def dispatch_drains(drain_task):
+    """
+    Keeps PROVISIONING_CONCURRENCY drain tasks of a kind in flight. Each
+    one claims its own batches, so they work through the backlog in parallel.
+    Drains draw on the CSP's rate limit per batch rather than when enqueued.
+    """
+    app.provisioning_dispatcher.dispatch(
+        drain_task,
+        "slot",
+        list(range(app.config.get("PROVISIONING_CONCURRENCY"))),
+        rate_limited=False,
+    )
+
+
 @celery.task(bind=True)
 def dispatch_create_environment(self):
-    for environment_id in Environments.get_environments_pending_creation(
-        pendulum.now()
-    ):
-        create_environment.delay(environment_id=environment_id)
+    # anything dispatched now would only wait for the circuit to close
+    if app.circuit_breaker.is_open(create_environment.name):
+        return
+
+    if app.config.get("PROVISIONING_BATCH_SIZE"):
+        dispatch_drains(drain_create_environment)
+        return
+
+    app.provisioning_dispatcher.dispatch(
+        create_environment,
+        "environment_id",
+        Environments.get_environments_pending_creation(pendulum.now()),
+    )
 
 
 @celery.task(bind=True)
 def dispatch_create_atat_admin_user(self):
-    for environment_id in Environments.get_environments_pending_atat_user_creation(
-        pendulum.now()
-    ):
-        create_atat_admin_user.delay(environment_id=environment_id)
+    if app.circuit_breaker.is_open(create_atat_admin_user.name):
+        return
+
+    if app.config.get("PROVISIONING_BATCH_SIZE"):
+        dispatch_drains(drain_create_atat_admin_user)
+        return
+
+    app.provisioning_dispatcher.dispatch(
+        create_atat_admin_user,
+        "environment_id",
+        Environments.get_environments_pending_atat_user_creation(pendulum.now()),
+    )
 
 
 @celery.task(bind=True)
 def dispatch_provision_user(self):
-    for (
-        environment_role_id
-    ) in EnvironmentRoles.get_environment_roles_pending_creation():
-        provision_user.delay(environment_role_id=environment_role_id)
+    if app.circuit_breaker.is_open(provision_user.name):
+        return
+
+    if app.config.get("PROVISIONING_BATCH_SIZE"):
+        dispatch_drains(drain_provision_user)
+        return
+
+    app.provisioning_dispatcher.dispatch(
+        provision_user,
+        "environment_role_id",
+        EnvironmentRoles.get_environment_roles_pending_creation(),
+    )
@@ -1,37 +1,64 @@
-from sqlalchemy import String, Column, ForeignKey, inspect
+import sqlalchemy
+from uuid import uuid4
+from sqlalchemy import String, Column, inspect
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 
 from atst.models.base import Base
-import atst.models.types as types
 from atst.models.mixins.timestamps import TimestampsMixin
 
 
 class AuditEvent(Base, TimestampsMixin):
     __tablename__ = "audit_events"
 
-    id = types.Id()
+    # audit_events is partitioned by month. Postgres 10 does not allow keys
+    # or indexes on the partitioned table itself, so each partition gets its
+    # own from create_audit_events_partition(); see AuditEventPartitions.
+    # The columns are declared the same way here, with the primary key and
+    # foreign keys known only to the mapper. Since the table has no primary
+    # key, SQLAlchemy cannot read a generated id back after an INSERT, so
+    # the id is generated client-side; the server default is a backstop for
+    # rows inserted outside the ORM.
+    id = Column(
+        UUID(as_uuid=True),
+        nullable=False,
+        default=uuid4,
+        server_default=sqlalchemy.text("uuid_generate_v4()"),
+    )
 
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True)
-    user = relationship("User", backref="audit_events")
+    user_id = Column(UUID(as_uuid=True))
+    user = relationship(
+        "User",
+        primaryjoin="foreign(AuditEvent.user_id) == User.id",
+        backref="audit_events",
+    )
 
-    portfolio_id = Column(UUID(as_uuid=True), ForeignKey("portfolios.id"), index=True)
-    portfolio = relationship("Portfolio", backref="audit_events")
+    portfolio_id = Column(UUID(as_uuid=True))
+    portfolio = relationship(
+        "Portfolio",
+        primaryjoin="foreign(AuditEvent.portfolio_id) == Portfolio.id",
+        backref="audit_events",
+    )
 
-    application_id = Column(
-        UUID(as_uuid=True), ForeignKey("applications.id"), index=True
+    application_id = Column(UUID(as_uuid=True))
+    application = relationship(
+        "Application",
+        primaryjoin="foreign(AuditEvent.application_id) == Application.id",
+        backref="audit_events",
     )
-    application = relationship("Application", backref="audit_events")
 
     changed_state = Column(JSONB())
     event_details = Column(JSONB())
 
     resource_type = Column(String(), nullable=False)
-    resource_id = Column(UUID(as_uuid=True), index=True, nullable=False)
+    resource_id = Column(UUID(as_uuid=True), nullable=False)
 
     display_name = Column(String())
     action = Column(String(), nullable=False)
 
+    __table_args__ = {"postgresql_partition_by": "RANGE (time_created)"}
+    __mapper_args__ = {"primary_key": [id]}
+
     @property
     def log(self):
         return {
@@ -1,7 +1,15 @@
-from sqlalchemy import Column, ForeignKey, String, TIMESTAMP, UniqueConstraint
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    String,
+    TIMESTAMP,
+    UniqueConstraint,
+    Enum as SQLAEnum,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import JSONB
 from enum import Enum
+import pendulum
 
 from atst.models.base import Base
 import atst.models.mixins as mixins
@@ -30,6 +38,20 @@ class Environment(
 
     claimed_until = Column(TIMESTAMP(timezone=True))
 
+    class ProvisioningStage(Enum):
+        CREATE_ENVIRONMENT = "create_environment"
+        CREATE_ATAT_ADMIN_USER = "create_atat_admin_user"
+        COMPLETED = "completed"
+
+    provisioning_stage = Column(
+        SQLAEnum(ProvisioningStage, native_enum=False),
+        default=ProvisioningStage.CREATE_ENVIRONMENT,
+        nullable=False,
+    )
+    # Steps within a stage that have completed, and when, so that a stage that
+    # is retried after a failure does not repeat them.
+    provisioning_checkpoints = Column(JSONB(none_as_null=True))
+
     job_failures = relationship("EnvironmentJobFailure")
 
     roles = relationship(
@@ -79,6 +101,20 @@ class Environment(
     def is_pending(self):
         return self.provisioning_status == self.ProvisioningStatus.PENDING
 
+    def has_checkpoint(self, name):
+        return name in (self.provisioning_checkpoints or {})
+
+    def checkpoint(self, name):
+        # assign a new dict so that the change is picked up on flush
+        self.provisioning_checkpoints = {
+            **(self.provisioning_checkpoints or {}),
+            name: pendulum.now("UTC").isoformat(),
+        }
+
+    def advance_provisioning_stage(self, stage):
+        self.checkpoint(self.provisioning_stage.value)
+        self.provisioning_stage = stage
+
     def __repr__(self):
         return "<Environment(name='{}', num_users='{}', application='{}', portfolio='{}', id='{}')>".format(
             self.name,
@@ -1,13 +1,25 @@
+import pendulum
 from sqlalchemy import event, inspect
-from flask import g, current_app as app
+from sqlalchemy.orm import Session
+from flask import g, has_app_context, current_app as app
 
 from atst.models.audit_event import AuditEvent
+from atst.utils.audit_pipeline import log_audit_event
 from atst.utils import camel_to_snake, getattr_path
 
 ACTION_CREATE = "create"
 ACTION_UPDATE = "update"
 ACTION_DELETE = "delete"
 
+# Audit events are collected on the session during a unit of work and
+# written with a single multi-row INSERT once the flush completes, in the
+# same transaction as the changes they describe.
+PENDING_AUDIT_EVENTS = "pending_audit_events"
+
+# When an audit pipeline is configured, events are instead handed to it once
+# the transaction commits, so that it only ships events for committed changes.
+QUEUED_AUDIT_EVENTS = "queued_audit_events"
+
 
 class AuditableMixin(object):
     @staticmethod
@@ -17,7 +29,10 @@ class AuditableMixin(object):
         if changed_state is None:
             changed_state = resource.history if action == ACTION_UPDATE else None
 
+        # recorded when the change is made, so that events written later by
+        # the audit pipeline keep their order and land in the right partition
         log_data = {
+            "time_created": pendulum.now("UTC"),
             "user_id": user_id,
             "portfolio_id": resource.portfolio_id,
             "application_id": resource.application_id,
@@ -29,17 +44,19 @@ class AuditableMixin(object):
             "event_details": resource.event_details,
         }
 
-        app.logger.info(
-            "Audit Event {}".format(action),
-            extra={
-                "audit_event": {key: str(value) for key, value in log_data.items()},
-                "tags": ["audit_event", action],
-            },
-        )
+        session = inspect(resource).session
+        if getattr(app, "audit_pipeline", None) is not None and session is not None:
+            session.info.setdefault(QUEUED_AUDIT_EVENTS, []).append(log_data)
+            return
+
+        log_audit_event(app.logger, log_data)
 
         if app.config.get("USE_AUDIT_LOG", False):
-            audit_event = AuditEvent(**log_data)
-            audit_event.save(connection)
+            if session is not None:
+                session.info.setdefault(PENDING_AUDIT_EVENTS, []).append(log_data)
+            else:
+                audit_event = AuditEvent(**log_data)
+                audit_event.save(connection)
 
     @classmethod
     def __declare_last__(cls):
@@ -106,6 +123,36 @@ class AuditableMixin(object):
         return None
 
 
+def write_pending_audit_events(session):
+    audit_events = session.info.pop(PENDING_AUDIT_EVENTS, None)
+    if audit_events:
+        session.connection().execute(AuditEvent.__table__.insert().values(audit_events))
+
+
+@event.listens_for(Session, "after_flush")
+def _write_audit_events_after_flush(session, flush_context):
+    write_pending_audit_events(session)
+
+
+@event.listens_for(Session, "before_commit")
+def _write_audit_events_before_commit(session):
+    # events recorded by attribute listeners outside of a flush
+    write_pending_audit_events(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_audit_events(session):
+    audit_events = session.info.pop(QUEUED_AUDIT_EVENTS, None)
+    if audit_events and has_app_context():
+        app.audit_pipeline.submit(audit_events)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_audit_events(session):
+    session.info.pop(PENDING_AUDIT_EVENTS, None)
+    session.info.pop(QUEUED_AUDIT_EVENTS, None)
+
+
 def record_permission_sets_updates(instance_state, permission_sets, initiator):
     old_perm_sets = instance_state.attrs.get("permission_sets").value
     if instance_state.persistent and old_perm_sets != permission_sets:
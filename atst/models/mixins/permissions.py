@@ -1,6 +1,23 @@
+from atst.models.permissions import permission_bit
+
+
 class PermissionsMixin(object):
     @property
     def permissions(self):
         return [
             perm for permset in self.permission_sets for perm in permset.permissions
         ]
+
+    @property
+    def permissions_mask(self):
+        mask = 0
+        for permset in self.permission_sets:
+            mask |= permset.mask
+        return mask
+
+    def has_permission(self, permission):
+        bit = permission_bit(permission)
+        if bit:
+            return bool(self.permissions_mask & bit)
+
+        return permission in self.permissions
@@ -4,6 +4,7 @@ from sqlalchemy.dialects.postgresql import ARRAY
 from atst.models.base import Base
 import atst.models.mixins as mixins
 import atst.models.types as types
+from atst.models.permissions import permissions_mask
 
 
 class PermissionSet(Base, mixins.TimestampsMixin):
@@ -15,6 +16,18 @@ class PermissionSet(Base, mixins.TimestampsMixin):
     description = Column(String, nullable=False)
     permissions = Column(ARRAY(String), index=True, server_default="{}", nullable=False)
 
+    @property
+    def mask(self):
+        # compiled once per permissions list; assigning or reloading the
+        # permissions replaces the list, which recompiles the mask
+        permissions = self.permissions
+        compiled = getattr(self, "_compiled_mask", None)
+        if compiled is None or compiled[0] is not permissions:
+            compiled = (permissions, permissions_mask(permissions))
+            self._compiled_mask = compiled
+
+        return compiled[1]
+
     def __repr__(self):
         return "<PermissionSet(name='{}', description='{}', permissions='{}', id='{}')>".format(
             self.name, self.description, self.permissions, self.id
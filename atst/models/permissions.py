@@ -1,3 +1,6 @@
+from functools import lru_cache
+
+
 class Permissions(object):
     # ccpo permissions
     VIEW_AUDIT_LOG = "view_audit_log"
@@ -49,3 +52,35 @@ class Permissions(object):
     # portfolio POC
     EDIT_PORTFOLIO_POC = "edit_portfolio_poc"
     ARCHIVE_PORTFOLIO = "archive_portfolio"
+
+
+# Each permission is assigned a bit, in definition order, so that a set of
+# permissions can be compiled into a single integer. Masks are only ever held
+# in memory; the bit assignments are not stable across releases.
+PERMISSION_BITS = {
+    permission: 1 << position
+    for position, permission in enumerate(
+        value for name, value in vars(Permissions).items() if name.isupper()
+    )
+}
+
+
+def permission_bit(permission):
+    return PERMISSION_BITS.get(permission, 0)
+
+
+@lru_cache(maxsize=None)
+def _compile_mask(permissions):
+    mask = 0
+    for permission in permissions:
+        mask |= permission_bit(permission)
+    return mask
+
+
+def permissions_mask(permissions):
+    """
+    Returns the bitmask for a collection of permissions. Masks are memoized
+    by their permissions, so each permission set is compiled once per process
+    and is recompiled if its permissions change.
+    """
+    return _compile_mask(frozenset(permissions))
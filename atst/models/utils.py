@@ -17,21 +17,12 @@ def claim_for_update(resource, minutes=30):
     """
     Model = resource.__class__
 
-    claim_until = func.now() + func.cast(
-        sql.functions.concat(minutes, " MINUTES"), Interval
-    )
-
     # Optimistically query for and update the resource in question. If it's
     # already claimed, `rows_updated` will be 0 and we can give up.
     rows_updated = (
         db.session.query(Model)
-        .filter(
-            and_(
-                Model.id == resource.id,
-                or_(Model.claimed_until == None, Model.claimed_until <= func.now()),
-            )
-        )
-        .update({"claimed_until": claim_until}, synchronize_session="fetch")
+        .filter(and_(Model.id == resource.id, _unclaimed(Model)))
+        .update({"claimed_until": _claim_until(minutes)}, synchronize_session="fetch")
     )
     if rows_updated < 1:
         raise ClaimFailedException(resource)
@@ -48,3 +39,82 @@ def claim_for_update(resource, minutes=30):
             Model.claimed_until != None
         ).update({"claimed_until": None}, synchronize_session="fetch")
         db.session.commit()
+
+
+@contextmanager
+def claim_many(Model, id_query, limit, minutes=30, holds=None):
+    """
+    Claim expiring holds on up to `limit` resources with a single statement.
+    Rows that another transaction is claiming are skipped rather than waited
+    on (SELECT ... FOR UPDATE SKIP LOCKED), so concurrent workers each get a
+    disjoint batch. The claims are committed before the batch is handed over
+    and are released when the block exits.
+
+    Args:
+        Model:      A SQLAlchemy model class with `id`, `time_created` and
+                    `claimed_until` attributes.
+        id_query:   A query for the IDs of resources that need work.
+        limit:      The maximum number of resources to claim.
+        minutes:    The maximum amount of time, in minutes, to hold the claims.
+        holds:      An optional dict the block can fill with {id: seconds} to
+                    keep those resources claimed for that many seconds after
+                    the block exits instead of releasing them.
+    """
+    if holds is None:
+        holds = {}
+
+    candidates = (
+        id_query.filter(_unclaimed(Model))
+        .order_by(Model.time_created)
+        .limit(limit)
+        .with_for_update(of=Model, skip_locked=True)
+    )
+    claimed_ids = [
+        id_
+        for (id_,) in db.session.execute(
+            Model.__table__.update()
+            .where(Model.id.in_(candidates.statement))
+            .values(claimed_until=_claim_until(minutes))
+            .returning(Model.id)
+        )
+    ]
+    db.session.commit()
+
+    claimed = (
+        db.session.query(Model).filter(Model.id.in_(claimed_ids)).all()
+        if claimed_ids
+        else []
+    )
+
+    try:
+        yield claimed
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        released_ids = [id_ for id_ in claimed_ids if id_ not in holds]
+        if released_ids:
+            db.session.query(Model).filter(Model.id.in_(released_ids)).update(
+                {"claimed_until": None}, synchronize_session="fetch"
+            )
+        for id_, seconds in holds.items():
+            db.session.query(Model).filter(Model.id == id_).update(
+                {"claimed_until": _hold_until(seconds, "SECONDS")},
+                synchronize_session="fetch",
+            )
+        if claimed_ids:
+            db.session.commit()
+
+
+def _claim_until(minutes):
+    return _hold_until(minutes, "MINUTES")
+
+
+def _hold_until(amount, unit):
+    return func.now() + func.cast(
+        sql.functions.concat(amount, " {}".format(unit)), Interval
+    )
+
+
+def _unclaimed(Model):
+    return or_(Model.claimed_until == None, Model.claimed_until <= func.now())
@@ -19,6 +19,14 @@ def update_celery(celery, app):
             "task": "atst.jobs.dispatch_provision_user",
             "schedule": 60,
         },
+        "beat-maintain_audit_partitions": {
+            "task": "atst.jobs.maintain_audit_partitions",
+            "schedule": 60 * 60 * 24,
+        },
+        "beat-prune_task_results": {
+            "task": "atst.jobs.prune_task_results",
+            "schedule": 60 * 60 * 24,
+        },
     }
 
     class ContextTask(celery.Task):
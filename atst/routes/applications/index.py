@@ -4,6 +4,7 @@ from .blueprint import applications_bp
 from atst.domain.authz.decorator import user_can_access_decorator as user_can
 from atst.domain.environment_roles import EnvironmentRoles
 from atst.models.permissions import Permissions
+from atst.utils.load_profiles import load_profile
 
 
 def has_portfolio_applications(_user, portfolio=None, **_kwargs):
@@ -23,12 +24,19 @@ def has_portfolio_applications(_user, portfolio=None, **_kwargs):
     override=has_portfolio_applications,
     message="view portfolio applications",
 )
+@load_profile(portfolio=["applications.environments"])
 def portfolio_applications(portfolio_id):
     user_env_roles = EnvironmentRoles.for_user(g.current_user.id, portfolio_id)
     environment_access = {
         env_role.environment_id: env_role.role for env_role in user_env_roles
     }
 
+    # ScopedPortfolio filters its applications on every access, so resolve
+    # them once for the whole template
+    applications = sorted(g.portfolio.applications, key=lambda app: app.name)
+
     return render_template(
-        "applications/index.html", environment_access=environment_access
+        "applications/index.html",
+        applications=applications,
+        environment_access=environment_access,
     )
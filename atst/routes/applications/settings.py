@@ -13,7 +13,7 @@ from atst.domain.applications import Applications
 from atst.domain.application_roles import ApplicationRoles
 from atst.domain.audit_log import AuditLog
 from atst.domain.csp.cloud import GeneralCSPException
-from atst.domain.common import Paginator
+from atst.domain.common import KeysetPaginator
 from atst.domain.environment_roles import EnvironmentRoles
 from atst.domain.invitations import ApplicationInvitations
 from atst.domain.portfolios import Portfolios
@@ -26,6 +26,7 @@ from atst.models.permissions import Permissions
 from atst.domain.permission_sets import PermissionSets
 from atst.utils.flash import formatted_flash as flash
 from atst.utils.localization import translate
+from atst.utils.load_profiles import load_profile
 from atst.jobs import send_mail
 from atst.routes.errors import log_error
 
@@ -155,7 +156,7 @@ def get_new_member_form(application):
 def render_settings_page(application, **kwargs):
     environments_obj = get_environments_obj_for_app(application=application)
     new_env_form = EditEnvironmentForm()
-    pagination_opts = Paginator.get_pagination_opts(http_request)
+    pagination_opts = KeysetPaginator.get_pagination_opts(http_request)
     audit_events = AuditLog.get_application_events(application, pagination_opts)
     new_member_form = get_new_member_form(application)
     members = get_members_data(application)
@@ -301,6 +302,15 @@ def handle_update_application(form, application_id=None, portfolio_id=None):
 
 @applications_bp.route("/applications/<application_id>/settings")
 @user_can(Permissions.VIEW_APPLICATION, message="view application edit form")
+@load_profile(
+    application=[
+        "environments.roles.application_role.user",
+        "roles.user",
+        "roles.permission_sets",
+        "roles.invitations",
+        "roles.environment_roles",
+    ]
+)
 def settings(application_id):
     application = Applications.get(application_id)
 
@@ -1,14 +1,18 @@
+import pendulum
+from uuid import UUID
 from flask import (
     Blueprint,
+    Response,
     render_template,
     redirect,
     url_for,
     request,
+    stream_with_context,
     current_app as app,
 )
 from atst.domain.users import Users
-from atst.domain.audit_log import AuditLog
-from atst.domain.common import Paginator
+from atst.domain.audit_log import AuditLog, EXPORT_FORMATS
+from atst.domain.common import KeysetPaginator
 from atst.domain.exceptions import NotFoundError
 from atst.domain.authz.decorator import user_can_access_decorator as user_can
 from atst.forms.ccpo_user import CCPOUserForm
@@ -25,13 +29,53 @@ bp.context_processor(atat_context_processor)
 @user_can(Permissions.VIEW_AUDIT_LOG, message="view activity log")
 def activity_history():
     if app.config.get("USE_AUDIT_LOG", False):
-        pagination_opts = Paginator.get_pagination_opts(request)
+        pagination_opts = KeysetPaginator.get_pagination_opts(request, count=True)
         audit_events = AuditLog.get_all_events(pagination_opts)
         return render_template("audit_log/audit_log.html", audit_events=audit_events)
     else:
         return redirect("/")
 
 
+EXPORT_CONTENT_TYPES = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+
+def get_export_filters(args):
+    filters = {}
+    for name in ["portfolio_id", "application_id"]:
+        if args.get(name):
+            filters[name] = UUID(args[name])
+    if args.get("resource_type"):
+        filters["resource_type"] = args["resource_type"]
+    for name in ["since", "until"]:
+        if args.get(name):
+            filters[name] = pendulum.parse(args[name])
+    return filters
+
+
+@bp.route("/activity-history/export")
+@user_can(Permissions.VIEW_AUDIT_LOG, message="export activity log")
+def export_activity_history():
+    if not app.config.get("USE_AUDIT_LOG", False):
+        return redirect("/")
+
+    export_format = request.args.get("format", "csv")
+    try:
+        filters = get_export_filters(request.args)
+    except ValueError:
+        return ("Invalid export filter", 400)
+    if export_format not in EXPORT_FORMATS:
+        return ("Invalid export format", 400)
+
+    filename = "audit_events-{}.{}".format(
+        pendulum.now("UTC").format("YYYYMMDDTHHmmss"), export_format
+    )
+    return Response(
+        stream_with_context(AuditLog.export_events(export_format, **filters)),
+        mimetype=EXPORT_CONTENT_TYPES[export_format],
+        headers={"Content-Disposition": "attachment; filename={}".format(filename)},
+    )
+
+
 @bp.route("/ccpo-users")
 @user_can(Permissions.VIEW_CCPO_USER, message="view ccpo users")
 def users():
@@ -7,7 +7,7 @@ from atst.models.portfolio_role import Status as PortfolioRoleStatus
 from atst.domain.invitations import PortfolioInvitations
 from atst.domain.permission_sets import PermissionSets
 from atst.domain.audit_log import AuditLog
-from atst.domain.common import Paginator
+from atst.domain.common import KeysetPaginator
 from atst.forms.portfolio import PortfolioForm
 import atst.forms.portfolio_member as member_forms
 from atst.models.permissions import Permissions
@@ -15,6 +15,7 @@ from atst.domain.authz.decorator import user_can_access_decorator as user_can
 from atst.utils import first_or_none
 from atst.utils.flash import formatted_flash as flash
 from atst.domain.exceptions import UnauthorizedError
+from atst.utils.load_profiles import load_profile
 
 
 def permission_str(member, edit_perm_set, view_perm_set):
@@ -65,7 +66,7 @@ def get_members_data(portfolio):
 
 
 def render_admin_page(portfolio, form=None):
-    pagination_opts = Paginator.get_pagination_opts(http_request)
+    pagination_opts = KeysetPaginator.get_pagination_opts(http_request)
     audit_events = AuditLog.get_portfolio_events(portfolio, pagination_opts)
     members_data = get_members_data(portfolio)
     portfolio_form = PortfolioForm(obj=portfolio)
@@ -101,6 +102,7 @@ def render_admin_page(portfolio, form=None):
 
 @portfolios_bp.route("/portfolios/<portfolio_id>/admin")
 @user_can(Permissions.VIEW_PORTFOLIO_ADMIN, message="view portfolio admin page")
+@load_profile(portfolio=["roles.user", "roles.permission_sets", "applications"])
 def admin(portfolio_id):
     portfolio = Portfolios.get_for_update(portfolio_id)
     return render_admin_page(portfolio)
@@ -4,12 +4,14 @@ from .blueprint import task_orders_bp
 from atst.domain.authz.decorator import user_can_access_decorator as user_can
 from atst.domain.portfolios import Portfolios
 from atst.domain.task_orders import TaskOrders
+from atst.utils.load_profiles import load_profile
 from atst.forms.task_order import SignatureForm
 from atst.models import Permissions
 
 
 @task_orders_bp.route("/task_orders/<task_order_id>")
 @user_can(Permissions.VIEW_TASK_ORDER_DETAILS, message="view task order details")
+@load_profile(task_order=["clins"])
 def view_task_order(task_order_id):
     task_order = TaskOrders.get(task_order_id)
     if task_order.is_draft:
@@ -25,6 +27,7 @@ def view_task_order(task_order_id):
 
 @task_orders_bp.route("/portfolios/<portfolio_id>/task_orders")
 @user_can(Permissions.VIEW_PORTFOLIO_FUNDING, message="view portfolio funding")
+@load_profile(portfolio=["task_orders.clins"])
 def portfolio_funding(portfolio_id):
     portfolio = Portfolios.get(g.current_user, portfolio_id)
     task_orders = TaskOrders.sort_by_status(portfolio.task_orders)
@@ -0,0 +1,233 @@
+import os
+import queue
+import threading
+import time
+
+from atst.database import db
+from atst.models.audit_event import AuditEvent
+
+
+AUDIT_MODE_SYNC = "sync"
+AUDIT_MODE_BATCHED = "batched"
+AUDIT_MODE_FIRE_AND_FORGET = "fire_and_forget"
+
+FLUSH_INTERVAL = 1
+PUT_TIMEOUT = 5
+WRITE_ATTEMPTS = 3
+RETRY_BACKOFF = 0.5
+STATUS_LOG_INTERVAL = 60
+
+
+def log_audit_event(logger, log_data):
+    action = log_data["action"]
+    logger.info(
+        "Audit Event {}".format(action),
+        extra={
+            "audit_event": {key: str(value) for key, value in log_data.items()},
+            "tags": ["audit_event", action],
+        },
+    )
+
+
+class AuditPipeline(object):
+    """
+    Ships committed audit events to the JSON log and, when the audit log is
+    enabled, to the audit_events table from a background thread, so that
+    request latency does not depend on audit volume.
+
+    In "batched" mode a full queue blocks the submitting request for up to
+    PUT_TIMEOUT seconds and then writes the event on the request thread, so
+    events are never dropped. In "fire_and_forget" mode a full queue drops
+    the event and counts it.
+
+    A batch that cannot be written is retried with backoff and then written
+    one event at a time, so that a single bad event does not lose the rest
+    of its batch. Events that still cannot be written are logged in full
+    and counted as failed.
+    """
+
+    def __init__(
+        self,
+        app,
+        mode=AUDIT_MODE_BATCHED,
+        max_queue_size=10000,
+        batch_size=500,
+        flush_interval=FLUSH_INTERVAL,
+        writer=None,
+    ):
+        if mode not in [AUDIT_MODE_BATCHED, AUDIT_MODE_FIRE_AND_FORGET]:
+            raise ValueError("Unsupported audit pipeline mode: {}".format(mode))
+
+        self.app = app
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writer = writer or self._write
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker_pid = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_flush_size = 0
+        self.last_flush_latency = None
+
+    @property
+    def status(self):
+        return {
+            "mode": self.mode,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "last_flush_size": self.last_flush_size,
+            "last_flush_latency": self.last_flush_latency,
+        }
+
+    def submit(self, events):
+        self._ensure_running()
+        for log_data in events:
+            self._put((time.monotonic(), log_data))
+
+    def _put(self, item):
+        if self.mode == AUDIT_MODE_FIRE_AND_FORGET:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+                    dropped = self.dropped
+                # log the first drop and then every thousandth, rather than
+                # adding to the load that caused the backlog
+                if dropped % 1000 == 1:
+                    self.app.logger.warning(
+                        "Audit queue is full; {} events dropped".format(dropped)
+                    )
+        else:
+            try:
+                self._queue.put(item, timeout=PUT_TIMEOUT)
+            except queue.Full:
+                self._flush([item])
+
+    def flush(self):
+        """
+        Writes everything that is currently queued on the calling thread.
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+
+        if batch:
+            self._flush(batch)
+
+    def stop(self):
+        self._stop.set()
+        self._worker_pid = None
+        self.flush()
+
+    def _ensure_running(self):
+        # uWSGI forks workers after the app is created, so the writer thread
+        # is started lazily from each worker
+        if self._worker_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+
+            self._worker_pid = os.getpid()
+            self._stop.clear()
+            worker = threading.Thread(
+                target=self._run, name="audit-writer", daemon=True
+            )
+            worker.start()
+
+    def _run(self):
+        next_status_log = time.monotonic() + STATUS_LOG_INTERVAL
+        while not self._stop.is_set():
+            if time.monotonic() >= next_status_log:
+                self.app.logger.info(
+                    "Audit pipeline status: {}".format(self.status),
+                    extra={"tags": ["audit_pipeline"]},
+                )
+                next_status_log = time.monotonic() + STATUS_LOG_INTERVAL
+
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        events = [log_data for (_queued_at, log_data) in batch]
+        with self.app.app_context():
+            for log_data in events:
+                log_audit_event(self.app.logger, log_data)
+
+            written = self._write_batch(events)
+
+        oldest = min(queued_at for (queued_at, _log_data) in batch)
+        with self._lock:
+            self.written += written
+            self.failed += len(events) - written
+            self.last_flush_size = len(events)
+            self.last_flush_latency = time.monotonic() - oldest
+
+    def _write_batch(self, events):
+        """
+        Writes events and returns how many were written.
+        """
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                self._writer(events)
+                return len(events)
+            except Exception:
+                self.app.logger.exception(
+                    "Error writing {} audit events (attempt {} of {})".format(
+                        len(events), attempt + 1, WRITE_ATTEMPTS
+                    )
+                )
+            if attempt + 1 < WRITE_ATTEMPTS:
+                time.sleep(RETRY_BACKOFF * 2 ** attempt)
+
+        # one event the table rejects fails the whole batch
+        written = 0
+        for log_data in events:
+            try:
+                self._writer([log_data])
+                written += 1
+            except Exception:
+                self.app.logger.exception(
+                    "Could not write audit event {}".format(log_data["action"]),
+                    extra={
+                        "audit_event": {
+                            key: str(value) for key, value in log_data.items()
+                        },
+                        "tags": ["audit_event", "audit_write_failed"],
+                    },
+                )
+
+        return written
+
+    def _write(self, events):
+        if self.app.config.get("USE_AUDIT_LOG", False):
+            with db.engine.begin() as connection:
+                connection.execute(AuditEvent.__table__.insert().values(events))
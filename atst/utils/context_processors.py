@@ -5,6 +5,7 @@ from atst.database import db
 from atst.domain.authz import Authorization
 from atst.domain.exceptions import NotFoundError
 from atst.domain.portfolios.scopes import ScopedPortfolio
+from atst.utils.load_profiles import current_load_profile
 from atst.models import (
     Application,
     Environment,
@@ -16,7 +17,23 @@ from atst.models import (
 )
 
 
-def get_resources_from_context(view_args):
+RESOURCE_NAMES = {
+    Portfolio: "portfolio",
+    Application: "application",
+    TaskOrder: "task_order",
+}
+
+
+def _load_options(query, profile):
+    options = []
+    for entity in query.column_descriptions:
+        model = entity["entity"]
+        options += profile.options_for(model, RESOURCE_NAMES[model])
+
+    return query.options(*options)
+
+
+def get_resources_from_context(view_args, profile=None):
     query = None
 
     if "portfolio_token" in view_args:
@@ -58,6 +75,9 @@ def get_resources_from_context(view_args):
         )
 
     if query:
+        if profile:
+            query = _load_options(query, profile)
+
         try:
             return query.only_return_tuples(True).one()
         except NoResultFound:
@@ -69,7 +89,7 @@ def assign_resources(view_args):
     g.application = None
     g.task_order = None
 
-    resources = get_resources_from_context(view_args)
+    resources = get_resources_from_context(view_args, current_load_profile())
     if resources:
         for resource in resources:
             if isinstance(resource, Portfolio):
@@ -0,0 +1,128 @@
+import time
+
+
+DEFAULT_KEY_PREFIX = "provisioning"
+
+RATE_LIMIT_WINDOW = 60
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+class ProvisioningDispatcher(object):
+    """
+    Enqueues provisioning tasks for the resources a dispatch query finds.
+
+    A resource is skipped while a task for it is already in flight: the
+    dispatcher records each resource it enqueues in Redis until the task
+    finishes, or until in_flight_seconds pass in case the task is lost.
+    Tasks are published in chunks that share a broker connection, and no
+    more than rate_limit tasks a minute are enqueued for the configured CSP,
+    across every dispatcher that shares the Redis instance. A rate_limit of
+    0 means no limit.
+    """
+
+    def __init__(
+        self,
+        redis,
+        csp_name,
+        chunk_size=100,
+        rate_limit=0,
+        in_flight_seconds=1800,
+        key_prefix=DEFAULT_KEY_PREFIX,
+    ):
+        self.redis = redis
+        self.csp_name = csp_name
+        self.chunk_size = chunk_size
+        self.rate_limit = rate_limit
+        self.in_flight_seconds = in_flight_seconds
+        self.key_prefix = key_prefix
+
+    def dispatch(self, task, kwarg_name, resource_ids, rate_limited=True):
+        """
+        Enqueues task once for each resource that does not already have a
+        task in flight, passing the resource's ID as kwarg_name. Returns the
+        IDs that were enqueued. Tasks that do not call the CSP themselves
+        can be dispatched with rate_limited=False.
+        """
+        candidates = self._not_in_flight(task.name, resource_ids)
+        if rate_limited:
+            granted, rate_key = self.take_budget(len(candidates))
+            candidates = candidates[:granted]
+        dispatched = self._mark_in_flight(task.name, candidates)
+        if rate_limited:
+            self.return_budget(rate_key, len(candidates) - len(dispatched))
+
+        for chunk in _chunks(dispatched, self.chunk_size):
+            with task.app.producer_or_acquire() as producer:
+                for resource_id in chunk:
+                    task.apply_async(
+                        kwargs={kwarg_name: resource_id}, producer=producer
+                    )
+
+        return dispatched
+
+    def release(self, task_name, resource_id):
+        self.redis.delete(self._in_flight_key(task_name, resource_id))
+
+    def is_in_flight(self, task_name, resource_id):
+        return bool(self.redis.exists(self._in_flight_key(task_name, resource_id)))
+
+    def _not_in_flight(self, task_name, resource_ids):
+        resource_ids = list(resource_ids)
+        pipeline = self.redis.pipeline(transaction=False)
+        for resource_id in resource_ids:
+            pipeline.exists(self._in_flight_key(task_name, resource_id))
+        return [
+            resource_id
+            for resource_id, exists in zip(resource_ids, pipeline.execute())
+            if not exists
+        ]
+
+    def _mark_in_flight(self, task_name, resource_ids):
+        # SET NX settles races between dispatchers that read the same rows
+        pipeline = self.redis.pipeline(transaction=False)
+        for resource_id in resource_ids:
+            pipeline.set(
+                self._in_flight_key(task_name, resource_id),
+                1,
+                nx=True,
+                ex=self.in_flight_seconds,
+            )
+        return [
+            resource_id
+            for resource_id, was_set in zip(resource_ids, pipeline.execute())
+            if was_set
+        ]
+
+    def take_budget(self, wanted):
+        """
+        Reserves up to `wanted` tasks from the CSP's budget for the current
+        minute. Returns how many were granted and the key of the minute they
+        were taken from, which unused budget is returned to.
+        """
+        key = self._rate_key()
+        if not self.rate_limit or not wanted:
+            return wanted, key
+
+        pipeline = self.redis.pipeline()
+        pipeline.incrby(key, wanted)
+        pipeline.expire(key, RATE_LIMIT_WINDOW * 2)
+        used, _ = pipeline.execute()
+
+        granted = max(0, min(wanted, self.rate_limit - (used - wanted)))
+        self.return_budget(key, wanted - granted)
+        return granted, key
+
+    def return_budget(self, rate_key, unused):
+        if self.rate_limit and unused > 0:
+            self.redis.decrby(rate_key, unused)
+
+    def _rate_key(self):
+        window = int(time.time() // RATE_LIMIT_WINDOW)
+        return "{}:rate:{}:{}".format(self.key_prefix, self.csp_name, window)
+
+    def _in_flight_key(self, task_name, resource_id):
+        return "{}:inflight:{}:{}".format(self.key_prefix, task_name, resource_id)
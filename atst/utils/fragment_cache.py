@@ -0,0 +1,243 @@
+import hashlib
+
+from flask import current_app, g, has_app_context, has_request_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from atst.domain.authz import PermissionResolver
+from atst.models.application import Application
+from atst.models.application_invitation import ApplicationInvitation
+from atst.models.application_role import ApplicationRole
+from atst.models.clin import CLIN
+from atst.models.environment import Environment
+from atst.models.environment_role import EnvironmentRole
+from atst.models.portfolio import Portfolio
+from atst.models.portfolio_invitation import PortfolioInvitation
+from atst.models.portfolio_role import PortfolioRole
+from atst.models.task_order import TaskOrder
+from atst.models.user import User
+
+
+DEFAULT_KEY_PREFIX = "fragments"
+
+PORTFOLIO_SCOPE = "portfolio"
+APPLICATION_SCOPE = "application"
+
+
+def scopes_for(resource):
+    """
+    Returns the (scope, id) pairs of the portfolio and application that
+    `resource` belongs to.
+    """
+    if isinstance(resource, CLIN):
+        resource = resource.task_order
+
+    scopes = []
+    portfolio_id = getattr(resource, "portfolio_id", None)
+    if portfolio_id is not None:
+        scopes.append((PORTFOLIO_SCOPE, portfolio_id))
+    application_id = getattr(resource, "application_id", None)
+    if application_id is not None:
+        scopes.append((APPLICATION_SCOPE, application_id))
+
+    return scopes
+
+
+def version_of(part):
+    """
+    Models stand for their type, ID and the time they were last updated.
+    Anything else stands for itself.
+    """
+    time_updated = getattr(part, "time_updated", None)
+    if time_updated is not None:
+        return "{}:{}:{}".format(type(part).__name__, part.id, time_updated.isoformat())
+
+    return repr(part)
+
+
+def permission_fingerprint(user, scopes):
+    """
+    Returns the permissions `user` has within `scopes`, so that users with
+    the same permissions share cached fragments and a user whose
+    permissions change stops seeing the fragments they used to. Outside of
+    the current user's request, fragments are not shared between users.
+    """
+    resolver = PermissionResolver.for_user(user)
+    if resolver is None:
+        return "anonymous" if user is None else "user:{}".format(user.id)
+
+    masks = [resolver.atat_mask]
+    for scope, resource_id in scopes:
+        if scope == PORTFOLIO_SCOPE:
+            masks.append(resolver.portfolio_masks.get(resource_id, 0))
+            # which of a portfolio's applications a user sees depends on
+            # their application roles
+            masks.extend(sorted(resolver.application_masks.items(), key=str))
+        else:
+            masks.append(resolver.application_masks.get(resource_id, 0))
+
+    return ":".join(str(mask) for mask in masks)
+
+
+class FragmentCache(object):
+    """
+    Caches rendered template fragments in Redis.
+
+    A fragment's key is made from the versions of the models it is cached
+    for, the user's permissions within their portfolios and applications,
+    and a version number for each of those portfolios and applications.
+    Changes to anything in a portfolio or application bump its version once
+    the transaction commits, which expires every fragment cached for it.
+    """
+
+    def __init__(self, redis, default_ttl=300, key_prefix=DEFAULT_KEY_PREFIX):
+        self.redis = redis
+        self.default_ttl = default_ttl
+        self.key_prefix = key_prefix
+
+    def key(self, parts, fingerprint=""):
+        scopes = sorted(
+            {scope for part in parts for scope in scopes_for(part)}, key=str
+        )
+        versions = self.redis.mget(*self._version_keys(scopes)) if scopes else []
+
+        digest = hashlib.sha1(fingerprint.encode())
+        for part in parts:
+            digest.update(version_of(part).encode())
+        for scope, version in zip(scopes, versions):
+            digest.update(
+                "{}:{}:{}".format(*scope, (version or b"0").decode()).encode()
+            )
+
+        return "{}:{}".format(self.key_prefix, digest.hexdigest())
+
+    def get(self, key):
+        cached = self.redis.get(key)
+        return cached.decode() if cached is not None else None
+
+    def set(self, key, fragment, ttl=None):
+        self.redis.setex(name=key, value=fragment, time=ttl or self.default_ttl)
+
+    def invalidate(self, scopes):
+        if scopes:
+            pipeline = self.redis.pipeline(transaction=False)
+            for version_key in self._version_keys(scopes):
+                pipeline.incr(version_key)
+            pipeline.execute()
+
+    def _version_keys(self, scopes):
+        return [
+            "{}:version:{}:{}".format(self.key_prefix, scope, resource_id)
+            for scope, resource_id in scopes
+        ]
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a block that caches what it renders in the app's fragment cache:
+
+        {% cache ("application_members", application), 600 %}
+          ...
+        {% endcache %}
+
+    The key is a value or a tuple of values, and models in it are replaced
+    by their versions. The TTL is optional. The block renders normally when
+    the app has no fragment cache.
+    """
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cache", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache(self, key, ttl, caller):
+        cache = getattr(current_app, "fragment_cache", None)
+        if cache is None:
+            return caller()
+
+        parts = list(key) if isinstance(key, (list, tuple)) else [key]
+        scopes = [scope for part in parts for scope in scopes_for(part)]
+        user = g.get("current_user") if has_request_context() else None
+        cache_key = cache.key(parts, permission_fingerprint(user, scopes))
+
+        fragment = cache.get(cache_key)
+        if fragment is None:
+            fragment = str(caller())
+            cache.set(cache_key, fragment, ttl)
+
+        return Markup(fragment)
+
+
+# Changes are collected on the session while it flushes and applied once the
+# transaction commits, so that a concurrent request cannot cache a fragment
+# of the old rows under the new versions.
+_SESSION_KEY = "fragment_cache_invalidations"
+
+USER_DISPLAY_ATTRIBUTES = ["first_name", "last_name", "email"]
+
+
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return set()
+    return session.info.setdefault(_SESSION_KEY, set())
+
+
+def _resource_changed(mapper, connection, target):
+    _pending(target).update(scopes_for(target))
+
+
+def _user_changed(mapper, connection, target):
+    # members are listed by name in every portfolio they belong to
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in USER_DISPLAY_ATTRIBUTES):
+        pending = _pending(target)
+        for role in target.portfolio_roles:
+            pending.update(scopes_for(role))
+        for role in target.application_roles:
+            pending.update(scopes_for(role))
+
+
+for _model in [
+    Application,
+    ApplicationInvitation,
+    ApplicationRole,
+    CLIN,
+    Environment,
+    EnvironmentRole,
+    Portfolio,
+    PortfolioInvitation,
+    PortfolioRole,
+    TaskOrder,
+]:
+    for _event in ["after_insert", "after_update", "after_delete"]:
+        event.listen(_model, _event, _resource_changed)
+
+event.listen(User, "after_update", _user_changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    scopes = session.info.pop(_SESSION_KEY, None)
+    if scopes and has_app_context():
+        cache = getattr(current_app, "fragment_cache", None)
+        if cache is not None:
+            cache.invalidate(scopes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,64 @@
+from flask import current_app, request, has_request_context
+from sqlalchemy.orm import Load
+
+
+class LoadProfile(object):
+    """
+    Describes the object graph an endpoint walks, as dotted relationship
+    paths from each resource that assign_resources loads, e.g.
+    "environments.roles.application_role.user" from an Application.
+
+    Collections are loaded with one SELECT ... IN query per level and
+    many-to-one relationships are joined into the parent's query, so the
+    number of round-trips is bounded by the depth of the paths rather than
+    by the number of rows.
+    """
+
+    def __init__(self, query_budget=None, **paths):
+        self.query_budget = query_budget
+        self.paths = paths
+
+    def options_for(self, model, resource_name):
+        return [
+            _loader_option(model, path.split("."))
+            for path in self.paths.get(resource_name, [])
+        ]
+
+
+def _loader_option(model, names):
+    option = Load(model)
+    for name in names:
+        attribute = getattr(model, name)
+        relationship = attribute.property
+        if relationship.uselist:
+            option = option.selectinload(attribute)
+        else:
+            option = option.joinedload(attribute)
+        model = relationship.mapper.class_
+
+    return option
+
+
+def load_profile(query_budget=None, **paths):
+    """
+    Declares the object graph a view needs so that assign_resources can load
+    it up front. Keyword arguments are lists of dotted paths, keyed by the
+    resource they start from: portfolio, application or task_order.
+
+        @load_profile(application=["environments.roles"], query_budget=12)
+    """
+    profile = LoadProfile(query_budget=query_budget, **paths)
+
+    def decorator(f):
+        f.load_profile = profile
+        return f
+
+    return decorator
+
+
+def current_load_profile():
+    if not has_request_context() or request.endpoint is None:
+        return None
+
+    view = current_app.view_functions.get(request.endpoint)
+    return getattr(view, "load_profile", None)
@@ -1,7 +1,14 @@
+import marshal
+import os
+from string import Formatter
+
 import yaml
 from functools import lru_cache
 from flask import current_app as app
-from atst.utils import getattr_path
+
+
+# bump when the layout of the compiled table changes
+TABLE_FORMAT_VERSION = 1
 
 
 class LocalizationInvalidKeyError(Exception):
@@ -15,42 +22,91 @@ class LocalizationInvalidKeyError(Exception):
         )
 
 
-@lru_cache(maxsize=None)
-def _translations_file():
+def _translations_file_name():
     file_name = "translations.yaml"
 
     if app:
         file_name = app.config.get("DEFAULT_TRANSLATIONS_FILE", file_name)
 
-    f = open(file_name)
+    return file_name
 
-    return yaml.safe_load(f)
 
+def _has_fields(text):
+    try:
+        return any(field is not None for (_, field, _, _) in Formatter().parse(text))
+    except ValueError:
+        # leave malformed strings to fail when they are translated
+        return True
 
-def all_keys():
-    translations = _translations_file()
-    keys = []
 
-    def _recursive_key_lookup(chain):
-        results = getattr_path(translations, chain)
-        if isinstance(results, str):
-            keys.append(chain)
-        else:
-            [_recursive_key_lookup(".".join([chain, result])) for result in results]
+def compile_translations(translations, prefix=""):
+    """
+    Flattens nested translations into a table keyed by the full dotted key.
+    Each entry is (text, has_fields): newlines are already removed from the
+    text, and text without replacement fields is already formatted.
+    """
+    table = {}
+    for name, value in translations.items():
+        key = "{}{}".format(prefix, name)
+        if isinstance(value, dict):
+            table.update(compile_translations(value, key + "."))
+        elif isinstance(value, str):
+            text = value.replace("\n", "")
+            if _has_fields(text):
+                table[key] = (text, True)
+            else:
+                table[key] = (text.format(), False)
 
-    [_recursive_key_lookup(key) for key in translations]
+    return table
 
-    return keys
+
+@lru_cache(maxsize=None)
+def translations_table():
+    """
+    Returns the compiled translations table. The table is saved with marshal
+    next to the translations file and reused for as long as the file's size
+    and modification time match, so that most processes never parse YAML.
+    """
+    file_name = _translations_file_name()
+    stat = os.stat(file_name)
+    fingerprint = (TABLE_FORMAT_VERSION, stat.st_mtime_ns, stat.st_size)
+    compiled_file_name = os.path.splitext(file_name)[0] + ".marshal"
+
+    try:
+        with open(compiled_file_name, "rb") as f:
+            compiled_fingerprint, table = marshal.load(f)
+        if compiled_fingerprint == fingerprint:
+            return table
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(file_name) as f:
+        table = compile_translations(yaml.safe_load(f))
+
+    try:
+        partial_file_name = "{}.{}".format(compiled_file_name, os.getpid())
+        with open(partial_file_name, "wb") as f:
+            marshal.dump((fingerprint, table), f)
+        os.replace(partial_file_name, compiled_file_name)
+    except OSError:
+        # a read-only deployment compiles the table in every process
+        pass
+
+    return table
+
+
+def all_keys():
+    return list(translations_table())
 
 
 def translate(key, variables=None):
-    translations = _translations_file()
-    value = getattr_path(translations, key)
+    entry = translations_table().get(key)
 
     if variables is None:
         variables = {}
 
-    if value is None:
+    if entry is None:
         raise LocalizationInvalidKeyError(key, variables)
 
-    return value.format(**variables).replace("\n", "")
+    text, has_fields = entry
+    return text.format(**variables) if has_fields else text
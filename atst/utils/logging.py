@@ -33,6 +33,7 @@ class JsonFormatter(logging.Formatter):
         ("severity", lambda r: r.levelname),
         ("tags", lambda r: r.__dict__.get("tags")),
         ("audit_event", lambda r: r.__dict__.get("audit_event")),
+        ("query_stats", lambda r: r.__dict__.get("query_stats")),
     ]
 
     def __init__(self, *args, source="atst", **kwargs):
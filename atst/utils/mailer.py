@@ -1,29 +1,71 @@
-from contextlib import contextmanager
+import os
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
 
+from flask import current_app as app
+
 
 class MailConnection(object):
     def send(self, message):
         raise NotImplementedError()
 
+    def send_many(self, messages):
+        for message in messages:
+            self.send(message)
+
     @property
     def messages(self):
         raise NotImplementedError()
 
 
+class _Session(object):
+    def __init__(self, host):
+        self.host = host
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
 class SMTPConnection(MailConnection):
-    def __init__(self, server, port, username, password, use_tls=False):
+    """
+    Sends mail over SMTP sessions that are kept open and reused, so that a
+    burst of messages does not pay for a TCP and TLS handshake and a login
+    each. Up to pool_size idle sessions are kept. Sockets cannot be shared
+    between processes, so each Celery worker process keeps its own pool.
+
+    A session that has been idle for health_check_interval seconds is checked
+    with NOOP before it is reused, and a session is replaced after
+    max_messages_per_session messages. A message that fails because the
+    server closed the session is retried once on a new session. A message
+    the server rejects is logged and skipped by send_many, so that it does
+    not stop the rest of the batch.
+    """
+
+    def __init__(
+        self,
+        server,
+        port,
+        username,
+        password,
+        use_tls=False,
+        pool_size=2,
+        max_messages_per_session=100,
+        health_check_interval=30,
+    ):
         self.server = server
         self.port = port
         self.username = username
         self.password = password
         self.use_tls = use_tls
-
-    @contextmanager
-    def _connected_host(self):
-        host = None
-
+        self.pool_size = pool_size
+        self.max_messages_per_session = max_messages_per_session
+        self.health_check_interval = health_check_interval
+        self._pool = []
+        self._pool_pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _connect(self):
         if self.use_tls:
             host = smtplib.SMTP(self.server, self.port)
             host.starttls()
@@ -32,17 +74,101 @@ class SMTPConnection(MailConnection):
 
         host.login(self.username, self.password)
 
-        yield host
+        return _Session(host)
+
+    def _close(self, session):
+        try:
+            session.host.quit()
+        except (smtplib.SMTPException, OSError):
+            session.host.close()
+
+    def _is_alive(self, session):
+        try:
+            status, _ = session.host.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return status == 250
 
-        host.quit()
+    def _checkout(self):
+        while True:
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    # sessions opened before a fork belong to the parent
+                    self._pool = []
+                    self._pool_pid = os.getpid()
+                if not self._pool:
+                    break
+                session = self._pool.pop()
+
+            idle = time.monotonic() - session.last_used
+            if idle < self.health_check_interval or self._is_alive(session):
+                return session
+
+            self._close(session)
+
+        return self._connect()
+
+    def _checkin(self, session):
+        session.last_used = time.monotonic()
+        with self._lock:
+            if self._pool_pid == os.getpid() and len(self._pool) < self.pool_size:
+                self._pool.append(session)
+                return
+
+        self._close(session)
+
+    def close(self):
+        with self._lock:
+            sessions, self._pool = self._pool, []
+
+        for session in sessions:
+            self._close(session)
 
     @property
     def messages(self):
         return []
 
     def send(self, message):
-        with self._connected_host() as host:
-            host.send_message(message)
+        self._send([message], skip_rejected=False)
+
+    def send_many(self, messages):
+        self._send(messages, skip_rejected=True)
+
+    def _send(self, messages, skip_rejected):
+        session = self._checkout()
+        try:
+            for message in messages:
+                if session.sent >= self.max_messages_per_session:
+                    self._close(session)
+                    session = self._connect()
+
+                try:
+                    try:
+                        session.host.send_message(message)
+                    except smtplib.SMTPServerDisconnected:
+                        # the server may close sessions that it considers idle
+                        self._close(session)
+                        session = self._connect()
+                        session.host.send_message(message)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError) as err:
+                    # the session is still usable after the server rejects
+                    # a single message
+                    if not skip_rejected:
+                        raise
+                    app.logger.warning(
+                        "Could not send email to {}: {}".format(message["To"], err)
+                    )
+                    continue
+
+                session.sent += 1
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError):
+            self._checkin(session)
+            raise
+        except Exception:
+            self._close(session)
+            raise
+
+        self._checkin(session)
 
 
 class RedisConnection(MailConnection):
@@ -80,6 +206,17 @@ class Mailer(object):
         message = self._build_message(recipients, subject, body)
         self.connection.send(message)
 
+    def send_many(self, emails):
+        """
+        Sends several emails over one connection. `emails` is a list of
+        (recipients, subject, body).
+        """
+        messages = [
+            self._build_message(recipients, subject, body)
+            for (recipients, subject, body) in emails
+        ]
+        self.connection.send_many(messages)
+
     @property
     def messages(self):
         return self.connection.messages
@@ -1,17 +1,121 @@
+import json
+
+import pendulum
+from flask import current_app as app
+from redis.exceptions import LockError, ResponseError
 from sqlalchemy import select
 
-from atst.jobs import send_notification_mail
+from atst.jobs import send_notification_mail, send_notification_digest
 from atst.database import db
 from atst.models.notification_recipient import NotificationRecipient
 
 
 class NotificationSender(object):
+    """
+    Emails notifications to every NotificationRecipient.
+
+    With a digest_window, notifications are buffered in Redis instead and
+    sent as one digest per recipient once the window has passed, so a burst
+    of notifications becomes a single email.
+    """
+
     EMAIL_SUBJECT = "ATST notification"
+    DIGEST_TEMPLATE = "emails/notification_digest.txt"
+    # how long one worker may take to send a digest before another can
+    DIGEST_LOCK_TIMEOUT = 10 * 60
+
+    def __init__(self, redis=None, digest_window=0, key_prefix="notifications"):
+        self.redis = redis
+        self.digest_window = digest_window
+        self.key_prefix = key_prefix
 
     def send(self, body, type_=None):
-        recipients = self._get_recipients(type_)
-        send_notification_mail.delay(recipients, self.EMAIL_SUBJECT, body)
+        if not self.digest_window:
+            recipients = self._get_recipients(type_)
+            send_notification_mail.delay(recipients, self.EMAIL_SUBJECT, body)
+            return
+
+        event = {"body": body, "type": type_, "time": pendulum.now("UTC").isoformat()}
+        self.redis.rpush(self._events_key, json.dumps(event))
+        self._schedule_digest()
+
+    def send_digest(self):
+        """
+        Sends everything buffered so far as one digest email per recipient
+        and returns the number of notifications it contained. The events are
+        kept in Redis until the emails are sent, and the events of a digest
+        that failed are sent before any newer ones. Only one worker sends a
+        digest at a time; the others schedule another digest and return 0.
+        """
+        lock = self.redis.lock(self._lock_key, timeout=self.DIGEST_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            self._schedule_digest()
+            return 0
+
+        try:
+            return self._send_digest()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                app.logger.warning(
+                    "Notification digest lock expired before the digest was sent"
+                )
+
+    def _send_digest(self):
+        # clear the flag first, so that a notification buffered after the
+        # events are taken schedules another digest
+        self.redis.delete(self._scheduled_key)
+        try:
+            # leaves the events buffered if a failed digest is still waiting
+            # to be sent
+            self.redis.renamenx(self._events_key, self._sending_key)
+        except ResponseError:
+            # nothing new is buffered
+            pass
 
-    def _get_recipients(self, type_):
+        raw_events = self.redis.lrange(self._sending_key, 0, -1)
+        if not raw_events:
+            return 0
+
+        events = [json.loads(raw_event) for raw_event in raw_events]
+        recipients = self._get_recipients()
+        app.logger.info(
+            "Sending a digest of {} notifications to these recipients: {}".format(
+                len(events), recipients
+            )
+        )
+        # rendered without the request context processors, which Celery
+        # workers cannot run
+        body = app.jinja_env.get_template(self.DIGEST_TEMPLATE).render(events=events)
+        app.mailer.send_many(
+            [([recipient], self.EMAIL_SUBJECT, body) for recipient in recipients]
+        )
+        self.redis.delete(self._sending_key)
+        return len(events)
+
+    def _schedule_digest(self):
+        # only the first call in a window schedules the digest; the flag
+        # expires in case that task is lost
+        if self.redis.set(self._scheduled_key, 1, nx=True, ex=self.digest_window * 2):
+            send_notification_digest.apply_async(countdown=self.digest_window)
+
+    def _get_recipients(self, type_=None):
         query = select([NotificationRecipient.email])
-        return db.session.execute(query).fetchone()
+        return [email for (email,) in db.session.execute(query)]
+
+    @property
+    def _events_key(self):
+        return "{}:events".format(self.key_prefix)
+
+    @property
+    def _sending_key(self):
+        return "{}:sending".format(self.key_prefix)
+
+    @property
+    def _scheduled_key(self):
+        return "{}:scheduled".format(self.key_prefix)
+
+    @property
+    def _lock_key(self):
+        return "{}:lock".format(self.key_prefix)
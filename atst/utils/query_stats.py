@@ -0,0 +1,167 @@
+import re
+import time
+
+from flask import current_app, g, request, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+from atst.utils.load_profiles import current_load_profile
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement):
+    """
+    Normalizes a SQL statement so that statements that differ only in their
+    literal values, bound parameters or the length of their IN lists share a
+    fingerprint.
+    """
+    statement = _STRING_LITERAL.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _NUMBER_LITERAL.sub("?", statement)
+    statement = _VALUE_LIST.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class QueryStats(object):
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.rows = 0
+        self.lazy_loads = 0
+
+    def record_query(self, duration, rows):
+        self.queries += 1
+        self.duration += duration
+        self.rows += rows
+
+    def to_dictionary(self):
+        return {
+            "queries": self.queries,
+            "duration_ms": round(self.duration * 1000, 2),
+            "rows": self.rows,
+            "lazy_loads": self.lazy_loads,
+        }
+
+
+def current_query_stats():
+    if has_request_context():
+        return g.get("query_stats")
+
+
+class QueryInstrumentation(object):
+    """
+    Collects per-request SQL statistics: the number of statements, the time
+    spent in the database, the rows returned and the number of lazy loads
+    that loaded objects not already in the session. Statements slower than
+    slow_query_threshold milliseconds are logged with their fingerprint. A
+    threshold of 0 disables slow statement logging.
+    """
+
+    def __init__(self, logger, slow_query_threshold=0):
+        self.logger = logger
+        self.slow_query_threshold = slow_query_threshold / 1000
+
+    def init_app(self, app):
+        app.query_instrumentation = self
+        for target, name, listener in [
+            (Engine, "before_cursor_execute", _before_cursor_execute),
+            (Engine, "after_cursor_execute", _after_cursor_execute),
+            (Mapper, "load", _count_lazy_load),
+        ]:
+            if not event.contains(target, name, listener):
+                event.listen(target, name, listener)
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def record_query(self, statement, duration, rows):
+        stats = current_query_stats()
+        if stats is not None:
+            stats.record_query(duration, rows)
+
+        if self.slow_query_threshold and duration >= self.slow_query_threshold:
+            self.logger.warning(
+                "Slow SQL statement",
+                extra={
+                    "tags": ["slow_query"],
+                    "query_stats": {
+                        "fingerprint": fingerprint(statement),
+                        "duration_ms": round(duration * 1000, 2),
+                        "rows": rows,
+                    },
+                },
+            )
+
+    def _start_request(self):
+        g.query_stats = QueryStats()
+
+    def _finish_request(self, response):
+        stats = current_query_stats()
+        if stats is None:
+            return response
+
+        summary = stats.to_dictionary()
+        summary["endpoint"] = request.endpoint
+        response.headers["X-Query-Count"] = str(stats.queries)
+
+        profile = current_load_profile()
+        budget = profile.query_budget if profile else None
+        if budget is not None and stats.queries > budget:
+            summary["query_budget"] = budget
+            self.logger.warning(
+                "%s issued %s SQL statements, over its budget of %s",
+                request.endpoint,
+                stats.queries,
+                budget,
+                extra={"tags": ["query_budget"], "query_stats": summary},
+            )
+        else:
+            self.logger.info(
+                "%s issued %s SQL statements",
+                request.endpoint,
+                stats.queries,
+                extra={"query_stats": summary},
+            )
+
+        return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start_time = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start_time", None)
+    if start is None or not has_app_context():
+        return
+
+    instrumentation = getattr(current_app, "query_instrumentation", None)
+    if instrumentation is not None:
+        duration = time.perf_counter() - start
+        rows = max(cursor.rowcount, 0) if cursor.description is not None else 0
+        instrumentation.record_query(statement, duration, rows)
+
+
+_LAZY_LOAD_COUNTED = "query_stats_lazy_load_counted"
+
+
+def _count_lazy_load(target, context):
+    # Query.lazy_loaded_from is set while a query runs for a lazy load. The
+    # load event fires for every new object the query loads, so the query is
+    # marked to count it only once.
+    if context is None or context.query.lazy_loaded_from is None:
+        return
+    if context.attributes.get(_LAZY_LOAD_COUNTED):
+        return
+
+    stats = current_query_stats()
+    if stats is not None:
+        context.attributes[_LAZY_LOAD_COUNTED] = True
+        stats.lazy_loads += 1
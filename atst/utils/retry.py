@@ -0,0 +1,102 @@
+import random
+
+
+DEFAULT_KEY_PREFIX = "provisioning"
+
+
+class RetryPolicy(object):
+    """
+    How a task retries after an exception: up to max_retries times, waiting
+    a random time between 0 and base_delay * 2 ** attempt seconds, capped at
+    max_delay. The jitter spreads out the retries of tasks that failed
+    together, so they do not all hit the CSP again at the same moment.
+    Exceptions that say the CSP itself is unhealthy should trip_breaker.
+    """
+
+    def __init__(self, max_retries, base_delay=0, max_delay=0, trips_breaker=False):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.trips_breaker = trips_breaker
+
+    def countdown(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+def policy_for(policies, exc):
+    """
+    Returns the policy for the most specific class of `exc` that `policies`
+    has an entry for.
+    """
+    for cls in type(exc).__mro__:
+        if cls in policies:
+            return policies[cls]
+
+    raise KeyError("No retry policy for {}".format(type(exc).__name__))
+
+
+class CircuitBreaker(object):
+    """
+    Stops calls to a CSP endpoint for reset_seconds once failure_threshold
+    failures have been recorded for it within failure_window seconds. State
+    is kept in Redis so that every worker sees the same circuit.
+
+    When the circuit closes again, the next failure reopens it straight away,
+    while a success resets the count.
+    """
+
+    def __init__(
+        self,
+        redis,
+        csp_name,
+        failure_threshold=5,
+        failure_window=60,
+        reset_seconds=120,
+        key_prefix=DEFAULT_KEY_PREFIX,
+    ):
+        self.redis = redis
+        self.csp_name = csp_name
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.reset_seconds = reset_seconds
+        self.key_prefix = key_prefix
+
+    def retry_after(self, endpoint):
+        """
+        Returns the number of seconds until the circuit for `endpoint`
+        closes, or 0 if it is closed.
+        """
+        return max(0, self.redis.ttl(self._open_key(endpoint)))
+
+    def is_open(self, endpoint):
+        return self.retry_after(endpoint) > 0
+
+    def record_failure(self, endpoint):
+        failures_key = self._failures_key(endpoint)
+        pipeline = self.redis.pipeline()
+        pipeline.incr(failures_key)
+        pipeline.expire(failures_key, self.failure_window)
+        failures, _ = pipeline.execute()
+
+        if failures >= self.failure_threshold:
+            pipeline = self.redis.pipeline()
+            pipeline.set(self._open_key(endpoint), 1, ex=self.reset_seconds)
+            # one failure short of the threshold, for long enough that the
+            # first call after the circuit closes decides whether it reopens
+            pipeline.set(
+                failures_key,
+                self.failure_threshold - 1,
+                ex=self.reset_seconds + self.failure_window,
+            )
+            pipeline.execute()
+
+    def record_success(self, endpoint):
+        self.redis.delete(self._failures_key(endpoint))
+
+    def _open_key(self, endpoint):
+        return "{}:breaker:{}:{}:open".format(self.key_prefix, self.csp_name, endpoint)
+
+    def _failures_key(self, endpoint):
+        return "{}:breaker:{}:{}:failures".format(
+            self.key_prefix, self.csp_name, endpoint
+        )
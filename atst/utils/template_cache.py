@@ -0,0 +1,94 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import jinja2
+from jinja2 import ChoiceLoader, ModuleLoader, TemplateError
+
+
+TEMPLATE_EXTENSIONS = (".html", ".txt")
+
+
+def is_template(name):
+    return name.endswith(TEMPLATE_EXTENSIONS)
+
+
+def templates_digest(env, names):
+    digest = hashlib.sha1(jinja2.__version__.encode())
+    for name in names:
+        source, _filename, _uptodate = env.loader.get_source(env, name)
+        digest.update(name.encode())
+        digest.update(source.encode())
+
+    return digest.hexdigest()
+
+
+def compile_templates(env, cache_dir, names):
+    """
+    Compiles `names` into Python modules in a directory under `cache_dir`
+    named for the templates' contents, unless that directory already exists,
+    and returns the directory. Templates that fail to compile are left out,
+    to be compiled from source when they are used.
+    """
+    target = os.path.join(cache_dir, templates_digest(env, names))
+    if os.path.isdir(target):
+        return target
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # compile into a scratch directory and rename it, so that a process that
+    # starts at the same time never loads a partly written directory
+    staging = tempfile.mkdtemp(dir=cache_dir)
+    env.compile_templates(staging, zip=None, filter_func=lambda name: name in names)
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # another process finished first
+        shutil.rmtree(staging)
+
+    return target
+
+
+def make_template_cache(app):
+    """
+    Loads every template when the app starts instead of on first use. With
+    TEMPLATE_CACHE_DIR, templates are compiled once into that directory and
+    later processes load the compiled modules. With TEMPLATE_WARMUP, every
+    template is loaded into the Jinja cache before the web server or Celery
+    forks its workers, so the workers share it.
+
+    Neither applies in DEBUG, where templates are reloaded when they change.
+    """
+    cache_dir = app.config.get("TEMPLATE_CACHE_DIR")
+    warmup = app.config.get("TEMPLATE_WARMUP")
+    if app.config.get("DEBUG") or not (cache_dir or warmup):
+        return
+
+    start = time.monotonic()
+    env = app.jinja_env
+    source_loader = env.loader
+    names = [name for name in source_loader.list_templates() if is_template(name)]
+
+    if cache_dir:
+        compiled_dir = compile_templates(env, cache_dir, set(names))
+        env.loader = ChoiceLoader([ModuleLoader(compiled_dir), source_loader])
+
+    loaded = 0
+    if warmup:
+        for name in names:
+            try:
+                env.get_template(name)
+                loaded += 1
+            except TemplateError:
+                app.logger.exception("Could not load template {}".format(name))
+
+    app.logger.info(
+        "Loaded {} of {} templates in {:.3f}s{}".format(
+            loaded,
+            len(names),
+            time.monotonic() - start,
+            " from {}".format(compiled_dir) if cache_dir else "",
+        ),
+        extra={"tags": ["templates"]},
+    )
@@ -0,0 +1,63 @@
+# Add root application dir to the python path
+import os
+import sys
+
+parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(parent_dir)
+
+import argparse
+from uuid import UUID
+
+import pendulum
+
+from atst.app import make_config, make_app
+from atst.domain.audit_log import AuditLog, EXPORT_FORMATS
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Export audit events as CSV or JSON Lines, oldest first."
+    )
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--portfolio-id", type=UUID)
+    parser.add_argument("--application-id", type=UUID)
+    parser.add_argument("--resource-type")
+    parser.add_argument(
+        "--since", type=pendulum.parse, help="include events at or after this time"
+    )
+    parser.add_argument(
+        "--until", type=pendulum.parse, help="include events before this time"
+    )
+    parser.add_argument(
+        "--output", help="file to write the export to; defaults to stdout"
+    )
+    return parser.parse_args(argv)
+
+
+def export_audit_log(args, output):
+    filters = {
+        name: getattr(args, name)
+        for name in [
+            "portfolio_id",
+            "application_id",
+            "resource_type",
+            "since",
+            "until",
+        ]
+        if getattr(args, name) is not None
+    }
+    for line in AuditLog.export_events(args.format, **filters):
+        output.write(line)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    config = make_config({"DISABLE_CRL_CHECK": True, "DEBUG": False})
+    app = make_app(config)
+
+    with app.app_context():
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                export_audit_log(args, output)
+        else:
+            export_audit_log(args, sys.stdout)
@@ -3,6 +3,8 @@ import pytest
 import re
 import os
 import shutil
+import time
+from datetime import datetime
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.serialization import Encoding
 from OpenSSL import crypto
@@ -109,6 +111,47 @@ def test_can_dynamically_update_crls(
         assert cache.crl_check(client_pem)
 
 
+def test_crl_check_reuses_cached_store(
+    app, ca_key, ca_file, crl_file, rsa_key, make_x509, make_crl, monkeypatch,
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = CRLCache(ca_file, crl_dir, crl_list=crl_list)
+
+    loaded = []
+    original_load_crl = cache._load_crl
+
+    def _load_crl(location):
+        loaded.append(location)
+        return original_load_crl(location)
+
+    monkeypatch.setattr(cache, "_load_crl", _load_crl)
+
+    assert cache.crl_check(client_pem)
+    assert cache.crl_check(client_pem)
+    assert len(loaded) == 1
+
+
+def test_crl_store_cache_expires_at_next_update(
+    app, ca_key, ca_file, crl_file, rsa_key, make_x509, make_crl
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = CRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(client_pem)
+
+    issuer_der = client_cert.issuer.public_bytes(default_backend())
+    signature, _next_update, store = cache._store_cache[issuer_der]
+    cache._store_cache[issuer_der] = (signature, datetime(2000, 1, 1), store)
+
+    assert cache.crl_check(client_pem)
+    assert cache._store_cache[issuer_der][2] is not store
+
+
 def test_throws_error_for_missing_issuer(app):
     cache = CRLCache(
         "ssl/server-certs/ca-chain.pem", app.config["CRL_STORAGE_CONTAINER"]
@@ -186,3 +229,114 @@ def test_load_crl_locations_cache(crl_file):
     serialize_crl_locations_cache(dir_)
     cache = load_crl_locations_cache(dir_)
     assert isinstance(cache, dict)
+
+
+def test_reload_rebuilds_warm_stores(
+    app,
+    ca_key,
+    ca_file,
+    crl_file,
+    rsa_key,
+    make_x509,
+    make_crl,
+    serialize_pki_object_to_disk,
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = CRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(client_pem)
+    assert cache.reload_count == 0
+    assert cache.last_reload is None
+
+    revoked_crl = make_crl(ca_key, expired_serials=[client_cert.serial_number])
+    serialize_pki_object_to_disk(revoked_crl, crl_file, encoding=Encoding.DER)
+    issuer_der = client_cert.issuer.public_bytes(default_backend())
+    old_store = cache._store_cache[issuer_der][2]
+
+    cache.reload()
+
+    assert cache.reload_count == 1
+    assert cache.last_reload is not None
+    assert cache._store_cache[issuer_der][2] is not old_store
+    with pytest.raises(CRLRevocationException):
+        cache.crl_check(client_pem)
+
+
+def test_reload_rebuilds_stores_without_holding_the_store_lock(
+    app, ca_key, ca_file, crl_file, rsa_key, make_x509, monkeypatch
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = CRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(client_cert.public_bytes(Encoding.PEM))
+
+    build_store = cache._build_store
+    locked = []
+    # stands in for a store a request thread builds while the reload runs
+    concurrent_store = (None, None, object())
+
+    def _build_store(*args, **kwargs):
+        locked.append(cache._store_lock.locked())
+        cache._store_cache[b"another issuer"] = concurrent_store
+        return build_store(*args, **kwargs)
+
+    monkeypatch.setattr(cache, "_build_store", _build_store)
+    # a store that has expired is rebuilt on reload
+    monkeypatch.setattr(cache, "_is_current", lambda cached, signature: False)
+    cache.reload()
+
+    assert locked == [False]
+    assert cache._store_cache[b"another issuer"] is concurrent_store
+
+
+def test_reload_picks_up_new_crl_locations(
+    app, ca_key, ca_file, crl_file, rsa_key, make_x509
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    cache = CRLCache(ca_file, crl_dir, crl_list=[])
+    with pytest.raises(CRLInvalidException):
+        cache.crl_check(client_pem)
+
+    serialize_crl_locations_cache(
+        crl_dir, crl_list=make_crl_list(client_cert, crl_file)
+    )
+    cache.reload()
+
+    assert cache.crl_check(client_pem)
+
+
+def test_watcher_reloads_updated_crls(
+    app,
+    ca_key,
+    ca_file,
+    crl_file,
+    rsa_key,
+    make_x509,
+    make_crl,
+    serialize_pki_object_to_disk,
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = CRLCache(ca_file, crl_dir, crl_list=crl_list, reload_interval=0.01)
+    try:
+        assert cache.crl_check(client_pem)
+
+        revoked_crl = make_crl(ca_key, expired_serials=[client_cert.serial_number])
+        serialize_pki_object_to_disk(revoked_crl, crl_file, encoding=Encoding.DER)
+
+        for _ in range(200):
+            if cache.reload_count:
+                break
+            time.sleep(0.01)
+
+        assert cache.reload_status["reload_count"] >= 1
+        assert cache.reload_status["last_reload"] is not None
+    finally:
+        cache.stop_watching()
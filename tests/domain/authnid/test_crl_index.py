@@ -0,0 +1,174 @@
+import os
+import pytest
+from datetime import datetime
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from atst.domain.authnid.crl import (
+    IndexedCRLCache,
+    CRLRevocationException,
+    CRLInvalidException,
+)
+from atst.domain.authnid.crl.index import (
+    CRLIndex,
+    CRLIndexError,
+    compile_crl_index,
+    crl_index_path,
+)
+
+from tests.utils import make_crl_list
+
+
+def test_compile_crl_index(ca_key, crl_file, make_crl, serialize_pki_object_to_disk):
+    serials = [5, 2 ** 100, 12345]
+    crl = make_crl(ca_key, expired_serials=serials)
+    serialize_pki_object_to_disk(crl, crl_file, encoding=Encoding.DER)
+
+    index_location = compile_crl_index(str(crl_file), ca_key.public_key())
+    index = CRLIndex(index_location)
+
+    assert index_location == crl_index_path(str(crl_file))
+    assert index.revoked_count == 3
+    assert index.issuer == crl.issuer.public_bytes(Encoding.DER)
+    assert index.next_update == crl.next_update.replace(microsecond=0)
+    assert not index.is_expired()
+    assert index.is_compiled_from(str(crl_file))
+    for serial in serials:
+        assert index.is_revoked(serial)
+    assert not index.is_revoked(6)
+    assert not index.is_revoked(2 ** 200)
+
+
+def test_compile_crl_index_with_no_revocations(ca_key, crl_file):
+    index = CRLIndex(compile_crl_index(str(crl_file), ca_key.public_key()))
+    assert index.revoked_count == 0
+    assert not index.is_revoked(1)
+
+
+def test_compile_crl_index_rejects_bad_signature(crl_file, rsa_key):
+    with pytest.raises(CRLIndexError):
+        compile_crl_index(str(crl_file), rsa_key().public_key())
+
+
+def test_crl_index_rejects_truncated_file(tmpdir):
+    index_file = tmpdir.join("truncated.idx")
+    index_file.write_binary(b"ATCRLIDX")
+    with pytest.raises(CRLIndexError):
+        CRLIndex(str(index_file))
+
+
+def test_expired_crl_index(ca_key, expired_crl_file):
+    index = CRLIndex(compile_crl_index(str(expired_crl_file), ca_key.public_key()))
+    assert index.is_expired()
+    assert not index.is_expired(now=datetime(2000, 1, 1))
+
+
+def test_indexed_crl_validation(
+    app,
+    ca_key,
+    ca_file,
+    crl_file,
+    rsa_key,
+    make_x509,
+    make_crl,
+    serialize_pki_object_to_disk,
+):
+    good_cert = make_x509(rsa_key(), signer_key=ca_key, cn="luke")
+    bad_cert = make_x509(rsa_key(), signer_key=ca_key, cn="darth")
+
+    crl = make_crl(ca_key, expired_serials=[bad_cert.serial_number])
+    serialize_pki_object_to_disk(crl, crl_file, encoding=Encoding.DER)
+    crl_dir = os.path.dirname(crl_file)
+
+    crl_list = make_crl_list(good_cert, crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(good_cert.public_bytes(Encoding.PEM).decode())
+    with pytest.raises(CRLRevocationException):
+        cache.crl_check(bad_cert.public_bytes(Encoding.PEM).decode())
+
+    assert os.path.isfile(crl_index_path(str(crl_file)))
+
+
+def test_indexed_crl_cache_recompiles_updated_crl(
+    app,
+    ca_key,
+    ca_file,
+    crl_file,
+    rsa_key,
+    make_x509,
+    make_crl,
+    serialize_pki_object_to_disk,
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(client_pem)
+
+    revoked_crl = make_crl(ca_key, expired_serials=[client_cert.serial_number])
+    serialize_pki_object_to_disk(revoked_crl, crl_file, encoding=Encoding.DER)
+
+    with pytest.raises(CRLRevocationException):
+        cache.crl_check(client_pem)
+
+
+def test_indexed_crl_cache_rejects_unsigned_certificate(
+    app, ca_key, ca_file, crl_file, rsa_key, make_x509
+):
+    crl_dir = os.path.dirname(crl_file)
+    # same issuer name as the CA, but signed by a different key
+    forged_cert = make_x509(rsa_key(), signer_key=rsa_key(), cn="boba")
+    crl_list = make_crl_list(forged_cert, crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+
+    with pytest.raises(CRLRevocationException):
+        cache.crl_check(forged_cert.public_bytes(Encoding.PEM))
+
+
+def test_indexed_crl_cache_expired_crl(
+    app, ca_file, expired_crl_file, ca_key, make_x509, rsa_key
+):
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_dir = os.path.dirname(expired_crl_file)
+    crl_list = make_crl_list(client_cert, expired_crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+
+    with pytest.raises(CRLInvalidException):
+        cache.crl_check(client_pem)
+
+
+def test_indexed_crl_cache_expired_crl_fails_open(
+    ca_file, expired_crl_file, ca_key, make_x509, rsa_key, crl_failover_open_app
+):
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    client_pem = client_cert.public_bytes(Encoding.PEM)
+    crl_dir = os.path.dirname(expired_crl_file)
+    crl_list = make_crl_list(client_cert, expired_crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+
+    assert cache.crl_check(client_pem)
+
+
+def test_indexed_crl_cache_reload_recompiles_indexes(
+    app,
+    ca_key,
+    ca_file,
+    crl_file,
+    rsa_key,
+    make_x509,
+    make_crl,
+    serialize_pki_object_to_disk,
+):
+    crl_dir = os.path.dirname(crl_file)
+    client_cert = make_x509(rsa_key(), signer_key=ca_key, cn="chewbacca")
+    crl_list = make_crl_list(client_cert, crl_file)
+    cache = IndexedCRLCache(ca_file, crl_dir, crl_list=crl_list)
+    assert cache.crl_check(client_cert.public_bytes(Encoding.PEM))
+
+    revoked_crl = make_crl(ca_key, expired_serials=[client_cert.serial_number])
+    serialize_pki_object_to_disk(revoked_crl, crl_file, encoding=Encoding.DER)
+    cache.reload()
+
+    issuer_der = client_cert.issuer.public_bytes(Encoding.DER)
+    assert cache._indexes[issuer_der].is_revoked(client_cert.serial_number)
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from atst.domain.authnid.crl.util import (
+    JSON_CACHE,
+    SYNC_FAILED,
+    SYNC_NOT_MODIFIED,
+    SYNC_STATE,
+    SYNC_UPDATED,
+    load_crl_locations_cache,
+    sync_crls,
+)
+from tests.utils import FakeLogger
+
+
+LAST_MODIFIED = "Tue, 01 Oct 2019 12:00:00 GMT"
+
+
+class CRLServer(ThreadingHTTPServer):
+    def __init__(self, files):
+        super().__init__(("127.0.0.1", 0), CRLRequestHandler)
+        self.files = files
+        self.requests = []
+
+    def url(self, name):
+        return "http://127.0.0.1:{}/{}".format(self.server_address[1], name)
+
+
+class CRLRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        self.server.requests.append((name, dict(self.headers)))
+        content = self.server.files.get(name)
+        if content is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = '"{}"'.format(len(content))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+@pytest.fixture
+def crl_server():
+    server = CRLServer({"first.crl": b"first" * 1000, "second.crl": b"second"})
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def crl_list_for(server, *names):
+    return [(server.url(name), "{:02x}".format(i)) for i, name in enumerate(names)]
+
+
+def test_sync_crls_downloads_all_crls(crl_server, tmpdir):
+    crl_dir = str(tmpdir)
+    crl_list = crl_list_for(crl_server, "first.crl", "second.crl")
+    logger = FakeLogger()
+
+    results = sync_crls(crl_dir, crl_list=crl_list, max_workers=2, logger=logger)
+
+    assert [r.status for r in results] == [SYNC_UPDATED, SYNC_UPDATED]
+    assert [r.bytes_written for r in results] == [5000, 6]
+    with open(os.path.join(crl_dir, "first.crl"), "rb") as crl:
+        assert crl.read() == b"first" * 1000
+
+    cache = load_crl_locations_cache(crl_dir)
+    assert cache == {
+        b"\x00": os.path.join(crl_dir, "first.crl"),
+        b"\x01": os.path.join(crl_dir, "second.crl"),
+    }
+    assert "5006 bytes" in logger.messages[-1]
+    # no temporary files are left behind
+    assert sorted(os.listdir(crl_dir)) == sorted(
+        ["first.crl", "second.crl", JSON_CACHE, SYNC_STATE]
+    )
+
+
+def test_sync_crls_sends_validators_from_previous_sync(crl_server, tmpdir):
+    crl_dir = str(tmpdir)
+    crl_list = crl_list_for(crl_server, "first.crl")
+    sync_crls(crl_dir, crl_list=crl_list, logger=FakeLogger())
+
+    with open(os.path.join(crl_dir, SYNC_STATE)) as state_file:
+        state = json.load(state_file)
+    assert state[crl_server.url("first.crl")] == {
+        "etag": '"5000"',
+        "last_modified": LAST_MODIFIED,
+    }
+
+    results = sync_crls(crl_dir, crl_list=crl_list, logger=FakeLogger())
+
+    assert results[0].status == SYNC_NOT_MODIFIED
+    _name, headers = crl_server.requests[-1]
+    assert headers["If-None-Match"] == '"5000"'
+    assert headers["If-Modified-Since"] == LAST_MODIFIED
+
+
+def test_sync_crls_keeps_existing_file_on_failure(crl_server, tmpdir):
+    crl_dir = str(tmpdir)
+    crl_list = crl_list_for(crl_server, "first.crl", "missing.crl")
+    tmpdir.join("missing.crl").write_binary(b"previous")
+    logger = FakeLogger()
+
+    results = sync_crls(crl_dir, crl_list=crl_list, logger=logger)
+
+    assert [r.status for r in results] == [SYNC_UPDATED, SYNC_FAILED]
+    assert tmpdir.join("missing.crl").read_binary() == b"previous"
+    assert load_crl_locations_cache(crl_dir)[b"\x01"] == os.path.join(
+        crl_dir, "missing.crl"
+    )
+    assert any("Error downloading" in message for message in logger.messages)
+
+
+def test_sync_crls_omits_crls_that_were_never_synced(crl_server, tmpdir):
+    crl_dir = str(tmpdir)
+    crl_list = crl_list_for(crl_server, "missing.crl")
+
+    sync_crls(crl_dir, crl_list=crl_list, logger=FakeLogger())
+
+    assert load_crl_locations_cache(crl_dir) == {}
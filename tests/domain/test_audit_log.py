@@ -1,11 +1,17 @@
+import csv
+import gzip
+import json
+import pendulum
 import pytest
+from uuid import uuid4
 
 from atst.domain.applications import Applications
-from atst.domain.audit_log import AuditLog
+from atst.domain.audit_log import AuditEventPartitions, AuditLog
 from atst.domain.exceptions import UnauthorizedError
 from atst.domain.permission_sets import PermissionSets
 from atst.domain.portfolios import Portfolios
 from atst.domain.users import Users
+from atst.models.audit_event import AuditEvent
 from atst.models.portfolio_role import Status as PortfolioRoleStatus
 from tests.factories import (
     ApplicationFactory,
@@ -29,14 +35,28 @@ def developer():
     return UserFactory.create()
 
 
+@pytest.mark.audit_log
+def test_log_system_event_inserts_through_the_orm(session):
+    user = UserFactory.create()
+    audit_event = AuditLog.log_system_event(user, action="create")
+
+    assert audit_event.id is not None
+    session.expunge(audit_event)
+    assert session.query(AuditEvent).get(audit_event.id).resource_id == user.id
+
+
 @pytest.mark.audit_log
 def test_paginate_audit_log():
     user = UserFactory.create()
     for _ in range(100):
         AuditLog.log_system_event(user, action="create")
 
-    events = AuditLog.get_all_events(pagination_opts={"per_page": 25, "page": 2})
+    first_page = AuditLog.get_all_events(pagination_opts={"per_page": 25})
+    events = AuditLog.get_all_events(
+        pagination_opts={"per_page": 25, "cursor": first_page.next_cursor}
+    )
     assert len(events) == 25
+    assert not set(e.id for e in first_page) & set(e.id for e in events)
 
 
 @pytest.mark.audit_log
@@ -48,12 +68,71 @@ def test_paginate_ws_audit_log():
             resource=application, action="create", portfolio=portfolio
         )
 
+    first_page = AuditLog.get_portfolio_events(
+        portfolio, pagination_opts={"per_page": 25}
+    )
     events = AuditLog.get_portfolio_events(
-        portfolio, pagination_opts={"per_page": 25, "page": 2}
+        portfolio, pagination_opts={"per_page": 25, "cursor": first_page.next_cursor}
     )
     assert len(events) == 25
 
 
+@pytest.mark.audit_log
+def test_keyset_pagination_walks_the_whole_log():
+    portfolio = PortfolioFactory.create()
+    for _ in range(10):
+        AuditLog.log_system_event(
+            resource=portfolio, action="create", portfolio=portfolio
+        )
+    all_events = AuditLog.get_portfolio_events(portfolio)
+
+    seen = []
+    page = AuditLog.get_portfolio_events(portfolio, pagination_opts={"per_page": 3})
+    assert not page.has_prev
+    while True:
+        seen.extend(page)
+        if not page.has_next:
+            break
+        page = AuditLog.get_portfolio_events(
+            portfolio, pagination_opts={"per_page": 3, "cursor": page.next_cursor}
+        )
+
+    assert [e.id for e in seen] == [e.id for e in all_events]
+
+    previous_page = AuditLog.get_portfolio_events(
+        portfolio, pagination_opts={"per_page": 3, "cursor": page.prev_cursor}
+    )
+    assert [e.id for e in previous_page] == [
+        e.id for e in seen[-len(page) - 3 : -len(page)]
+    ]
+    assert previous_page.has_next
+
+
+@pytest.mark.audit_log
+def test_keyset_pagination_ignores_malformed_cursors():
+    portfolio = PortfolioFactory.create()
+    first_page = AuditLog.get_portfolio_events(
+        portfolio, pagination_opts={"per_page": 5}
+    )
+    events = AuditLog.get_portfolio_events(
+        portfolio, pagination_opts={"per_page": 5, "cursor": "not-a-cursor"}
+    )
+    assert [e.id for e in events] == [e.id for e in first_page]
+
+
+@pytest.mark.audit_log
+def test_keyset_pagination_can_estimate_the_total():
+    portfolio = PortfolioFactory.create()
+    events = AuditLog.get_portfolio_events(
+        portfolio, pagination_opts={"per_page": 5, "count": True}
+    )
+    assert isinstance(events.total, int)
+    assert (
+        AuditLog.get_portfolio_events(portfolio, pagination_opts={"per_page": 5}).total
+        is None
+    )
+
+
 @pytest.mark.audit_log
 def test_portfolio_audit_log_only_includes_current_portfolio_events():
     owner = UserFactory.create()
@@ -133,3 +212,96 @@ def test_get_all_includes_ccpo_user_changes():
     Users.revoke_ccpo_perms(user)
 
     assert len(AuditLog.get_all_events()) == len(initial_audit_log) + 2
+
+
+@pytest.mark.audit_log
+def test_export_events_as_csv():
+    portfolio = PortfolioFactory.create()
+    Portfolios.update(portfolio, {"name": "New Name"})
+
+    lines = list(AuditLog.export_events("csv", portfolio_id=portfolio.id))
+    rows = list(csv.DictReader(lines))
+
+    assert len(rows) == len(AuditLog.get_portfolio_events(portfolio))
+    assert all(row["portfolio_id"] == str(portfolio.id) for row in rows)
+    assert [row["time_created"] for row in rows] == sorted(
+        row["time_created"] for row in rows
+    )
+    assert "update" in [row["action"] for row in rows]
+    # JSON columns are written as JSON text
+    for row in rows:
+        json.loads(row["changed_state"])
+        json.loads(row["event_details"])
+
+
+@pytest.mark.audit_log
+def test_export_events_filters_by_resource_type_and_time():
+    portfolio = PortfolioFactory.create()
+    ApplicationFactory.create(portfolio=portfolio)
+
+    lines = AuditLog.export_events(
+        "jsonl", portfolio_id=portfolio.id, resource_type="application"
+    )
+    events = [json.loads(line) for line in lines]
+    assert events
+    assert all(event["resource_type"] == "application" for event in events)
+
+    future = pendulum.now("UTC").add(days=1)
+    assert not list(
+        AuditLog.export_events("jsonl", portfolio_id=portfolio.id, since=future)
+    )
+
+
+def test_export_events_rejects_unknown_formats():
+    with pytest.raises(ValueError):
+        AuditLog.export_events("xml")
+
+
+def test_create_upcoming_audit_partitions(session):
+    now = pendulum.datetime(2001, 11, 20, tz="UTC")
+    created = AuditEventPartitions.create_upcoming(now, months_ahead=2)
+
+    assert created == [
+        "audit_events_2001_11",
+        "audit_events_2001_12",
+        "audit_events_2002_01",
+    ]
+    assert set(created) <= set(AuditEventPartitions.all())
+    # creating a partition again is a no-op
+    assert AuditEventPartitions.create(now) == "audit_events_2001_11"
+
+
+def test_expired_audit_partitions(session):
+    for month in [1, 2, 3]:
+        AuditEventPartitions.create(pendulum.datetime(2001, month, 1, tz="UTC"))
+
+    now = pendulum.datetime(2001, 4, 15, tz="UTC")
+    expired = AuditEventPartitions.expired(now, retention_months=2)
+
+    assert "audit_events_2001_01" in expired
+    assert "audit_events_2001_02" in expired
+    assert "audit_events_2001_03" not in expired
+
+
+def test_archive_and_drop_audit_partition(session, tmpdir):
+    partition = AuditEventPartitions.create(pendulum.datetime(2001, 1, 1, tz="UTC"))
+    resource_id = uuid4()
+    session.add(
+        AuditEvent(
+            resource_type="portfolio",
+            resource_id=resource_id,
+            action="create",
+            time_created=pendulum.datetime(2001, 1, 10, tz="UTC"),
+        )
+    )
+    session.flush()
+
+    path = AuditEventPartitions.archive(partition, str(tmpdir))
+    AuditEventPartitions.drop(partition)
+
+    with gzip.open(path, "rt") as archive:
+        header, row = archive.read().splitlines()
+    assert "resource_id" in header
+    assert str(resource_id) in row
+    assert partition not in AuditEventPartitions.all()
+    assert not session.query(AuditEvent).filter_by(resource_id=resource_id).count()
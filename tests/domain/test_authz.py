@@ -7,10 +7,15 @@ from tests.factories import (
     PortfolioFactory,
     PortfolioRoleFactory,
 )
-from atst.domain.authz import Authorization, user_can_access
+from atst.domain.authz import (
+    Authorization,
+    user_can_access,
+    invalidate_permission_cache,
+)
 from atst.domain.authz.decorator import user_can_access_decorator
 from atst.domain.permission_sets import PermissionSets
 from atst.domain.exceptions import UnauthorizedError
+from atst.models.application_role import Status as ApplicationRoleStatus
 from atst.models.permissions import Permissions
 from atst.domain.portfolio_roles import PortfolioRoles
 
@@ -241,3 +246,131 @@ def test_user_can_access_decorator_logs_access(
     assert len(mock_logger.messages) == num_msgs + 1
     assert "denied access" in mock_logger.messages[-1]
     assert "GET" in mock_logger.messages[-1]
+
+
+def test_permission_resolver_is_cached_per_request(set_current_user, request_ctx):
+    port_role = PortfolioRoleFactory.create(
+        permission_sets=[PermissionSets.get(PermissionSets.VIEW_PORTFOLIO_REPORTS)]
+    )
+    user = port_role.user
+    set_current_user(user)
+
+    assert Authorization.has_portfolio_permission(
+        user, port_role.portfolio, Permissions.VIEW_PORTFOLIO_REPORTS
+    )
+    resolver = request_ctx.g.permission_resolver
+    assert resolver.user is user
+    assert (
+        resolver.portfolio_masks[port_role.portfolio_id] == port_role.permissions_mask
+    )
+
+    assert not Authorization.has_portfolio_permission(
+        user, port_role.portfolio, Permissions.CREATE_TASK_ORDER
+    )
+    assert request_ctx.g.permission_resolver is resolver
+
+
+def test_permission_resolver_only_caches_current_user(set_current_user, request_ctx):
+    port_role = PortfolioRoleFactory.create()
+    set_current_user(UserFactory.create())
+
+    assert Authorization.has_portfolio_permission(
+        port_role.user, port_role.portfolio, Permissions.VIEW_PORTFOLIO
+    )
+    assert request_ctx.g.get("permission_resolver") is None
+
+
+def test_permission_resolver_application_permissions(set_current_user, request_ctx):
+    app_role = ApplicationRoleFactory.create(
+        permission_sets=[PermissionSets.get(PermissionSets.EDIT_APPLICATION_TEAM)]
+    )
+    set_current_user(app_role.user)
+
+    assert Authorization.has_application_permission(
+        app_role.user, app_role.application, Permissions.EDIT_APPLICATION_MEMBER
+    )
+    assert not Authorization.has_application_permission(
+        app_role.user, app_role.application, Permissions.DELETE_ENVIRONMENT
+    )
+    assert not Authorization.has_portfolio_permission(
+        app_role.user, app_role.application.portfolio, Permissions.VIEW_APPLICATION
+    )
+
+
+def test_invalidate_permission_cache(set_current_user, request_ctx):
+    port_role = PortfolioRoleFactory.create()
+    set_current_user(port_role.user)
+    assert Authorization.has_portfolio_permission(
+        port_role.user, port_role.portfolio, Permissions.VIEW_PORTFOLIO
+    )
+
+    invalidate_permission_cache()
+
+    assert request_ctx.g.get("permission_resolver") is None
+
+
+def test_permission_cache_is_invalidated_when_roles_change(
+    set_current_user, request_ctx
+):
+    port_role = PortfolioRoleFactory.create()
+    set_current_user(port_role.user)
+    assert Authorization.has_portfolio_permission(
+        port_role.user, port_role.portfolio, Permissions.VIEW_PORTFOLIO
+    )
+
+    PortfolioRoles.disable(portfolio_role=port_role)
+
+    assert not Authorization.has_portfolio_permission(
+        port_role.user, port_role.portfolio, Permissions.VIEW_PORTFOLIO
+    )
+
+
+def test_permission_map_for_applications():
+    port_admin = UserFactory.create()
+    app_user = UserFactory.create()
+    portfolio = PortfolioFactory.create(
+        owner=port_admin, applications=[{"name": "Mos Eisley"}, {"name": "Hoth"}]
+    )
+    mos_eisley, hoth = portfolio.applications
+    ApplicationRoleFactory.create(application=mos_eisley, user=app_user)
+    ApplicationRoleFactory.create(
+        application=hoth, user=app_user, status=ApplicationRoleStatus.DISABLED
+    )
+
+    assert Authorization.permission_map(
+        app_user, Permissions.VIEW_APPLICATION, portfolio.applications
+    ) == {mos_eisley.id: True, hoth.id: False}
+    assert Authorization.permission_map(
+        port_admin, Permissions.VIEW_APPLICATION, portfolio.applications
+    ) == {mos_eisley.id: True, hoth.id: True}
+    assert Authorization.filter_permitted(
+        app_user, Permissions.VIEW_APPLICATION, portfolio.applications
+    ) == [mos_eisley]
+
+
+def test_filter_permitted_portfolios():
+    role = PortfolioRoleFactory.create(
+        permission_sets=[PermissionSets.get(PermissionSets.VIEW_PORTFOLIO_REPORTS)]
+    )
+    other_portfolio = PortfolioFactory.create()
+
+    assert Authorization.filter_permitted(
+        role.user,
+        Permissions.VIEW_PORTFOLIO_REPORTS,
+        [role.portfolio, other_portfolio],
+    ) == [role.portfolio]
+    assert Authorization.filter_permitted(
+        UserFactory.create_ccpo(),
+        Permissions.VIEW_PORTFOLIO_REPORTS,
+        [role.portfolio, other_portfolio],
+    ) == [role.portfolio, other_portfolio]
+
+
+def test_permission_map_uses_request_resolver(set_current_user, request_ctx):
+    app_role = ApplicationRoleFactory.create()
+    set_current_user(app_role.user)
+
+    assert Authorization.permission_map(
+        app_role.user, Permissions.VIEW_APPLICATION, [app_role.application]
+    ) == {app_role.application.id: True}
+    assert request_ctx.g.permission_resolver.user is app_role.user
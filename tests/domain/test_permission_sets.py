@@ -1,6 +1,7 @@
 import pytest
 from atst.domain.permission_sets import PermissionSets
 from atst.domain.exceptions import NotFoundError
+from atst.models.permissions import Permissions, permission_bit, permissions_mask
 from atst.utils import first_or_none
 
 
@@ -35,3 +36,41 @@ def test_get_many():
 def test_get_many_nonexistent():
     with pytest.raises(NotFoundError):
         PermissionSets.get_many(["nonexistent", "not real"])
+
+
+def test_get_many_masks():
+    perms_sets = PermissionSets.get_many(
+        [PermissionSets.VIEW_PORTFOLIO_FUNDING, PermissionSets.EDIT_PORTFOLIO_FUNDING]
+    )
+    for perms_set in perms_sets:
+        assert perms_set.mask == permissions_mask(perms_set.permissions)
+        for permission in perms_set.permissions:
+            assert perms_set.mask & permission_bit(permission)
+
+    assert not perms_sets[0].mask & permission_bit(Permissions.VIEW_AUDIT_LOG)
+
+
+def test_mask_is_recompiled_when_permissions_change():
+    perms_set = PermissionSets.get(PermissionSets.VIEW_PORTFOLIO_REPORTS)
+    perms_set.permissions = [Permissions.VIEW_AUDIT_LOG]
+    assert perms_set.mask == permission_bit(Permissions.VIEW_AUDIT_LOG)
+
+
+def test_mask_is_compiled_once_per_permissions(monkeypatch):
+    perms_set = PermissionSets.get(PermissionSets.VIEW_PORTFOLIO_REPORTS)
+    perms_set.permissions = [Permissions.VIEW_PORTFOLIO_REPORTS]
+    compiled = []
+
+    def _permissions_mask(permissions):
+        compiled.append(permissions)
+        return permissions_mask(permissions)
+
+    monkeypatch.setattr(
+        "atst.models.permission_set.permissions_mask", _permissions_mask
+    )
+    assert perms_set.mask == perms_set.mask
+    assert len(compiled) == 1
+
+    perms_set.permissions = [Permissions.VIEW_AUDIT_LOG]
+    assert perms_set.mask == permission_bit(Permissions.VIEW_AUDIT_LOG)
+    assert len(compiled) == 2
@@ -0,0 +1,102 @@
+import pytest
+
+from atst.domain.portfolios import Portfolios
+from atst.domain.portfolios.navigation import (
+    LazyPortfolioList,
+    NavigationPortfolio,
+    PortfolioNavigation,
+)
+from atst.domain.portfolio_roles import PortfolioRoles
+from atst.models.application_role import Status as ApplicationRoleStatus
+from atst.models.portfolio_role import Status as PortfolioRoleStatus
+
+from tests.factories import (
+    ApplicationFactory,
+    ApplicationRoleFactory,
+    PortfolioFactory,
+    PortfolioRoleFactory,
+    UserFactory,
+)
+
+
+@pytest.fixture
+def navigation(app):
+    return PortfolioNavigation(app.redis, key_prefix="testportfolionav")
+
+
+def test_navigation_for_user_matches_for_user():
+    bob = UserFactory.create()
+    portfolio = PortfolioFactory.create(name="B")
+    application = ApplicationFactory.create(portfolio=portfolio)
+    ApplicationRoleFactory.create(
+        application=application, user=bob, status=ApplicationRoleStatus.ACTIVE
+    )
+    other = PortfolioFactory.create(name="A")
+    PortfolioRoleFactory.create(
+        user=bob, portfolio=other, status=PortfolioRoleStatus.ACTIVE
+    )
+    pending = PortfolioFactory.create()
+    PortfolioRoleFactory.create(user=bob, portfolio=pending)
+
+    assert Portfolios.navigation_for_user(bob) == [
+        (other.id, other.name),
+        (portfolio.id, portfolio.name),
+    ]
+    assert [(p.id, p.name) for p in Portfolios.for_user(bob)] == (
+        Portfolios.navigation_for_user(bob)
+    )
+
+
+def test_navigation_for_ccpo_skips_deleted_portfolios():
+    ccpo = UserFactory.create_ccpo()
+    portfolio = PortfolioFactory.create()
+    deleted = PortfolioFactory.create(deleted=True)
+
+    portfolio_ids = [id_ for (id_, _name) in Portfolios.navigation_for_user(ccpo)]
+    assert portfolio.id in portfolio_ids
+    assert deleted.id not in portfolio_ids
+
+
+def test_portfolio_navigation_is_cached(navigation, monkeypatch):
+    role = PortfolioRoleFactory.create(status=PortfolioRoleStatus.ACTIVE)
+    expected = [NavigationPortfolio(str(role.portfolio.id), role.portfolio.name)]
+    assert navigation.for_user(role.user) == expected
+
+    def _no_queries(*args):
+        raise AssertionError("navigation should be read from the cache")
+
+    monkeypatch.setattr(Portfolios, "navigation_for_user", _no_queries)
+    assert navigation.for_user(role.user) == expected
+
+
+def test_portfolio_navigation_is_invalidated_when_roles_change(app):
+    role = PortfolioRoleFactory.create(status=PortfolioRoleStatus.ACTIVE)
+    assert len(app.portfolio_navigation.for_user(role.user)) == 1
+
+    PortfolioRoles.disable(portfolio_role=role)
+
+    assert app.portfolio_navigation.for_user(role.user) == []
+
+
+def test_portfolio_navigation_is_invalidated_when_portfolio_is_renamed(app):
+    role = PortfolioRoleFactory.create(status=PortfolioRoleStatus.ACTIVE)
+    app.portfolio_navigation.for_user(role.user)
+
+    Portfolios.update(role.portfolio, {"name": "Renamed"})
+
+    assert [p.name for p in app.portfolio_navigation.for_user(role.user)] == ["Renamed"]
+
+
+def test_lazy_portfolio_list_loads_on_first_use():
+    calls = []
+
+    def _load():
+        calls.append(True)
+        return ["portfolio"]
+
+    portfolios = LazyPortfolioList(_load)
+    assert calls == []
+
+    assert portfolios
+    assert list(portfolios) == ["portfolio"]
+    assert len(calls) == 1
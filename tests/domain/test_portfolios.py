@@ -132,6 +132,37 @@ def test_scoped_portfolio_returns_all_applications_for_portfolio_owner(
     assert len(scoped_portfolio.applications[0].environments) == 3
 
 
+def test_scoped_portfolio_returns_applications_user_has_a_role_in(portfolio):
+    application = ApplicationFactory.create(portfolio=portfolio)
+    ApplicationFactory.create(portfolio=portfolio)
+    user = UserFactory.create()
+    ApplicationRoleFactory.create(
+        application=application, user=user, status=ApplicationRoleStatus.ACTIVE
+    )
+
+    scoped_portfolio = Portfolios.get(user, portfolio.id)
+
+    assert scoped_portfolio.applications == [application]
+
+
+def test_scoped_portfolio_leaves_out_applications_user_is_invited_to(portfolio):
+    application = ApplicationFactory.create(portfolio=portfolio)
+    invited_application = ApplicationFactory.create(portfolio=portfolio)
+    user = UserFactory.create()
+    ApplicationRoleFactory.create(
+        application=application, user=user, status=ApplicationRoleStatus.ACTIVE
+    )
+    ApplicationRoleFactory.create(
+        application=invited_application,
+        user=user,
+        status=ApplicationRoleStatus.PENDING,
+    )
+
+    scoped_portfolio = Portfolios.get(user, portfolio.id)
+
+    assert scoped_portfolio.applications == [application]
+
+
 def test_for_user_returns_portfolios_for_applications_user_invited_to():
     bob = UserFactory.create()
     portfolio = PortfolioFactory.create()
@@ -0,0 +1,43 @@
+import pendulum
+from uuid import uuid4
+
+from celery.backends.database.models import Task as TaskResult
+
+from atst.domain.task_results import TaskResults
+from atst.models import EnvironmentJobFailure
+
+from tests.factories import EnvironmentFactory
+
+
+def _store_result(session, date_done):
+    task_id = str(uuid4())
+    session.execute(
+        TaskResult.__table__.insert().values(
+            task_id=task_id, status="FAILURE", date_done=date_done
+        )
+    )
+    return task_id
+
+
+def test_prune_keeps_recent_and_referenced_results(session):
+    TaskResult.__table__.create(bind=session.connection(), checkfirst=True)
+    now = pendulum.now("UTC").naive()
+    old = _store_result(session, now.subtract(days=10))
+    recent = _store_result(session, now.subtract(hours=1))
+    failed = _store_result(session, now.subtract(days=10))
+    session.add(
+        EnvironmentJobFailure(
+            environment_id=EnvironmentFactory.create().id, task_id=failed
+        )
+    )
+    session.flush()
+
+    assert TaskResults.prune(now.subtract(days=1)) == 1
+
+    remaining = {
+        task_id
+        for (task_id,) in session.query(TaskResult.task_id).filter(
+            TaskResult.task_id.in_([old, recent, failed])
+        )
+    }
+    assert remaining == {recent, failed}
@@ -184,6 +184,15 @@ class ApplicationFactory(Base):
         return application
 
 
+def environment_provisioning_stage(environment):
+    if environment.cloud_id is None:
+        return Environment.ProvisioningStage.CREATE_ENVIRONMENT
+    elif environment.root_user_info is None:
+        return Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+    else:
+        return Environment.ProvisioningStage.COMPLETED
+
+
 class EnvironmentFactory(Base):
     class Meta:
         model = Environment
@@ -191,6 +200,9 @@ class EnvironmentFactory(Base):
     name = factory.Faker("domain_word")
     application = factory.SubFactory(ApplicationFactory)
     creator = factory.SubFactory(UserFactory)
+    cloud_id = None
+    root_user_info = None
+    provisioning_stage = factory.LazyAttribute(environment_provisioning_stage)
 
     @classmethod
     def _create(cls, model_class, *args, **kwargs):
@@ -1,6 +1,11 @@
+import pytest
+from sqlalchemy import event
+
 from atst.database import db
-from tests.factories import UserFactory
+from tests.factories import ApplicationFactory, UserFactory
+from atst.models.audit_event import AuditEvent
 from atst.models.mixins.auditable import AuditableMixin
+from atst.domain.environments import Environments
 from atst.domain.users import Users
 
 
@@ -51,3 +56,39 @@ def test_logging_audit_event_on_update(mock_logger):
     assert event_log["action"] == "update"
 
     assert "update" in mock_logger.extras[1]["tags"]
+
+
+@pytest.fixture
+def audit_inserts(session):
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO audit_events"):
+            statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", _record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", _record)
+
+
+@pytest.mark.audit_log
+def test_audit_events_are_written_in_one_insert_per_flush(session, audit_inserts):
+    application = ApplicationFactory.create()
+    del audit_inserts[:]
+
+    environments = Environments.create_many(
+        application.portfolio.owner, application, ["dev", "staging", "prod"]
+    )
+    session.commit()
+
+    assert len(audit_inserts) == 1
+    for environment in environments:
+        assert (
+            session.query(AuditEvent)
+            .filter(
+                AuditEvent.resource_id == environment.id, AuditEvent.action == "create",
+            )
+            .count()
+            == 1
+        )
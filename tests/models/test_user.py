@@ -4,6 +4,7 @@ from datetime import datetime
 
 from atst.database import db
 from atst.domain.users import Users
+from atst.models.permissions import Permissions, permission_bit
 from atst.models.user import User
 
 from tests.factories import UserFactory, ApplicationFactory, ApplicationRoleFactory
@@ -48,3 +49,13 @@ def test_does_not_log_user_update_when_updating_last_login(mock_logger):
     db.session.add(user)
     db.session.commit()
     assert "Audit Event update" not in mock_logger.messages
+
+
+def test_has_permission():
+    ccpo = UserFactory.create_ccpo()
+    rando = UserFactory.create()
+
+    assert ccpo.has_permission(Permissions.VIEW_AUDIT_LOG)
+    assert ccpo.permissions_mask & permission_bit(Permissions.VIEW_CCPO_USER)
+    assert not rando.has_permission(Permissions.VIEW_AUDIT_LOG)
+    assert rando.permissions_mask == 0
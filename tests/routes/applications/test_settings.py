@@ -11,7 +11,7 @@ from atst.domain.applications import Applications
 from atst.domain.application_roles import ApplicationRoles
 from atst.domain.environment_roles import EnvironmentRoles
 from atst.domain.invitations import ApplicationInvitations
-from atst.domain.common import Paginator
+from atst.domain.common import KeysetPaginator
 from atst.domain.csp.cloud import GeneralCSPException
 from atst.domain.permission_sets import PermissionSets
 from atst.models.application_role import Status as ApplicationRoleStatus
@@ -158,7 +158,7 @@ def test_edit_application_environments_obj(app, client, user_session):
             "user_name": app_role2.user_name,
             "status": env_role2.status.value,
         } in env_obj["members"]
-        assert isinstance(context["audit_events"], Paginator)
+        assert isinstance(context["audit_events"], KeysetPaginator)
 
 
 def test_get_environments_obj_for_app(app, client, user_session):
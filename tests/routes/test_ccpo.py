@@ -1,9 +1,11 @@
+import json
+import pytest
 from flask import url_for
 
 from atst.domain.users import Users
 from atst.utils.localization import translate
 
-from tests.factories import UserFactory
+from tests.factories import PortfolioFactory, UserFactory
 
 
 def test_ccpo_users(user_session, client):
@@ -62,3 +64,40 @@ def test_remove_access(user_session, client):
 
     response = client.post(url_for("ccpo.remove_access", user_id=user.id))
     assert user not in Users.get_ccpo_users()
+
+
+@pytest.mark.audit_log
+def test_export_activity_history(user_session, client):
+    ccpo = UserFactory.create_ccpo()
+    portfolio = PortfolioFactory.create()
+    PortfolioFactory.create()
+    user_session(ccpo)
+
+    response = client.get(
+        url_for(
+            "ccpo.export_activity_history", format="jsonl", portfolio_id=portfolio.id,
+        )
+    )
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+    events = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert events
+    assert all(event["portfolio_id"] == str(portfolio.id) for event in events)
+
+
+@pytest.mark.audit_log
+def test_export_activity_history_rejects_bad_filters(user_session, client):
+    user_session(UserFactory.create_ccpo())
+
+    response = client.get(url_for("ccpo.export_activity_history", since="not a date"))
+    assert response.status_code == 400
+
+    response = client.get(url_for("ccpo.export_activity_history", format="xml"))
+    assert response.status_code == 400
+
+    response = client.get(
+        url_for("ccpo.export_activity_history", portfolio_id="not a uuid")
+    )
+    assert response.status_code == 400
@@ -1,10 +1,17 @@
 import pendulum
 import pytest
 from uuid import uuid4
-from unittest.mock import Mock
+from unittest.mock import ANY, MagicMock, Mock
 from threading import Thread
-
-from atst.domain.csp.cloud import MockCloudProvider
+from celery.exceptions import Retry
+
+from atst.database import db
+from atst.domain.csp.cloud import (
+    AuthenticationException,
+    ConnectionException,
+    GeneralCSPException,
+    MockCloudProvider,
+)
 from atst.jobs import (
     RecordEnvironmentFailure,
     RecordEnvironmentRoleFailure,
@@ -15,8 +22,16 @@ from atst.jobs import (
     create_environment,
     dispatch_provision_user,
     do_provision_user,
+    do_maintain_audit_partitions,
+    do_work,
+    do_work_batch,
+    drain,
+    create_environment_in_csp,
+    hand_off,
+    ENVIRONMENT_READY_EMAIL,
 )
-from atst.models.utils import claim_for_update
+from atst.domain.audit_log import AuditEventPartitions
+from atst.models.utils import claim_for_update, claim_many
 from atst.domain.exceptions import ClaimFailedException
 from tests.factories import (
     EnvironmentFactory,
@@ -24,7 +39,12 @@ from tests.factories import (
     PortfolioFactory,
     ApplicationRoleFactory,
 )
-from atst.models import EnvironmentRole, ApplicationRoleStatus
+from atst.models import (
+    ApplicationRoleStatus,
+    Environment,
+    EnvironmentJobFailure,
+    EnvironmentRole,
+)
 
 
 @pytest.fixture(autouse=True, scope="function")
@@ -79,6 +99,41 @@ def test_create_environment_job(session, csp):
     session.refresh(environment)
 
     assert environment.cloud_id
+    assert (
+        environment.provisioning_stage
+        == Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+    )
+    assert environment.has_checkpoint(ENVIRONMENT_READY_EMAIL)
+    assert environment.has_checkpoint(
+        Environment.ProvisioningStage.CREATE_ENVIRONMENT.value
+    )
+
+
+def test_create_environment_job_resumes_at_failed_step(app, session, csp, monkeypatch):
+    environment = EnvironmentFactory.create()
+    monkeypatch.setattr(app.mailer, "send", Mock(side_effect=ConnectionError))
+
+    with pytest.raises(ConnectionError):
+        do_create_environment(csp, environment.id)
+    session.refresh(environment)
+
+    # the environment was created, but the stage did not finish
+    assert environment.cloud_id
+    assert (
+        environment.provisioning_stage
+        == Environment.ProvisioningStage.CREATE_ENVIRONMENT
+    )
+
+    monkeypatch.undo()
+    do_create_environment(csp, environment.id)
+    session.refresh(environment)
+
+    # the retry only sent the email
+    assert csp.create_environment.call_count == 1
+    assert (
+        environment.provisioning_stage
+        == Environment.ProvisioningStage.CREATE_ATAT_ADMIN_USER
+    )
 
 
 def test_create_environment_job_is_idempotent(csp, session):
@@ -94,6 +149,36 @@ def test_create_atat_admin_user(csp, session):
     session.refresh(environment)
 
     assert environment.root_user_info
+    assert environment.provisioning_stage == Environment.ProvisioningStage.COMPLETED
+
+
+def test_hand_off_enqueues_next_stage(session, monkeypatch):
+    environment = EnvironmentFactory.create(cloud_id="something")
+    mock = MagicMock()
+    monkeypatch.setattr("atst.jobs.create_atat_admin_user", mock)
+
+    hand_off(environment.id)
+
+    mock.apply_async.assert_called_once_with(
+        kwargs={"environment_id": environment.id}, producer=ANY
+    )
+
+
+def test_hand_off_provisions_users_once_environment_is_completed(session, monkeypatch):
+    environment = EnvironmentFactory.create(cloud_id="something", root_user_info={})
+    environment_role = EnvironmentRoleFactory.create(
+        environment=environment,
+        status=EnvironmentRole.Status.PENDING,
+        application_role=ApplicationRoleFactory(status=ApplicationRoleStatus.ACTIVE),
+    )
+    mock = MagicMock()
+    monkeypatch.setattr("atst.jobs.provision_user", mock)
+
+    hand_off(environment.id)
+
+    mock.apply_async.assert_called_once_with(
+        kwargs={"environment_role_id": environment_role.id}, producer=ANY
+    )
 
 
 def test_dispatch_create_environment(session, monkeypatch):
@@ -117,7 +202,7 @@ def test_dispatch_create_environment(session, monkeypatch):
     session.add(e2)
     session.commit()
 
-    mock = Mock()
+    mock = MagicMock()
     monkeypatch.setattr("atst.jobs.create_environment", mock)
 
     # When dispatch_create_environment is called
@@ -125,7 +210,13 @@ def test_dispatch_create_environment(session, monkeypatch):
 
     # It should cause the create_environment task to be called once with the
     # non-deleted environment
-    mock.delay.assert_called_once_with(environment_id=e1.id)
+    mock.apply_async.assert_called_once_with(
+        kwargs={"environment_id": e1.id}, producer=ANY
+    )
+
+    # and not again while that task is still in flight
+    dispatch_create_environment.run()
+    assert mock.apply_async.call_count == 1
 
 
 def test_dispatch_create_atat_admin_user(session, monkeypatch):
@@ -144,13 +235,15 @@ def test_dispatch_create_atat_admin_user(session, monkeypatch):
             }
         ],
     )
-    mock = Mock()
+    mock = MagicMock()
     monkeypatch.setattr("atst.jobs.create_atat_admin_user", mock)
     environment = portfolio.applications[0].environments[0]
 
     dispatch_create_atat_admin_user.run()
 
-    mock.delay.assert_called_once_with(environment_id=environment.id)
+    mock.apply_async.assert_called_once_with(
+        kwargs={"environment_id": environment.id}, producer=ANY
+    )
 
 
 def test_create_environment_no_dupes(session, celery_app, celery_worker):
@@ -247,6 +340,126 @@ def test_claim_for_update(session):
     assert environment.claimed_until is None
 
 
+def _environments_query(environments):
+    return db.session.query(Environment.id).filter(
+        Environment.id.in_([e.id for e in environments])
+    )
+
+
+def test_claim_many(session):
+    environments = [EnvironmentFactory.create() for _ in range(3)]
+    query = _environments_query(environments)
+
+    with claim_many(Environment, query, 2) as first_batch:
+        assert len(first_batch) == 2
+        assert all(e.claimed_until for e in first_batch)
+
+        # resources that are already claimed are not handed out again
+        with claim_many(Environment, query, 2) as second_batch:
+            assert len(second_batch) == 1
+            assert not set(first_batch) & set(second_batch)
+
+    # the claims are released
+    for environment in environments:
+        session.refresh(environment)
+        assert environment.claimed_until is None
+
+
+def test_do_work_batch_records_failures_and_continues(csp, session):
+    environments = [EnvironmentFactory.create() for _ in range(2)]
+    csp.create_environment.side_effect = [
+        GeneralCSPException("CSP unavailable"),
+        "cloud_id",
+    ]
+
+    def _record_failure(environment, error):
+        session.add(
+            EnvironmentJobFailure(environment_id=environment.id, task_id="task")
+        )
+
+    claimed = do_work_batch(
+        create_environment_in_csp,
+        csp,
+        Environment,
+        _environments_query(environments),
+        10,
+        _record_failure,
+    )
+
+    assert claimed == 2
+    for environment in environments:
+        session.refresh(environment)
+    assert sorted(bool(e.cloud_id) for e in environments) == [False, True]
+    assert sorted(len(e.job_failures) for e in environments) == [0, 1]
+
+
+def test_drain_holds_back_failed_resources(app, csp, task, session, monkeypatch):
+    environments = [EnvironmentFactory.create() for _ in range(2)]
+    monkeypatch.setitem(app.config, "PROVISIONING_BATCH_SIZE", 10)
+    monkeypatch.setattr(app, "csp", Mock(cloud=csp))
+    fn = Mock(side_effect=AuthenticationException("bad credentials"))
+
+    drain(
+        task,
+        fn,
+        Environment,
+        lambda: _environments_query(environments),
+        lambda environment, task_id: EnvironmentJobFailure(
+            environment_id=environment.id, task_id="task"
+        ),
+        endpoint=task.name,
+    )
+
+    # each resource is tried once and stays claimed instead of being retried
+    assert fn.call_count == 2
+    for environment in environments:
+        session.refresh(environment)
+        assert environment.claimed_until is not None
+        assert len(environment.job_failures) == 1
+
+
+@pytest.fixture
+def task():
+    task = MagicMock()
+    task.name = "tests.{}".format(uuid4())
+    task.request.retries = 0
+    task.retry.return_value = Retry()
+    return task
+
+
+def test_do_work_retries_with_backoff(app, csp, task):
+    fn = Mock(side_effect=ConnectionException("timed out"))
+
+    with pytest.raises(Retry):
+        do_work(fn, task, csp, environment_id=uuid4())
+
+    _, kwargs = task.retry.call_args
+    assert 0 <= kwargs["countdown"] <= 10
+    assert kwargs["max_retries"] == 6
+
+
+def test_do_work_does_not_retry_authentication_errors(app, csp, task):
+    fn = Mock(side_effect=AuthenticationException("bad credentials"))
+
+    with pytest.raises(AuthenticationException):
+        do_work(fn, task, csp, environment_id=uuid4())
+
+    task.retry.assert_not_called()
+
+
+def test_do_work_waits_for_open_circuit(app, csp, task):
+    for _ in range(app.circuit_breaker.failure_threshold):
+        app.circuit_breaker.record_failure(task.name)
+    fn = Mock()
+
+    with pytest.raises(Retry):
+        do_work(fn, task, csp, environment_id=uuid4())
+
+    fn.assert_not_called()
+    _, kwargs = task.retry.call_args
+    assert kwargs["countdown"] >= app.circuit_breaker.retry_after(task.name)
+
+
 def test_dispatch_provision_user(csp, session, celery_app, celery_worker, monkeypatch):
     # Given that I have four environment roles:
     #   (A) one of which has a completed status
@@ -274,14 +487,16 @@ def test_dispatch_provision_user(csp, session, celery_app, celery_worker, monkey
         application_role=ApplicationRoleFactory(status=ApplicationRoleStatus.ACTIVE),
     )
 
-    mock = Mock()
+    mock = MagicMock()
     monkeypatch.setattr("atst.jobs.provision_user", mock)
 
     # When I dispatch the user provisioning task
     dispatch_provision_user.run()
 
     # I expect it to dispatch only one call, to EnvironmentRole D
-    mock.delay.assert_called_once_with(environment_role_id=er_d.id)
+    mock.apply_async.assert_called_once_with(
+        kwargs={"environment_role_id": er_d.id}, producer=ANY
+    )
 
 
 def test_do_provision_user(csp, session):
@@ -306,3 +521,30 @@ def test_do_provision_user(csp, session):
     )
     # I expect that the EnvironmentRole now has a csp_user_id
     assert environment_role.csp_user_id
+
+
+def test_maintain_audit_partitions_archives_expired_partitions(
+    app, session, tmpdir, monkeypatch
+):
+    monkeypatch.setitem(app.config, "AUDIT_RETENTION_MONTHS", 2)
+    monkeypatch.setitem(app.config, "AUDIT_ARCHIVE_DIR", str(tmpdir))
+    AuditEventPartitions.create(pendulum.datetime(2001, 1, 1, tz="UTC"))
+
+    do_maintain_audit_partitions(pendulum.datetime(2001, 4, 15, tz="UTC"))
+
+    partitions = AuditEventPartitions.all()
+    assert "audit_events_2001_01" not in partitions
+    assert "audit_events_2001_07" in partitions
+    assert tmpdir.join("audit_events_2001_01.csv.gz").check()
+
+
+def test_maintain_audit_partitions_keeps_partitions_without_archive_dir(
+    app, session, monkeypatch
+):
+    monkeypatch.setitem(app.config, "AUDIT_RETENTION_MONTHS", 2)
+    monkeypatch.setitem(app.config, "AUDIT_ARCHIVE_DIR", None)
+    AuditEventPartitions.create(pendulum.datetime(2001, 1, 1, tz="UTC"))
+
+    do_maintain_audit_partitions(pendulum.datetime(2001, 4, 15, tz="UTC"))
+
+    assert "audit_events_2001_01" in AuditEventPartitions.all()
@@ -0,0 +1,132 @@
+import pendulum
+import pytest
+
+from atst.utils.audit_pipeline import (
+    AUDIT_MODE_BATCHED,
+    AUDIT_MODE_FIRE_AND_FORGET,
+    AuditPipeline,
+)
+
+from tests.factories import UserFactory
+from tests.utils import FakeLogger
+
+
+class FakeWriter:
+    def __init__(self):
+        self.batches = []
+        self.rejected = set()
+
+    def __call__(self, events):
+        if any(log_data["action"] in self.rejected for log_data in events):
+            raise ValueError("rejected")
+        self.batches.append(events)
+
+
+@pytest.fixture
+def make_pipeline(app, monkeypatch):
+    def _make_pipeline(**kwargs):
+        writer = FakeWriter()
+        pipeline = AuditPipeline(app, writer=writer, **kwargs)
+        # drain the queue explicitly instead of from the writer thread
+        monkeypatch.setattr(pipeline, "_ensure_running", lambda: None)
+        return pipeline, writer
+
+    return _make_pipeline
+
+
+def test_pipeline_writes_queued_events_in_batches(make_pipeline):
+    pipeline, writer = make_pipeline(batch_size=2)
+    pipeline.submit([{"action": "create"}, {"action": "update"}])
+    pipeline.submit([{"action": "delete"}])
+    assert pipeline.status["queue_depth"] == 3
+
+    pipeline.flush()
+
+    assert writer.batches == [
+        [{"action": "create"}, {"action": "update"}],
+        [{"action": "delete"}],
+    ]
+    status = pipeline.status
+    assert status["queue_depth"] == 0
+    assert status["written"] == 3
+    assert status["last_flush_size"] == 1
+    assert status["last_flush_latency"] >= 0
+
+
+def test_batched_pipeline_writes_on_caller_when_queue_stays_full(
+    make_pipeline, monkeypatch
+):
+    monkeypatch.setattr("atst.utils.audit_pipeline.PUT_TIMEOUT", 0.01)
+    pipeline, writer = make_pipeline(mode=AUDIT_MODE_BATCHED, max_queue_size=1)
+
+    pipeline.submit([{"action": "create"}, {"action": "update"}])
+
+    assert writer.batches == [[{"action": "update"}]]
+    assert pipeline.status["dropped"] == 0
+
+
+def test_fire_and_forget_pipeline_drops_when_queue_is_full(make_pipeline, monkeypatch):
+    pipeline, writer = make_pipeline(mode=AUDIT_MODE_FIRE_AND_FORGET, max_queue_size=1)
+    logger = FakeLogger()
+    monkeypatch.setattr(pipeline.app, "logger", logger)
+
+    pipeline.submit([{"action": "create"}, {"action": "update"}])
+
+    assert pipeline.status["dropped"] == 1
+    assert "1 events dropped" in logger.messages[-1]
+    pipeline.flush()
+    assert writer.batches == [[{"action": "create"}]]
+
+
+def test_pipeline_writes_the_rest_of_a_batch_that_fails(make_pipeline, monkeypatch):
+    monkeypatch.setattr("atst.utils.audit_pipeline.RETRY_BACKOFF", 0)
+    pipeline, writer = make_pipeline()
+    logger = FakeLogger()
+    monkeypatch.setattr(pipeline.app, "logger", logger)
+    writer.rejected.add("delete")
+
+    pipeline.submit([{"action": "create"}, {"action": "delete"}])
+    pipeline.flush()
+
+    assert writer.batches == [[{"action": "create"}]]
+    status = pipeline.status
+    assert status["written"] == 1
+    assert status["failed"] == 1
+    assert {"action": "delete"} in [
+        extra["audit_event"]
+        for extra in logger.extras
+        if "audit_write_failed" in extra["tags"]
+    ]
+
+
+def test_pipeline_rejects_sync_mode(app):
+    with pytest.raises(ValueError):
+        AuditPipeline(app, mode="sync")
+
+
+def test_committed_audit_events_are_submitted_to_pipeline(
+    app, make_pipeline, monkeypatch, mock_logger
+):
+    pipeline, writer = make_pipeline()
+    monkeypatch.setattr(app, "audit_pipeline", pipeline)
+
+    user = UserFactory.create()
+
+    # nothing is logged on the request thread
+    assert "Audit Event create" not in mock_logger.messages
+    pipeline.flush()
+    (events,) = writer.batches
+    assert [(e["resource_id"], e["action"]) for e in events] == [(user.id, "create")]
+
+
+def test_audit_events_keep_the_time_of_the_change(app, make_pipeline, monkeypatch):
+    pipeline, writer = make_pipeline()
+    monkeypatch.setattr(app, "audit_pipeline", pipeline)
+
+    before = pendulum.now("UTC")
+    user = UserFactory.create()
+    after = pendulum.now("UTC")
+
+    pipeline.flush()
+    (events,) = writer.batches
+    assert before <= events[0]["time_created"] <= after
@@ -0,0 +1,72 @@
+import pytest
+from unittest.mock import MagicMock
+from uuid import uuid4
+
+from atst.utils.dispatcher import ProvisioningDispatcher
+
+
+@pytest.fixture
+def make_dispatcher(app):
+    def _make_dispatcher(**kwargs):
+        key_prefix = "testprovisioning:{}".format(uuid4())
+        return ProvisioningDispatcher(
+            app.redis, csp_name="mock", key_prefix=key_prefix, **kwargs
+        )
+
+    return _make_dispatcher
+
+
+@pytest.fixture
+def task():
+    task = MagicMock()
+    task.name = "atst.jobs.create_environment"
+    return task
+
+
+def test_dispatch_skips_resources_in_flight(make_dispatcher, task):
+    dispatcher = make_dispatcher()
+    ids = [uuid4(), uuid4()]
+
+    assert dispatcher.dispatch(task, "environment_id", ids) == ids
+    assert dispatcher.dispatch(task, "environment_id", ids) == []
+    assert task.apply_async.call_count == 2
+
+    dispatcher.release(task.name, ids[0])
+    assert not dispatcher.is_in_flight(task.name, ids[0])
+    assert dispatcher.dispatch(task, "environment_id", ids) == [ids[0]]
+
+
+def test_dispatch_publishes_in_chunks(make_dispatcher, task):
+    dispatcher = make_dispatcher(chunk_size=2)
+
+    dispatcher.dispatch(task, "environment_id", [uuid4() for _ in range(5)])
+
+    assert task.app.producer_or_acquire.call_count == 3
+    assert task.apply_async.call_count == 5
+
+
+def test_dispatch_respects_rate_limit(make_dispatcher, task, monkeypatch):
+    dispatcher = make_dispatcher(rate_limit=3)
+    # keep both rounds in the same rate limit window
+    rate_key = dispatcher._rate_key()
+    monkeypatch.setattr(dispatcher, "_rate_key", lambda: rate_key)
+    ids = [uuid4() for _ in range(5)]
+
+    assert len(dispatcher.dispatch(task, "environment_id", ids[:2])) == 2
+    assert len(dispatcher.dispatch(task, "environment_id", ids[2:])) == 1
+    assert task.apply_async.call_count == 3
+
+
+def test_unused_budget_is_returned_to_the_minute_it_was_taken_from(
+    make_dispatcher, monkeypatch
+):
+    dispatcher = make_dispatcher(rate_limit=3)
+    granted, rate_key = dispatcher.take_budget(2)
+    assert granted == 2
+
+    next_rate_key = "{}:next".format(rate_key)
+    monkeypatch.setattr(dispatcher, "_rate_key", lambda: next_rate_key)
+    dispatcher.return_budget(rate_key, 2)
+
+    assert int(dispatcher.redis.get(rate_key)) == 0
+    assert dispatcher.redis.get(next_rate_key) is None
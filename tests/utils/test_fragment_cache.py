@@ -0,0 +1,70 @@
+import pytest
+from flask import g
+from uuid import uuid4
+
+from atst.domain.environments import Environments
+from atst.utils.fragment_cache import FragmentCache
+
+from tests.factories import ApplicationFactory, ApplicationRoleFactory, UserFactory
+
+
+TEMPLATE = (
+    '{% cache ("members", application) %}'
+    "{{ renders.append(application.id) or application.name }}"
+    "{% endcache %}"
+)
+
+
+@pytest.fixture
+def fragment_cache(app, monkeypatch):
+    cache = FragmentCache(app.redis, key_prefix="testfragments:{}".format(uuid4()))
+    monkeypatch.setattr(app, "fragment_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def render(app):
+    renders = []
+
+    def _render(user, application):
+        with app.test_request_context():
+            g.current_user = user
+            return app.jinja_env.from_string(TEMPLATE).render(
+                application=application, renders=renders
+            )
+
+    _render.renders = renders
+    return _render
+
+
+def test_fragment_is_shared_by_users_with_the_same_permissions(fragment_cache, render):
+    application = ApplicationFactory.create()
+
+    assert render(UserFactory.create_ccpo(), application) == application.name
+    assert render(UserFactory.create_ccpo(), application) == application.name
+    assert len(render.renders) == 1
+
+    member = ApplicationRoleFactory.create(application=application).user
+    assert render(member, application) == application.name
+    assert len(render.renders) == 2
+
+
+def test_fragment_is_invalidated_when_its_application_changes(fragment_cache, render):
+    application = ApplicationFactory.create()
+    ccpo = UserFactory.create_ccpo()
+    render(ccpo, application)
+
+    Environments.create(ccpo, application, "new environment")
+
+    render(ccpo, application)
+    assert len(render.renders) == 2
+
+
+def test_fragment_is_rendered_without_a_fragment_cache(app, render, monkeypatch):
+    monkeypatch.setattr(app, "fragment_cache", None)
+    application = ApplicationFactory.create()
+    ccpo = UserFactory.create_ccpo()
+
+    render(ccpo, application)
+    render(ccpo, application)
+    assert len(render.renders) == 2
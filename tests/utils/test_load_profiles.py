@@ -0,0 +1,58 @@
+from sqlalchemy import inspect
+
+from atst.domain.authz.decorator import user_can_access_decorator as user_can
+from atst.models import Application, Permissions
+from atst.utils.context_processors import get_resources_from_context
+from atst.utils.load_profiles import LoadProfile, load_profile
+
+from tests.factories import (
+    ApplicationFactory,
+    ApplicationRoleFactory,
+    EnvironmentFactory,
+    EnvironmentRoleFactory,
+    PortfolioFactory,
+)
+
+
+def test_load_profile_builds_an_option_per_path():
+    profile = LoadProfile(
+        application=["environments.roles.application_role.user", "portfolio"]
+    )
+
+    assert len(profile.options_for(Application, "application")) == 2
+    assert profile.options_for(Application, "portfolio") == []
+
+
+def test_load_profile_survives_access_decorator():
+    @user_can(Permissions.VIEW_APPLICATION)
+    @load_profile(application=["environments"], query_budget=5)
+    def _view(*args, **kwargs):
+        pass
+
+    assert _view.load_profile.paths == {"application": ["environments"]}
+    assert _view.load_profile.query_budget == 5
+
+
+def test_get_resources_from_context_applies_load_profile(session):
+    portfolio = PortfolioFactory.create()
+    application = ApplicationFactory.create(portfolio=portfolio)
+    environment = EnvironmentFactory.create(application=application)
+    app_role = ApplicationRoleFactory.create(application=application)
+    EnvironmentRoleFactory.create(environment=environment, application_role=app_role)
+    session.expunge_all()
+
+    profile = LoadProfile(
+        portfolio=["applications"],
+        application=["environments.roles.application_role.user"],
+    )
+    loaded_portfolio, loaded_application = get_resources_from_context(
+        {"application_id": application.id}, profile
+    )
+
+    assert "applications" not in inspect(loaded_portfolio).unloaded
+    assert "environments" not in inspect(loaded_application).unloaded
+    (loaded_environment,) = loaded_application.environments
+    assert "roles" not in inspect(loaded_environment).unloaded
+    (env_role,) = loaded_environment.roles
+    assert "application_role" not in inspect(env_role).unloaded
+    assert "user" not in inspect(env_role.application_role).unloaded
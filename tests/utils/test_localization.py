@@ -1,5 +1,10 @@
 import pytest
-from atst.utils.localization import all_keys, translate, LocalizationInvalidKeyError
+from atst.utils.localization import (
+    all_keys,
+    compile_translations,
+    translate,
+    LocalizationInvalidKeyError,
+)
 
 
 def test_looking_up_existing_key():
@@ -28,3 +33,24 @@ def test_all_keys():
     assert "testing.example_with_variables" in all_keys()
     assert "testing.nested.example" in all_keys()
     assert not "testing.nested.missing" in all_keys()
+
+
+def test_compile_translations():
+    table = compile_translations(
+        {
+            "plain": "Hello\nWorld",
+            "escaped": "{{braces}}",
+            "nested": {"with_variables": "Hello, {name}!"},
+        }
+    )
+
+    assert table == {
+        "plain": ("HelloWorld", False),
+        "escaped": ("{braces}", False),
+        "nested.with_variables": ("Hello, {name}!", True),
+    }
+
+
+def test_looking_up_a_section_is_an_invalid_key():
+    with pytest.raises(LocalizationInvalidKeyError):
+        translate("testing.nested")
@@ -1,5 +1,12 @@
 import pytest
-from atst.utils.mailer import Mailer, Mailer, MailConnection, RedisConnection
+import smtplib
+from atst.utils.mailer import (
+    Mailer,
+    Mailer,
+    MailConnection,
+    RedisConnection,
+    SMTPConnection,
+)
 
 
 class MockConnection(MailConnection):
@@ -46,3 +53,97 @@ def test_redis_mailer_can_save_messages(app):
     assert message_data["recipients"][0] in message
     assert message_data["subject"] in message
     assert message_data["body"] in message
+
+
+class FakeSMTP(object):
+    hosts = []
+
+    def __init__(self, server, port):
+        self.sent = []
+        self.disconnect_next = False
+        self.rejected = set()
+        self.closed = False
+        FakeSMTP.hosts.append(self)
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, message):
+        if message["To"] in self.rejected:
+            raise smtplib.SMTPRecipientsRefused({message["To"]: (550, b"No such user")})
+        if self.disconnect_next:
+            self.disconnect_next = False
+            raise smtplib.SMTPServerDisconnected()
+        self.sent.append(message)
+
+    def noop(self):
+        return (250, b"OK")
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp_mailer(monkeypatch):
+    FakeSMTP.hosts = []
+    monkeypatch.setattr(smtplib, "SMTP_SSL", FakeSMTP)
+    connection = SMTPConnection("localhost", 465, "user", "password", pool_size=1)
+    return Mailer(connection, "test@atat.com")
+
+
+def test_smtp_mailer_reuses_sessions(smtp_mailer):
+    smtp_mailer.send(["ben@tattoine.org"], "help", "you're my only hope")
+    smtp_mailer.send_many(
+        [
+            (["luke@tattoine.org"], "hello", "there"),
+            (["leia@alderaan.org"], "hello", "there"),
+        ]
+    )
+
+    assert len(FakeSMTP.hosts) == 1
+    assert len(FakeSMTP.hosts[0].sent) == 3
+    assert not FakeSMTP.hosts[0].closed
+
+
+def test_smtp_mailer_reconnects_when_disconnected(smtp_mailer):
+    smtp_mailer.send(["ben@tattoine.org"], "help", "you're my only hope")
+    FakeSMTP.hosts[0].disconnect_next = True
+
+    smtp_mailer.send(["luke@tattoine.org"], "hello", "there")
+
+    assert len(FakeSMTP.hosts) == 2
+    assert FakeSMTP.hosts[0].closed
+    assert len(FakeSMTP.hosts[1].sent) == 1
+
+
+def test_smtp_mailer_replaces_sessions_after_max_messages(smtp_mailer):
+    smtp_mailer.connection.max_messages_per_session = 2
+
+    smtp_mailer.send_many([(["ben@tattoine.org"], "help", "hope")] * 3)
+
+    assert [len(host.sent) for host in FakeSMTP.hosts] == [2, 1]
+
+
+def test_smtp_mailer_skips_rejected_messages(app, smtp_mailer):
+    smtp_mailer.send(["ben@tattoine.org"], "help", "you're my only hope")
+    FakeSMTP.hosts[0].rejected.add("jabba@tattoine.org")
+
+    smtp_mailer.send_many(
+        [
+            (["jabba@tattoine.org"], "hello", "there"),
+            (["leia@alderaan.org"], "hello", "there"),
+        ]
+    )
+
+    assert len(FakeSMTP.hosts) == 1
+    assert [m["To"] for m in FakeSMTP.hosts[0].sent] == [
+        "ben@tattoine.org",
+        "leia@alderaan.org",
+    ]
+    assert not FakeSMTP.hosts[0].closed
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        smtp_mailer.send(["jabba@tattoine.org"], "hello", "there")
@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import Mock
+from uuid import uuid4
 
 from tests.factories import NotificationRecipientFactory
 from atst.utils.notification_sender import NotificationSender
@@ -20,5 +21,82 @@ def test_can_send_notification(monkeypatch, notification_sender):
     notification_sender.send(email_body)
 
     job_mock.assert_called_once_with(
-        ("test@example.com",), notification_sender.EMAIL_SUBJECT, email_body
+        ["test@example.com"], notification_sender.EMAIL_SUBJECT, email_body
     )
+
+
+@pytest.fixture
+def digest_sender(app):
+    return NotificationSender(
+        app.redis, digest_window=60, key_prefix="testnotifications:{}".format(uuid4()),
+    )
+
+
+def test_notifications_are_sent_as_one_digest(app, monkeypatch, digest_sender):
+    job_mock = Mock()
+    monkeypatch.setattr("atst.jobs.send_notification_digest.apply_async", job_mock)
+    send_many = Mock()
+    monkeypatch.setattr(app.mailer, "send_many", send_many)
+    NotificationRecipientFactory.create(email="first@example.com")
+    NotificationRecipientFactory.create(email="second@example.com")
+
+    for body in ["first error", "second error", "third error"]:
+        digest_sender.send(body)
+
+    job_mock.assert_called_once_with(countdown=60)
+
+    assert digest_sender.send_digest() == 3
+    (emails,), _ = send_many.call_args
+    assert sorted(recipients for (recipients, _, _) in emails) == [
+        ["first@example.com"],
+        ["second@example.com"],
+    ]
+    (_, subject, body) = emails[0]
+    assert subject == digest_sender.EMAIL_SUBJECT
+    assert all(
+        message in body for message in ["first error", "second error", "third error"]
+    )
+
+    # the buffer is empty and the next notification schedules a new digest
+    assert digest_sender.send_digest() == 0
+    digest_sender.send("fourth error")
+    assert job_mock.call_count == 2
+
+
+def test_digest_events_are_kept_when_sending_fails(app, monkeypatch, digest_sender):
+    monkeypatch.setattr("atst.jobs.send_notification_digest.apply_async", Mock())
+    NotificationRecipientFactory.create(email="first@example.com")
+    digest_sender.send("first error")
+
+    monkeypatch.setattr(app.mailer, "send_many", Mock(side_effect=Exception))
+    with pytest.raises(Exception):
+        digest_sender.send_digest()
+
+    digest_sender.send("second error")
+    send_many = Mock()
+    monkeypatch.setattr(app.mailer, "send_many", send_many)
+
+    # the failed digest is sent again before the newer events
+    assert digest_sender.send_digest() == 1
+    (emails,), _ = send_many.call_args
+    assert "first error" in emails[0][2]
+    assert digest_sender.send_digest() == 1
+
+
+def test_only_one_digest_is_sent_at_a_time(app, monkeypatch, digest_sender):
+    job_mock = Mock()
+    monkeypatch.setattr("atst.jobs.send_notification_digest.apply_async", job_mock)
+    send_many = Mock()
+    monkeypatch.setattr(app.mailer, "send_many", send_many)
+    NotificationRecipientFactory.create(email="first@example.com")
+    digest_sender.send("first error")
+
+    lock = app.redis.lock(digest_sender._lock_key, timeout=60)
+    assert lock.acquire(blocking=False)
+    # another worker is sending, and a digest is already scheduled
+    assert digest_sender.send_digest() == 0
+    assert not send_many.called
+    assert job_mock.call_count == 1
+
+    lock.release()
+    assert digest_sender.send_digest() == 1
@@ -0,0 +1,89 @@
+import pytest
+from flask import g
+
+from atst.app import make_app, make_config
+from atst.database import db
+from atst.models import Application
+from atst.utils.query_stats import (
+    QueryInstrumentation,
+    QueryStats,
+    current_query_stats,
+    fingerprint,
+)
+
+from tests.factories import ApplicationFactory
+from tests.utils import FakeLogger
+
+
+def test_fingerprint_normalizes_literals_and_parameters():
+    assert fingerprint(
+        "SELECT users.id FROM users\n  WHERE users.dod_id = %(dod_id_1)s"
+    ) == fingerprint("SELECT users.id FROM users WHERE users.dod_id = '1234567890'")
+    assert (
+        fingerprint("SELECT * FROM portfolios LIMIT 10 OFFSET 20")
+        == "SELECT * FROM portfolios LIMIT ? OFFSET ?"
+    )
+    assert (
+        fingerprint("SELECT * FROM roles WHERE id IN (%(id_1)s, %(id_2)s)")
+        == "SELECT * FROM roles WHERE id IN (...)"
+    )
+    assert fingerprint("SELECT anon_1.id FROM anon_1") == "SELECT anon_1.id FROM anon_1"
+
+
+def test_slow_statements_are_logged_with_fingerprint():
+    logger = FakeLogger()
+    instrumentation = QueryInstrumentation(logger, slow_query_threshold=100)
+
+    instrumentation.record_query("SELECT 1", 0.05, 1)
+    assert logger.messages == []
+
+    instrumentation.record_query("SELECT * FROM users WHERE id = %(id)s", 0.25, 1)
+    assert logger.messages == ["Slow SQL statement"]
+    assert logger.extras[0]["query_stats"] == {
+        "fingerprint": "SELECT * FROM users WHERE id = ?",
+        "duration_ms": 250.0,
+        "rows": 1,
+    }
+
+
+@pytest.fixture
+def query_stats_app():
+    config = make_config(direct_config={"LOG_QUERY_STATS": "true"})
+    _app = make_app(config)
+
+    ctx = _app.app_context()
+    ctx.push()
+
+    yield _app
+
+    ctx.pop()
+
+
+def test_request_query_stats_are_logged(query_stats_app, user_session, monkeypatch):
+    logger = FakeLogger()
+    monkeypatch.setattr(query_stats_app.query_instrumentation, "logger", logger)
+    user_session()
+
+    response = query_stats_app.test_client().get("/home")
+
+    assert response.status_code == 200
+    stats = logger.extras[-1]["query_stats"]
+    assert stats["endpoint"] == "atst.home"
+    assert stats["queries"] == int(response.headers["X-Query-Count"])
+    assert set(stats) >= {"duration_ms", "rows", "lazy_loads"}
+
+
+def test_lazy_loads_are_counted_once_per_query(query_stats_app):
+    application_id = ApplicationFactory.create(
+        environments=[{"name": "dev"}, {"name": "prod"}]
+    ).id
+    db.session.expunge_all()
+
+    with query_stats_app.test_request_context():
+        g.query_stats = QueryStats()
+        application = db.session.query(Application).get(application_id)
+        assert current_query_stats().lazy_loads == 0
+
+        application.portfolio
+        application.environments
+        assert current_query_stats().lazy_loads == 2
@@ -0,0 +1,71 @@
+import pytest
+from uuid import uuid4
+
+from atst.utils.retry import CircuitBreaker, RetryPolicy, policy_for
+
+
+class ParentError(Exception):
+    pass
+
+
+class ChildError(ParentError):
+    pass
+
+
+def test_policy_for_uses_most_specific_class():
+    parent = RetryPolicy(max_retries=1)
+    child = RetryPolicy(max_retries=2)
+    policies = {ParentError: parent, ChildError: child}
+
+    assert policy_for(policies, ChildError()) is child
+    assert policy_for({ParentError: parent}, ChildError()) is parent
+    with pytest.raises(KeyError):
+        policy_for(policies, ValueError())
+
+
+def test_countdown_is_capped():
+    policy = RetryPolicy(max_retries=10, base_delay=10, max_delay=60)
+
+    assert all(0 <= policy.countdown(0) <= 10 for _ in range(20))
+    assert all(0 <= policy.countdown(8) <= 60 for _ in range(20))
+
+
+@pytest.fixture
+def breaker(app):
+    return CircuitBreaker(
+        app.redis,
+        csp_name="mock",
+        failure_threshold=3,
+        key_prefix="testbreaker:{}".format(uuid4()),
+    )
+
+
+def test_circuit_opens_after_threshold(breaker):
+    breaker.record_failure("create_environment")
+    breaker.record_failure("create_environment")
+    assert not breaker.is_open("create_environment")
+
+    breaker.record_failure("create_environment")
+    assert breaker.is_open("create_environment")
+    assert 0 < breaker.retry_after("create_environment") <= breaker.reset_seconds
+    assert not breaker.is_open("provision_user")
+
+
+def test_success_resets_failures(breaker):
+    breaker.record_failure("create_environment")
+    breaker.record_failure("create_environment")
+    breaker.record_success("create_environment")
+    breaker.record_failure("create_environment")
+
+    assert not breaker.is_open("create_environment")
+
+
+def test_circuit_reopens_on_first_failure_after_closing(breaker):
+    for _ in range(3):
+        breaker.record_failure("create_environment")
+    # the reset timeout passes
+    breaker.redis.delete(breaker._open_key("create_environment"))
+    assert not breaker.is_open("create_environment")
+
+    breaker.record_failure("create_environment")
+    assert breaker.is_open("create_environment")
@@ -0,0 +1,30 @@
+import os
+
+from jinja2 import ChoiceLoader, ModuleLoader
+
+from atst.utils.template_cache import compile_templates, templates_digest
+
+
+def test_compile_templates_compiles_once(app, tmpdir):
+    env = app.jinja_env
+    names = {"emails/base.txt"}
+
+    compiled_dir = compile_templates(env, str(tmpdir), names)
+
+    assert os.path.basename(compiled_dir) == templates_digest(env, names)
+    assert len(os.listdir(compiled_dir)) == 1
+    assert compile_templates(env, str(tmpdir), names) == compiled_dir
+    assert len(os.listdir(str(tmpdir))) == 1
+
+
+def test_compiled_templates_render(app, tmpdir):
+    env = app.jinja_env
+    compiled_dir = compile_templates(env, str(tmpdir), {"emails/base.txt"})
+    compiled_env = env.overlay(
+        loader=ChoiceLoader([ModuleLoader(compiled_dir), env.loader]), cache_size=0
+    )
+
+    assert (
+        compiled_env.get_template("emails/base.txt").render()
+        == env.get_template("emails/base.txt").render()
+    )